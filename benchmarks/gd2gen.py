@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""deterministic generator of synthetic gd2 game directories
+
+Writes the tree ``fetch`` leaves behind: ``year_YYYY/month_MM/day_DD/gid_*/``
+holding the game's ``inning_all.xml`` and the player files of the players
+not fetched for an earlier game, a ``.fetched.json`` marking every day
+complete and ``.players_fetched`` at the top. Teams, rosters and pitch
+repertoires come from ``seed``; every day is generated from ``seed`` and its
+date, so the same arguments always give the same files.
+
+Pitches follow the equations of motion used by ``fillbass.trajectory``:
+the release point, velocity and acceleration of every pitch take it to its
+plate location px, pz at the front of the plate.
+"""
+
+import datetime
+import os
+import random
+import sys
+
+import click
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fillbass.fetchdata import ARCHIVE_SUFFIX, DayRecord, PlayerRegistry, archive_day, day_path  # noqa: E402
+
+TEAMS = ("ana", "ari", "atl", "bal", "bos", "cha", "chn", "cin", "cle", "col", "det", "flo", "hou", "kca", "lan",
+         "mil", "min", "nya", "nyn", "oak", "phi", "pit", "sdn", "sea", "sfn", "sln", "tba", "tex", "tor", "was")
+PITCHERS_PER_TEAM = 13
+BATTERS_PER_TEAM = 13
+STARTERS = 5
+SEASON_START = (4, 1)
+SEASON_END = (9, 30)
+
+# pitch type: start speed (mph), pfx_x, pfx_z (inches), spin rate (rpm) and break length (inches)
+PITCH_TYPES = {
+    "FF": (92.5, -5.0, 9.5, 2200, 4.0),
+    "FT": (91.0, -8.5, 6.0, 2100, 5.5),
+    "FC": (88.0, 1.5, 5.0, 2300, 5.0),
+    "SL": (84.5, 3.0, 1.5, 2350, 7.5),
+    "CU": (77.5, 5.0, -5.5, 2500, 12.0),
+    "CH": (83.5, -7.0, 4.5, 1750, 8.0),
+    "SI": (90.5, -9.0, 4.5, 2050, 6.0),
+}
+REPERTOIRES = (("FF", "SL", "CH"), ("FF", "CU", "CH"), ("FF", "FT", "SL", "CH"), ("FT", "FC", "CU"),
+               ("FF", "SI", "SL"), ("FF", "FC", "CU", "CH"))
+
+PLATE_Y = 17 / 12.0
+RELEASE_Y = 50.0
+GRAVITY = -32.174
+FIRST_NAMES = ("Aaron", "Bartolo", "Carlos", "Dan", "Edwin", "Felix", "Gio", "Hiroki", "Ian", "Josh", "Kyle",
+               "Luis", "Mike", "Nate", "Oliver", "Pedro", "Roy", "Sean", "Tim", "Zack")
+LAST_NAMES = ("Abreu", "Burnett", "Cain", "Dickey", "Escobar", "Fister", "Gallardo", "Hamels", "Iglesias",
+              "Jimenez", "Kershaw", "Lester", "Moyer", "Nolasco", "Oswalt", "Peavy", "Quintana", "Rivera",
+              "Sabathia", "Tomlin", "Uehara", "Verlander", "Wainwright", "Young", "Zito")
+
+GAME_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n<game atBat="{}" deck="{}" hole="{}" ind="F">\n'
+AT_BAT = ('<atbat num="{num}" b="{balls}" s="{strikes}" o="{outs}" start_tfs="{tfs}" start_tfs_zulu="{zulu}" '
+          'batter="{batter}" stand="{stand}" b_height="6-1" pitcher="{pitcher}" p_throws="{throws}" '
+          'des="{des}" event_num="{event}" event="{event_name}">\n')
+PITCH = ('<pitch des="{des}" id="{id}" type="{type}" tfs="{tfs}" tfs_zulu="{zulu}" x="{x:.2f}" y="{y:.2f}" '
+         'event_num="{id}" sv_id="{sv_id}" play_guid="" start_speed="{start_speed:.1f}" '
+         'end_speed="{end_speed:.1f}" sz_top="{sz_top:.2f}" sz_bot="{sz_bot:.2f}" pfx_x="{pfx_x:.2f}" '
+         'pfx_z="{pfx_z:.2f}" px="{px:.3f}" pz="{pz:.3f}" x0="{x0:.3f}" y0="{y0:.3f}" z0="{z0:.3f}" '
+         'vx0="{vx0:.3f}" vy0="{vy0:.3f}" vz0="{vz0:.3f}" ax="{ax:.3f}" ay="{ay:.3f}" az="{az:.3f}" '
+         'break_y="23.8" break_angle="{break_angle:.1f}" break_length="{break_length:.1f}" '
+         'pitch_type="{pitch_type}" type_confidence="{confidence:.3f}" zone="{zone}" nasty="{nasty}" '
+         'spin_dir="{spin_dir:.3f}" spin_rate="{spin_rate:.3f}" cc="" mt=""{runners}/>\n')
+PLAYER = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+          '<Player team="{team}" id="{pid}" pos="{pos}" type="{type}" first_name="{first_name}" '
+          'last_name="{last_name}" jersey_num="{jersey}" height="6-{inches}" weight="{weight}" bats="{bats}" '
+          'throws="{throws}" dob="{dob}">\n'
+          '<season avg=".000" ab="0" hr="0" rbi="0" wins="0" losses="0" era="-"/>\n</Player>\n')
+
+OUTCOMES = (("Ball", "B", 0.36), ("Called Strike", "S", 0.17), ("Swinging Strike", "S", 0.11),
+            ("Foul", "S", 0.18), ("In play, out(s)", "X", 0.12), ("In play, no out", "X", 0.06))
+
+
+class League(object):
+    """teams with rosters of players, each pitcher with a repertoire of pitch types"""
+
+    def __init__(self, seed=0):
+        super(League, self).__init__()
+        rng = random.Random("league-{}".format(seed))
+        self.players = {}
+        self.rosters = {}
+        pid = 400000
+        for team in TEAMS:
+            pitchers = []
+            batters = []
+            for index in range(PITCHERS_PER_TEAM + BATTERS_PER_TEAM):
+                pitcher = index < PITCHERS_PER_TEAM
+                player = {"pid": pid, "team": team, "pos": "P" if pitcher else rng.choice("CSFBLR123"),
+                          "type": "pitcher" if pitcher else "batter",
+                          "first_name": rng.choice(FIRST_NAMES), "last_name": rng.choice(LAST_NAMES),
+                          "jersey": rng.randint(1, 99), "inches": rng.randint(0, 7), "weight": rng.randint(170, 250),
+                          "bats": rng.choice("RRRLLS"), "throws": rng.choice("RRRL"),
+                          "dob": "{:02d}/{:02d}/{}".format(rng.randint(1, 12), rng.randint(1, 28),
+                                                            rng.randint(1970, 1990))}
+                if pitcher:
+                    player["pitches"] = {t: League.pitch_profile(rng, t) for t in rng.choice(REPERTOIRES)}
+                    player["release"] = (rng.uniform(1.0, 2.8) * (-1 if player["throws"] == "R" else 1),
+                                         rng.uniform(5.5, 6.4))
+                    pitchers.append(pid)
+                else:
+                    player["sz"] = (rng.uniform(3.2, 3.7), rng.uniform(1.4, 1.7))
+                    batters.append(pid)
+                self.players[pid] = player
+                pid += 1
+            self.rosters[team] = (pitchers, batters)
+
+    @staticmethod
+    def pitch_profile(rng, pitch_type):
+        speed, pfx_x, pfx_z, spin_rate, break_length = PITCH_TYPES[pitch_type]
+        return (speed + rng.gauss(0, 1.5), pfx_x + rng.gauss(0, 1.5), pfx_z + rng.gauss(0, 1.5),
+                spin_rate + rng.gauss(0, 150), break_length, rng.uniform(0.1, 0.5))
+
+
+def season_days(first_year, seasons):
+    """yields every day of ``seasons`` regular seasons starting with the one of ``first_year``"""
+    for year in range(first_year, first_year + seasons):
+        day = datetime.date(year, *SEASON_START)
+        while day <= datetime.date(year, *SEASON_END):
+            yield day
+            day += datetime.timedelta(days=1)
+
+
+def motion(rng, pitcher, profile, sz):
+    """returns the attributes of one pitch of ``profile`` thrown by ``pitcher`` to a batter with strike zone ``sz``"""
+    speed, pfx_x, pfx_z, spin_rate, break_length, _ = profile
+    hand = -1 if pitcher["throws"] == "R" else 1
+    start_speed = rng.gauss(speed, 0.8)
+    movement_x = rng.gauss(pfx_x, 0.8) * -hand
+    movement_z = rng.gauss(pfx_z, 0.8)
+    px = rng.gauss(0.0, 0.85)
+    pz = rng.gauss((sz[0] + sz[1]) / 2.0, 0.9)
+    x0 = pitcher["release"][0] + rng.gauss(0, 0.1)
+    z0 = pitcher["release"][1] + rng.gauss(0, 0.1)
+
+    vy0 = -start_speed * 5280 / 3600.0
+    ay = 0.3 * start_speed
+    t = (-vy0 - (vy0 ** 2 - 2 * ay * (RELEASE_Y - PLATE_Y)) ** 0.5) / ay
+    ax = 2 * movement_x / 12.0 / t ** 2
+    az = GRAVITY + 2 * movement_z / 12.0 / t ** 2
+    vx0 = (px - x0 - ax * t ** 2 / 2) / t
+    vz0 = (pz - z0 - az * t ** 2 / 2) / t
+    in_zone = abs(px) <= 0.83 and sz[1] <= pz <= sz[0]
+    if in_zone:
+        zone = 1 + min(2, int((px + 0.83) / 0.554)) + 3 * min(2, int((sz[0] - pz) / ((sz[0] - sz[1]) / 3)))
+    else:
+        zone = 11 + (px > 0) + 2 * (pz < (sz[0] + sz[1]) / 2)
+    return {"start_speed": start_speed, "end_speed": start_speed * 0.915, "pfx_x": movement_x, "pfx_z": movement_z,
+            "px": px, "pz": pz, "x0": x0, "y0": RELEASE_Y, "z0": z0, "vx0": vx0, "vy0": vy0, "vz0": vz0,
+            "ax": ax, "ay": ay, "az": az, "sz_top": sz[0], "sz_bot": sz[1],
+            "x": 116.0 - px * 43.0, "y": 230.0 - pz * 43.0,
+            "break_angle": rng.gauss(20.0, 8.0) * -hand, "break_length": rng.gauss(break_length, 1.0),
+            "spin_rate": rng.gauss(spin_rate, 100), "spin_dir": rng.uniform(120, 240),
+            "confidence": rng.uniform(0.7, 1.0), "zone": zone, "nasty": rng.randint(0, 80)}
+
+
+def outcome(rng):
+    value = rng.random()
+    for des, kind, share in OUTCOMES:
+        value -= share
+        if value <= 0:
+            return des, kind
+    return OUTCOMES[0][:2]
+
+
+def game_xml(rng, league, day, away, home):
+    """returns the inning_all.xml of a game between ``away`` and ``home`` and the ids of the pitchers used"""
+    parts = []
+    event = 0
+    at_bat = 0
+    clock = datetime.datetime(day.year, day.month, day.day, 23, 5, 0)
+    used = set()
+    lineups = {team: list(league.rosters[team][1][:9]) for team in (away, home)}
+    for lineup in lineups.values():
+        rng.shuffle(lineup)
+    up = {away: 0, home: 0}
+    starters = {team: league.rosters[team][0][day.toordinal() % STARTERS] for team in (away, home)}
+    bullpens = {team: league.rosters[team][0][STARTERS:] for team in (away, home)}
+    parts.append(GAME_HEADER.format(*lineups[away][:3]))
+    for inning in range(1, 10):
+        parts.append('<inning num="{}" away_team="{}" home_team="{}" next="Y">\n'.format(inning, away, home))
+        for half, batting, fielding in (("top", away, home), ("bottom", home, away)):
+            parts.append("<{}>\n".format(half))
+            pitcher_id = starters[fielding] if inning <= 6 else rng.choice(bullpens[fielding])
+            used.add(pitcher_id)
+            pitcher = league.players[pitcher_id]
+            outs = 0
+            while outs < 3:
+                at_bat += 1
+                event += 1
+                batter_id = lineups[batting][up[batting] % 9]
+                up[batting] += 1
+                batter = league.players[batter_id]
+                start = clock
+                pitches = []
+                balls = strikes = 0
+                des = "Strikeout"
+                while True:
+                    event += 1
+                    clock += datetime.timedelta(seconds=rng.randint(12, 30))
+                    pitch_type = rng.choices(list(pitcher["pitches"]),
+                                             [p[5] for p in pitcher["pitches"].values()])[0]
+                    attributes = motion(rng, pitcher, pitcher["pitches"][pitch_type], batter["sz"])
+                    pitch_des, kind = outcome(rng)
+                    runners = ' on_1b="{}"'.format(lineups[batting][(up[batting] + 7) % 9]) if rng.random() < 0.3 \
+                        else ""
+                    attributes.update(des=pitch_des, id=event, type=kind, pitch_type=pitch_type, runners=runners,
+                                      tfs=clock.strftime("%H%M%S"), zulu=clock.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                                      sv_id=clock.strftime("%y%m%d_%H%M%S"))
+                    pitches.append(PITCH.format(**attributes))
+                    if kind == "X":
+                        des = "Out" if pitch_des.endswith("out(s)") else "Single"
+                        break
+                    if kind == "B":
+                        balls += 1
+                        if balls == 4:
+                            des = "Walk"
+                            break
+                    elif strikes < 2 or pitch_des != "Foul":
+                        strikes += 1
+                        if strikes == 3:
+                            break
+                if des in ("Out", "Strikeout"):
+                    outs += 1
+                parts.append(AT_BAT.format(num=at_bat, balls=balls, strikes=min(strikes, 2), outs=outs,
+                                           tfs=start.strftime("%H%M%S"), zulu=start.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                                           batter=batter_id, stand=batter["bats"].replace("S", "R"),
+                                           pitcher=pitcher_id, throws=pitcher["throws"],
+                                           des="{} {}.".format(batter["last_name"], des.lower()),
+                                           event=event, event_name=des))
+                parts.extend(pitches)
+                parts.append("</atbat>\n")
+            parts.append("</{}>\n".format(half))
+        parts.append("</inning>\n")
+    parts.append("</game>\n")
+    return "".join(parts), used
+
+
+def generate_day(path, league, day, games, players_fetched, seed=0):
+    """writes the games of ``day`` below ``path``, returns the number of pitches and player files written"""
+    rng = random.Random("{}-{}".format(seed, day.isoformat()))
+    local_dir = day_path(path, day)
+    record = DayRecord()
+    teams = list(TEAMS)
+    rng.shuffle(teams)
+    pitch_count = player_count = 0
+    for number in range(min(games, len(teams) // 2)):
+        away, home = teams[2 * number], teams[2 * number + 1]
+        game_id = "gid_{:%Y_%m_%d}_{}mlb_{}mlb_1".format(day, away, home)
+        game_path = os.path.join(local_dir, game_id)
+        os.makedirs(game_path, exist_ok=True)
+        xml, _ = game_xml(rng, league, day, away, home)
+        pitch_count += xml.count("<pitch ")
+        file_name = os.path.join(game_path, "inning_all.xml")
+        with open(file_name, "w") as f:
+            f.write(xml)
+        record.expect(file_name)
+        record.done(file_name)
+        for team in (away, home):
+            for pid in sum(league.rosters[team], []):
+                if pid in players_fetched:
+                    continue
+                file_name = os.path.join(game_path, "{}.xml".format(pid))
+                with open(file_name, "w") as f:
+                    f.write(PLAYER.format(**league.players[pid]))
+                players_fetched.fetched.add(pid)
+                record.expect(file_name)
+                record.done(file_name)
+                player_count += 1
+    record.save(local_dir)
+    return pitch_count, player_count
+
+
+def generate(path, days, games=15, seed=0, archive=False):
+    """writes the games of every day in ``days`` below ``path``, returns the number of days, pitches and players
+
+    Days that are already below ``path`` are kept as they are.
+    """
+    league = League(seed)
+    players_fetched = PlayerRegistry(os.path.join(path, PlayerRegistry.FILE_NAME))
+    totals = [0, 0, 0]
+    for day in days:
+        local_dir = day_path(path, day)
+        if os.path.exists(local_dir + ARCHIVE_SUFFIX) or DayRecord.is_complete(local_dir):
+            continue
+        pitches, players = generate_day(path, league, day, games, players_fetched, seed)
+        if archive:
+            archive_day(local_dir)
+        totals[0] += 1
+        totals[1] += pitches
+        totals[2] += players
+    with open(os.path.join(path, PlayerRegistry.FILE_NAME), "w") as f:
+        f.writelines("%d\n" % player_id for player_id in sorted(players_fetched.fetched))
+    return tuple(totals)
+
+
+@click.command(help="write synthetic gd2 game files to PATH")
+@click.option("-s", "--start-date", default="01/04/2008",
+              help="""first day to generate. Format as 'DD/MM/YYYY'. Defaults to 01/04/2008""")
+@click.option("-d", "--days", metavar="COUNT", type=click.IntRange(min=1), default=1,
+              help="""generate COUNT consecutive days. Defaults to 1.""")
+@click.option("--seasons", metavar="COUNT", type=click.IntRange(min=1), default=None,
+              help="""generate every day from April to September of COUNT seasons starting with the year of
+              the start date instead.""")
+@click.option("-g", "--games", metavar="COUNT", type=click.IntRange(min=1, max=len(TEAMS) // 2), default=15,
+              help="""games per day. Defaults to 15.""")
+@click.option("--seed", type=int, default=0, help="""Defaults to 0.""")
+@click.option("--archive", is_flag=True, help="""pack every day into a 'day_DD.zip' like fetch --archive does.""")
+@click.argument("path", nargs=1, type=click.Path(file_okay=False, writable=True), default="data")
+def main(start_date, days, seasons, games, seed, archive, path):
+    start = datetime.datetime.strptime(start_date, "%d/%m/%Y").date()
+    if seasons is not None:
+        dates = season_days(start.year, seasons)
+    else:
+        dates = (start + datetime.timedelta(days=i) for i in range(days))
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    days, pitches, players = generate(path, dates, games, seed, archive)
+    click.echo("Generated {} days with {} pitches and {} players in {}".format(days, pitches, players, path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""measures how long the command line takes to start and which heavy modules it loads
+
+Every run starts a fresh interpreter that imports the command line and
+invokes it with the arguments of a case. The result is written as JSON;
+the exit status is 1 if any case loaded a module it must not load, so the
+script can guard against imports creeping back to the top of a module.
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ("sqlalchemy", "numpy", "matplotlib", "mpl_toolkits.mplot3d", "bs4", "dateutil.parser",
+                 "requests", "pyarrow", "lxml.etree", "tabulate")
+
+# arguments of the command line and the heavy modules it may load for them
+CASES = (
+    ("import", None, ()),
+    ("help", ["--help"], ()),
+    ("fetch --help", ["fetch", "--help"], ()),
+    ("render --help", ["render", "--help"], ()),
+    ("list", ["-d", "{database}", "list"], ("sqlalchemy", "lxml.etree", "tabulate")),
+)
+
+CHILD = """
+import io, json, sys, time
+start = time.perf_counter()
+from fillbass.scripts import scripts
+imported = time.perf_counter()
+args = json.loads(sys.argv[1])
+if args is not None:
+    stdout, sys.stdout = sys.stdout, io.StringIO()
+    try:
+        scripts.cli(args, obj={}, standalone_mode=False)
+    except SystemExit:
+        pass
+    sys.stdout = stdout
+done = time.perf_counter()
+print(json.dumps({"import": imported - start, "total": done - start,
+                  "loaded": [name for name in json.loads(sys.argv[2]) if name in sys.modules]}))
+"""
+
+
+def environment():
+    env = dict(os.environ, MPLBACKEND="Agg")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, (ROOT, env.get("PYTHONPATH"))))
+    return env
+
+
+def run_case(args, repeat):
+    """runs the command line ``repeat`` times with ``args``, returns the median times and the modules loaded"""
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = subprocess.check_output([sys.executable, "-c", CHILD, json.dumps(args), json.dumps(HEAVY_MODULES)],
+                                         env=environment())
+        result = json.loads(output.decode().splitlines()[-1])
+        result["process"] = time.perf_counter() - start
+        runs.append(result)
+    return {"process_ms": statistics.median(r["process"] for r in runs) * 1000,
+            "import_ms": statistics.median(r["import"] for r in runs) * 1000,
+            "command_ms": statistics.median(r["total"] for r in runs) * 1000,
+            "loaded": runs[0]["loaded"]}
+
+
+def slowest_imports(count):
+    """returns the ``count`` modules with the largest cumulative import time as reported by -X importtime"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import fillbass.scripts.scripts"],
+                            env=environment(), stderr=subprocess.PIPE, check=True)
+    times = []
+    for line in result.stderr.decode().splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times.append((int(cumulative) / 1000.0, name.strip()))
+    return [{"module": name, "cumulative_ms": ms} for ms, name in sorted(times, reverse=True)[:count]]
+
+
+@click.command()
+@click.option("-n", "--repeat", type=click.IntRange(min=1), default=5,
+              help="""start the command line this many times per case and report the median. Defaults to 5.""")
+@click.option("-o", "--output", type=click.File("w"), default="-", help="""write the JSON results to this file.""")
+def main(repeat, output):
+    results = {"python": sys.version.split()[0], "repeat": repeat, "cases": {}}
+    failed = False
+    with tempfile.TemporaryDirectory() as directory:
+        database = os.path.join(directory, "fillbass.db")
+        for name, args, allowed in CASES:
+            if args is not None:
+                args = [arg.format(database=database) for arg in args]
+            result = run_case(args, repeat)
+            result["unexpected"] = [module for module in result["loaded"] if module not in allowed]
+            failed = failed or bool(result["unexpected"])
+            results["cases"][name] = result
+    results["slowest_imports"] = slowest_imports(10)
+    json.dump(results, output, indent=2)
+    output.write("\n")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
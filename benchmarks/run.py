@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""benchmarks of parsing, scanning, the database reads and the trajectory math on synthetic gd2 data
+
+The data is written by ``gd2gen`` unless a directory holding it is given.
+Every stage reports its throughput (pitches/s, rows/s) or the median time
+of a call in ms, and all of it goes to one JSON file, so results of
+different releases can be compared.
+"""
+
+import datetime
+import glob
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+from sqlalchemy.sql import func  # noqa: E402
+
+import gd2gen  # noqa: E402
+from fillbass import entities, trajectory  # noqa: E402
+from fillbass.parsedata import DatabaseManager, Parser  # noqa: E402
+
+PAGE_FIELDS = ("pitch_type", "px", "pz", "start_speed")
+TRAJECTORY_PITCHES = 100000
+
+
+def timed(function, *args, **kwargs):
+    """returns the result of calling ``function`` and the seconds it took"""
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def median_ms(function, repeat):
+    """returns the median and minimum ms of ``repeat`` calls of ``function`` after a warm-up call, and its result"""
+    result = function()
+    times = []
+    for _ in range(repeat):
+        result, seconds = timed(function)
+        times.append(seconds * 1000)
+    return {"ms": statistics.median(times), "min_ms": min(times)}, result
+
+
+def rate(count, seconds, unit):
+    return {"seconds": seconds, unit: count, unit + "_per_s": count / seconds if seconds else None}
+
+
+def version():
+    try:
+        return subprocess.check_output(["git", "describe", "--always", "--dirty"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_parse(engine, games, players, work_dir):
+    """times reading the sampled files alone and ``parse_game``/``parse_player``, which also insert the rows"""
+    parser = Parser(None, engine)
+    pitch_count, seconds = timed(lambda: sum(len(parser.read_game(path)) for path in games))
+    player_count, player_seconds = timed(lambda: sum(len(parser.read_players(path)) for path in players))
+    results = {"read_game": rate(pitch_count, seconds, "pitches"),
+               "read_players": rate(player_count, player_seconds, "players")}
+
+    db = DatabaseManager(os.path.join(work_dir, "parse_{}.db".format(engine)), False)
+    parser = Parser(db, engine)
+
+    def parse(method, paths):
+        for path in paths:
+            method(path)
+        db.commit()
+
+    with db.bulk_load():
+        _, seconds = timed(parse, parser.parse_player, players)
+        results["parse_player"] = rate(player_count, seconds, "players")
+        _, seconds = timed(parse, parser.parse_game, games)
+        results["parse_game"] = rate(pitch_count, seconds, "pitches")
+    db.engine.dispose()
+    return results
+
+
+def bench_scan(data, work_dir, jobs):
+    """times ``find_files`` of the whole tree into an empty database and a rescan
+
+    One job commits every directory, several jobs commit every ``batch_size`` pitches.
+    """
+    db = DatabaseManager(os.path.join(work_dir, "scan_{}.db".format(jobs)), False)
+    parser = Parser(db)
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            with db.bulk_load():
+                _, seconds = timed(parser.find_files, data, jobs)
+            _, rescan_seconds = timed(Parser(db).find_files, data, jobs)
+        finally:
+            sys.stdout = stdout
+    pitches = db.session.query(entities.Pitch).count()
+    results = rate(db.rows_written, seconds, "rows")
+    results.update(pitches=pitches, pitches_per_s=pitches / seconds if seconds else None,
+                   insert_seconds=db.insert_time, rescan_ms=rescan_seconds * 1000)
+    return db, results
+
+
+def queries(db):
+    """returns (name, call, rows) of every read of the DatabaseManager, with arguments picked from the data
+
+    ``rows`` counts the rows in the result of ``call``.
+    """
+    top = db.get_summary_totals(("start_speed",), ("pitcher",))
+    pitcher = max(top, key=lambda row: row["count"])["pitcher"]
+    pitch_type = max(db.get_summary_totals(("start_speed",), ("pitch_type",), pitcher),
+                     key=lambda row: row["count"])["pitch_type"]
+    season = max(row["season"] for row in db.get_summary_totals(("start_speed",), ("season",)))
+    batter = db.session.query(entities.Pitch.batter).filter(entities.Pitch.pitcher == pitcher).first()[0]
+    player = db.get_player(pitcher)
+    pitcher_ids = db.get_pitcher_ids()
+    middle = db.session.query(func.max(entities.Pitch.pid)).scalar() // 2
+    one = lambda result: 1
+    heatmap = lambda result: result["count"]
+    arrays = lambda result: len(result["x0"])
+    groups = lambda result: sum(len(columns["x0"]) for columns in result[0].values())
+    return [
+        ("get_players", lambda: db.get_players(last_name=player.last_name[:2]), len),
+        ("get_player", lambda: db.get_player(pitcher), one),
+        ("get_players_by_ids", lambda: db.get_players_by_ids(pitcher_ids), len),
+        ("get_player_ids", lambda: db.get_player_ids(), len),
+        ("get_pitcher_ids", lambda: db.get_pitcher_ids(season), len),
+        ("get_scanned_files", lambda: db.get_scanned_files(), len),
+        ("get_revision", lambda: db.get_revision(), one),
+        ("get_average_for_pitches", lambda: db.get_average_for_pitches(entities.Pitch.start_speed, pitcher,
+                                                                       pitch_type), one),
+        ("get_pitches", lambda: db.get_pitches(pitcher, pitch_type), len),
+        ("get_pitch_types", lambda: db.get_pitch_types(pitcher), len),
+        ("get_summaries", lambda: db.get_summaries(pitcher), len),
+        ("get_summary_totals", lambda: db.get_summary_totals(by=("pitch_type", "season"), pitcher_id=pitcher), len),
+        ("get_summary_totals all pitchers", lambda: db.get_summary_totals(by=("pitcher", "pitch_type")), len),
+        ("get_pitch_type_stats", lambda: db.get_pitch_type_stats(pitcher_id=pitcher), len),
+        ("get_pitch_type_stats by batter", lambda: db.get_pitch_type_stats(batter_id=batter), len),
+        ("get_heatmap", lambda: db.get_heatmap(pitcher_id=pitcher), heatmap),
+        ("get_heatmap season", lambda: db.get_heatmap(season=season), heatmap),
+        ("get_pitch_columns", lambda: db.get_pitch_columns(trajectory.REQUIRED_COLUMNS, pitcher_id=pitcher), arrays),
+        ("get_pitches_by_type", lambda: db.get_pitches_by_type(pitcher, trajectory.REQUIRED_COLUMNS), groups),
+        ("get_pitch_page", lambda: db.get_pitch_page(PAGE_FIELDS, pitcher_id=pitcher), len),
+        ("get_pitch_page deep", lambda: db.get_pitch_page(PAGE_FIELDS, after=middle), len),
+        ("get_player_page", lambda: db.get_player_page(("first_name", "last_name"), pos="P"), len),
+    ], pitcher, season
+
+
+def bench_queries(db, repeat):
+    calls, pitcher, season = queries(db)
+    results = {}
+    for name, call, rows in calls:
+        result, value = median_ms(call, repeat)
+        result["rows"] = rows(value)
+        results[name] = result
+    return results, pitcher, season
+
+
+def bench_trajectory(db, pitcher, season, repeat):
+    """times the trajectory math on up to TRAJECTORY_PITCHES pitches of ``season`` and drawing ``pitcher``'s chart"""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    from fillbass.drawing import Drawer
+
+    columns = db.get_pitch_columns(trajectory.REQUIRED_COLUMNS, season=season)
+    columns = {name: values[:TRAJECTORY_PITCHES] for name, values in columns.items()}
+    count = len(columns["x0"])
+    paths = trajectory.unmasked(trajectory.trajectories(columns))
+    groups, means = db.get_pitches_by_type(pitcher, trajectory.REQUIRED_COLUMNS)
+    chart_count = sum(len(group["x0"]) for group in groups.values())
+    figure = Figure()
+    FigureCanvasAgg(figure)
+
+    def draw(lod):
+        figure.clear()
+        Drawer.draw_pitches_by_type(figure.add_subplot(111, projection="3d"), "benchmark", groups, means, lod)
+
+    stages = [
+        ("time_to_plate", count, lambda: trajectory.time_to_plate(columns)),
+        ("trajectories", count, lambda: trajectory.trajectories(columns)),
+        ("subsample stratified", count,
+         lambda: trajectory.LevelOfDetail(method="stratified").paths(columns, count // 4)),
+        ("envelope", count, lambda: trajectory.envelope(paths)),
+        ("draw_pitches_by_type", chart_count, lambda: draw(None)),
+        ("draw_pitches_by_type envelope", chart_count, lambda: draw(trajectory.LevelOfDetail(envelope=True))),
+    ]
+    results = {}
+    for name, pitches, stage in stages:
+        result, _ = median_ms(stage, repeat)
+        result.update(pitches=pitches, pitches_per_s=pitches / result["ms"] * 1000 if result["ms"] else None)
+        results[name] = result
+    return results
+
+
+@click.command()
+@click.option("--data", metavar="DIR", type=click.Path(file_okay=False), default=None,
+              help="""benchmark the gd2 tree in DIR, generating it first if DIR does not exist. Defaults to a
+              temporary directory.""")
+@click.option("-d", "--days", metavar="COUNT", type=click.IntRange(min=1), default=1,
+              help="""days of data to generate. Defaults to 1.""")
+@click.option("--seasons", metavar="COUNT", type=click.IntRange(min=1), default=None,
+              help="""generate COUNT full seasons instead of --days.""")
+@click.option("-g", "--games", metavar="COUNT", type=click.IntRange(min=1, max=len(gd2gen.TEAMS) // 2), default=15,
+              help="""games per generated day. Defaults to 15.""")
+@click.option("--seed", type=int, default=0, help="""seed of the generated data. Defaults to 0.""")
+@click.option("--sample", metavar="COUNT", type=click.IntRange(min=1), default=20,
+              help="""parse COUNT game files and ten times as many player files in the parser benchmarks.
+              Defaults to 20.""")
+@click.option("--engine", "engines", type=click.Choice(Parser.ENGINES), multiple=True, default=Parser.ENGINES,
+              help="""benchmark these parser engines. Defaults to all.""")
+@click.option("-j", "--jobs", metavar="COUNT", type=click.IntRange(min=1), multiple=True, default=(1,),
+              help="""scan with COUNT worker processes; may be given several times. Defaults to 1.""")
+@click.option("-n", "--repeat", type=click.IntRange(min=1), default=5,
+              help="""time every query and trajectory stage this many times and report the median. Defaults to 5.""")
+@click.option("-o", "--output", type=click.File("w"), default="benchmark.json",
+              help="""write the results to this JSON file. Defaults to 'benchmark.json'.""")
+def main(data, days, seasons, games, seed, sample, engines, jobs, repeat, output):
+    results = {"fillbass": version(), "python": platform.python_version(), "platform": platform.platform(),
+               "created": datetime.datetime.now().isoformat(timespec="seconds"), "data": {"path": data, "seed": seed}}
+    with tempfile.TemporaryDirectory() as work_dir:
+        if data is None or not os.path.isdir(data):
+            data = data or os.path.join(work_dir, "data")
+            os.makedirs(data)
+            start = datetime.date(2008, 4, 1)
+            dates = gd2gen.season_days(start.year, seasons) if seasons is not None else \
+                (start + datetime.timedelta(days=i) for i in range(days))
+            (day_count, _, _), seconds = timed(gd2gen.generate, data, dates, games, seed)
+            click.echo("Generated {} days in {:.1f} s".format(day_count, seconds), err=True)
+
+        # the parser benchmarks read loose files, archived days are only scanned
+        game_files = sorted(glob.glob(os.path.join(data, "year_*", "month_*", "day_*", "gid_*", "inning_all.xml")))
+        player_files = sorted(glob.glob(os.path.join(data, "year_*", "month_*", "day_*", "gid_*", "[0-9]*.xml")))
+        results["parse"] = {}
+        for engine in engines:
+            click.echo("Parsing with {}".format(engine), err=True)
+            results["parse"][engine] = bench_parse(engine, game_files[:sample], player_files[:sample * 10],
+                                                   work_dir)
+
+        results["scan"] = {}
+        db = None
+        for count in jobs:
+            click.echo("Scanning with {} jobs".format(count), err=True)
+            if db is not None:
+                db.engine.dispose()
+            db, results["scan"][str(count)] = bench_scan(data, work_dir, count)
+        results["data"].update(games=len(game_files), players=db.session.query(entities.Player).count(),
+                               pitches=db.session.query(entities.Pitch).count())
+
+        click.echo("Querying", err=True)
+        results["queries"], pitcher, season = bench_queries(db, repeat)
+        click.echo("Drawing", err=True)
+        results["trajectory"] = bench_trajectory(db, pitcher, season, repeat)
+        db.engine.dispose()
+
+    json.dump(results, output, indent=2)
+    output.write("\n")
+
+
+if __name__ == "__main__":
+    main()
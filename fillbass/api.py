@@ -0,0 +1,226 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""read-only endpoints with keyset pagination, registered on the Eve app by rest.py
+
+Pages are ordered by pid; ``after`` takes the pid of the last item of the
+previous page, so every page is an index range scan however deep it is.
+``fields`` selects the columns to return and ``pitcher``/``pitch_type``
+filter on indexed columns, ``pitch_type`` as a LIKE pattern like on the
+other endpoints. Responses have the ``_items`` and
+``_links.next`` of Eve's.
+
+The aggregate endpoints answer conditional requests: their ETag is the
+database revision and Last-Modified the time of its last change.
+
+Pitches can also be requested as columns (see ``wire``), chosen by the
+Accept header or ``format=rows|columns|arrow``. These are streamed from
+the cursor and compressed if the client accepts gzip or deflate.
+"""
+
+import datetime
+
+import flask
+
+from . import entities, summary, wire
+from .parsedata import DatabaseManager
+from .querycache import QueryCache
+
+MAX_PAGE_SIZE = 50000
+
+blueprint = flask.Blueprint("api", __name__)
+
+
+def database():
+    """returns the DatabaseManager of the app, created from its FILLBASS_* settings"""
+    app = flask.current_app
+    if "fillbass" not in app.extensions:
+        app.extensions["fillbass"] = DatabaseManager(app.config.get("FILLBASS_DATABASE", "fillbass.db"),
+                                                     app.config.get("FILLBASS_MYSQL", False),
+                                                     QueryCache(ttl=app.config.get("FILLBASS_QUERY_CACHE_TTL",
+                                                                                   QueryCache.DEFAULT_TTL)))
+    return app.extensions["fillbass"]
+
+
+def revision():
+    """returns the database revision and its time, dropping cached results read at an older one
+
+    Call it before every read that may be answered from the query cache.
+    """
+    app = flask.current_app
+    db = database()
+    current = db.get_revision()
+    if app.extensions.get("fillbass_revision") != current[0]:
+        if db.query_cache is not None:
+            db.query_cache.clear()
+        app.extensions["fillbass_revision"] = current[0]
+    return current
+
+
+def _conditional(compute):
+    """returns the JSON of ``compute()``, or 304 Not Modified if the client has it for this revision"""
+    value, updated = revision()
+    etag = "r{}".format(value)
+    last_modified = updated.replace(tzinfo=datetime.timezone.utc) if updated is not None else None
+    request = flask.request
+    if request.if_none_match.contains(etag) or not request.if_none_match and \
+            last_modified is not None and request.if_modified_since is not None and \
+            last_modified <= request.if_modified_since:
+        response = flask.Response(status=304)
+    else:
+        response = flask.jsonify(compute())
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+class BadRequest(Exception):
+    pass
+
+
+@blueprint.errorhandler(BadRequest)
+def bad_request(e):
+    return flask.jsonify({"_status": "ERR", "_error": {"code": 400, "message": str(e)}}), 400
+
+
+def _int_arg(name, default=None, minimum=None, maximum=None):
+    value = flask.request.args.get(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise BadRequest("{} must be an integer".format(name))
+    if minimum is not None and value < minimum or maximum is not None and value > maximum:
+        raise BadRequest("{} must be between {} and {}".format(name, minimum, maximum))
+    return value
+
+
+def _fields(table, default):
+    value = flask.request.args.get("fields")
+    if not value:
+        return default
+    fields = tuple(name.strip() for name in value.split(",") if name.strip())
+    unknown = [name for name in fields if name not in table.c]
+    if unknown:
+        raise BadRequest("unknown fields: {}".format(", ".join(unknown)))
+    return fields
+
+
+def _page(items, limit):
+    """wraps a page of ``items`` in Eve's envelope, linking the next page if this one is full"""
+    page = {"_items": items, "_links": {}}
+    if len(items) == limit:
+        args = flask.request.args.to_dict()
+        args["after"] = items[-1]["pid"]
+        page["_links"]["next"] = {"href": flask.url_for(flask.request.endpoint, **args)}
+    return flask.jsonify(page)
+
+
+def _list_arg(name, allowed, default):
+    value = flask.request.args.get(name)
+    if not value:
+        return default
+    values = tuple(v.strip() for v in value.split(",") if v.strip())
+    unknown = [v for v in values if v not in allowed]
+    if unknown:
+        raise BadRequest("unknown {}: {}".format(name, ", ".join(unknown)))
+    return values
+
+
+def _mimetype():
+    name = flask.request.args.get("format")
+    if name is not None:
+        if name not in wire.FORMATS:
+            raise BadRequest("format must be one of {}".format(", ".join(wire.FORMATS)))
+        return wire.FORMATS[name]
+    return flask.request.accept_mimetypes.best_match(list(wire.FORMATS.values()), wire.JSON_ROWS)
+
+
+def _next_link(count, last, limit):
+    if count < limit:
+        return {}
+    args = flask.request.args.to_dict()
+    args["after"] = last[0]
+    return {"next": {"href": flask.url_for(flask.request.endpoint, **args)}}
+
+
+def _vary(response):
+    """marks a pitches response as depending on the format and encoding the client accepts"""
+    response.vary.update(("Accept", "Accept-Encoding"))
+    return response
+
+
+def _stream(parts, mimetype):
+    headers = {}
+    encoding = wire.negotiate_encoding(flask.request.headers.get("Accept-Encoding"))
+    if encoding is not None:
+        parts = wire.compress(parts, encoding)
+        headers["Content-Encoding"] = encoding
+    return flask.Response(flask.stream_with_context(parts), mimetype=mimetype, headers=headers)
+
+
+@blueprint.route("/api/pitches")
+def pitches():
+    flask.after_this_request(_vary)
+    table = entities.Pitch.__table__
+    fields = _fields(table, tuple(c.name for c in table.columns))
+    limit = _int_arg("limit", DatabaseManager.DEFAULT_PAGE_SIZE, 1, MAX_PAGE_SIZE)
+    filters = (_int_arg("pitcher"), flask.request.args.get("pitch_type"), _int_arg("after"), limit)
+    mimetype = _mimetype()
+    if mimetype == wire.JSON_ROWS:
+        revision()
+        return _page(database().get_pitch_page(fields, *filters), limit)
+
+    db = database()
+    select = db.pitch_page_select(fields, *filters)
+    names = [column.name for column in select.selected_columns]
+    if mimetype == wire.JSON_COLUMNS:
+        parts = wire.json_columns(names, db.iter_rows(select),
+                                  lambda count, last: {"_links": _next_link(count, last, limit)})
+        return _stream(parts, mimetype)
+    try:
+        from .columnar import arrow_schema
+    except ImportError:
+        return flask.jsonify({"_status": "ERR", "_error": {"code": 406, "message": "Arrow needs pyarrow"}}), 406
+    schema = arrow_schema(select.selected_columns)
+    return _stream(wire.arrow_stream(schema, db.iter_rows(select)), mimetype)
+
+
+@blueprint.route("/api/players")
+def players():
+    table = entities.Player.__table__
+    fields = _fields(table, tuple(c.name for c in table.columns))
+    limit = _int_arg("limit", DatabaseManager.DEFAULT_PAGE_SIZE, 1, MAX_PAGE_SIZE)
+    revision()
+    items = database().get_player_page(fields, flask.request.args.get("pos"), _int_arg("after"), limit)
+    return _page(items, limit)
+
+
+@blueprint.route("/api/heatmap")
+def heatmap():
+    args = flask.request.args
+    filters = dict(pitcher_id=_int_arg("pitcher"), pitch_type=args.get("pitch_type"),
+                   batter_id=_int_arg("batter"), season=_int_arg("season"),
+                   bins=_int_arg("bins", DatabaseManager.HEATMAP_BINS, 1, 100))
+    return _conditional(lambda: database().get_heatmap(**filters))
+
+
+@blueprint.route("/api/summary")
+def pitch_summary():
+    """counts, means and spreads by pitch type; from the summary table unless filtered by batter"""
+    args = flask.request.args
+    columns = _list_arg("fields", entities.SUMMARY_COLUMNS, ("start_speed", "spin_rate", "pfx_x", "pfx_z"))
+    by = _list_arg("by", summary.KEY, ("pitch_type",))
+    pitcher_id, batter_id, season = _int_arg("pitcher"), _int_arg("batter"), _int_arg("season")
+    pitch_type = args.get("pitch_type")
+    if batter_id is not None:
+        if by != ("pitch_type",):
+            raise BadRequest("with batter, summaries are only available by pitch_type")
+        return _conditional(lambda: {"_items": database().get_pitch_type_stats(
+            columns, pitcher_id, pitch_type, batter_id, season)})
+    return _conditional(lambda: {"_items": database().get_summary_totals(
+        columns, by, pitcher_id, pitch_type, season)})
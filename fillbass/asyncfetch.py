@@ -0,0 +1,229 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""asyncio based downloader writing the same layout as fetchdata.fetch_day
+
+All games and player files of all requested days are fetched concurrently;
+a single semaphore bounds the number of requests in flight.
+"""
+
+import asyncio
+import logging
+import os.path
+
+import aiohttp
+
+from .fetchdata import (ARCHIVE_SUFFIX, CHUNK_SIZE, DATA_URL, TIMEOUT, DayRecord, archive_day, day_path, game_ids,
+                        is_complete_xml, player_links)
+from .throttle import FetchStats, RetryPolicy
+
+TRANSIENT_ERRORS = (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError)
+
+LOG = logging.getLogger(__name__)
+
+
+async def gather_all(*aws):
+    """awaits all of ``aws``, also after one of them failed, and raises the first failure"""
+    results = await asyncio.gather(*aws, return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+
+class AsyncFetcher(object):
+    """downloads days of game data with at most ``concurrency`` requests at a time"""
+
+    def __init__(self, save_path, concurrency, players_fetched, data_url=DATA_URL, resume=False,
+                 bucket=None, policy=None, stats=None, archive=False):
+        super(AsyncFetcher, self).__init__()
+        self.save_path = save_path
+        self.concurrency = concurrency
+        self.data_url = data_url
+        self.resume = resume
+        self.archive = archive
+        self.bucket = bucket
+        self.policy = policy if policy is not None else RetryPolicy()
+        self.stats = stats if stats is not None else FetchStats()
+        self.players_fetched = players_fetched
+        self.player_downloads = {}
+        self.semaphore = None
+        self.session = None
+
+    def run(self, days):
+        asyncio.run(self.fetch_days(days))
+
+    async def fetch_days(self, days):
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=TIMEOUT)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            self.session = session
+            await asyncio.gather(*(self.fetch_day(day) for day in days))
+
+    async def retry(self, fn, *args):
+        """returns ``await fn(*args)``, awaiting it again after transient HTTP errors"""
+        attempt = 0
+        while True:
+            try:
+                return await fn(*args)
+            except (aiohttp.ClientResponseError,) + TRANSIENT_ERRORS as e:
+                retry_after = None
+                if isinstance(e, aiohttp.ClientResponseError):
+                    if e.status not in RetryPolicy.RETRY_STATUS:
+                        raise
+                    retry_after = e.headers.get("Retry-After") if e.headers else None
+                if attempt >= self.policy.retries:
+                    self.stats.add("failures")
+                    raise
+                delay = self.policy.delay(attempt, retry_after)
+                LOG.info("Retrying in [%.1f] s after [%r]", delay, e)
+                self.stats.add("retries")
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    async def throttle(self):
+        if self.bucket is not None:
+            wait = self.bucket.reserve()
+            self.stats.throttle(wait)
+            if wait > 0:
+                await asyncio.sleep(wait)
+        self.stats.add("requests")
+
+    async def _get_text(self, url):
+        async with self.semaphore:
+            await self.throttle()
+            async with self.session.get(url) as response:
+                response.raise_for_status()
+                body = await response.read()
+                self.stats.add("bytes", len(body))
+                return body.decode(response.get_encoding())
+
+    async def get_text(self, url):
+        return await self.retry(self._get_text, url)
+
+    async def _copy_to_file(self, src_url, file_name):
+        part_name = file_name + ".part"
+        async with self.semaphore:
+            await self.throttle()
+            async with self.session.get(src_url) as response:
+                response.raise_for_status()
+                with open(part_name, "wb") as f:
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        f.write(chunk)
+                        self.stats.add("bytes", len(chunk))
+        os.replace(part_name, file_name)
+
+    async def copy_to_file(self, src_url, file_name):
+        await self.retry(self._copy_to_file, src_url, file_name)
+
+    async def fetch_file(self, src_url, file_name, record):
+        record.expect(file_name)
+        if self.resume and await asyncio.get_running_loop().run_in_executor(None, is_complete_xml, file_name):
+            LOG.debug("Keeping [%s]", file_name)
+        else:
+            await self.copy_to_file(src_url, file_name)
+        record.done(file_name)
+
+    async def fetch_players(self, url, path, record):
+        listing = await self.get_text(url)
+        downloads = []
+        for player_id, href in player_links(listing):
+            file_name = os.path.join(path, href.split("/")[-1])
+            if self.resume and record.belongs_here(file_name):
+                downloads.append(self.fetch_file(os.path.join(url, href), file_name, record))
+                continue
+
+            downloads.append(self.fetch_player(player_id, os.path.join(url, href), file_name, record))
+        await gather_all(*downloads)
+
+    async def claim_player(self, player_id):
+        """returns True if the caller has to fetch the player
+
+        Waits for a running download of the player and claims it again if
+        that download failed, like ``PlayerRegistry.claim`` does for threads.
+        """
+        while True:
+            download = self.player_downloads.get(player_id)
+            if download is None:
+                break
+            await download.wait()
+        if not self.players_fetched.claim(player_id, block=False):
+            return False
+        self.player_downloads[player_id] = asyncio.Event()
+        return True
+
+    async def fetch_player(self, player_id, src_url, file_name, record):
+        if not await self.claim_player(player_id):
+            return
+        success = False
+        try:
+            await self.fetch_file(src_url, file_name, record)
+            success = True
+        finally:
+            self.players_fetched.release(player_id, success)
+            self.player_downloads.pop(player_id).set()
+
+    async def fetch_game(self, url, path, record):
+        LOG.debug("Fetching [%s] …", url)
+        try:
+            await gather_all(
+                self.fetch_file(os.path.join(url, "inning", "inning_all.xml"),
+                                os.path.join(path, "inning_all.xml"),
+                                record),
+                *(self.fetch_players(os.path.join(url, player_type), path, record)
+                  for player_type in ["pitchers", "batters"]))
+        except Exception as e:
+            record.fail()
+            LOG.warning("Encountered {}".format(e))
+
+    async def archive_day(self, local_dir):
+        await asyncio.get_running_loop().run_in_executor(None, archive_day, local_dir)
+
+    async def fetch_day(self, day):
+        LOG.info("Retrieving [%s] …", day)
+        full_url = day_path(self.data_url, day)
+        local_dir = day_path(self.save_path, day)
+
+        if os.path.exists(local_dir + ARCHIVE_SUFFIX):
+            return
+
+        if os.path.isdir(local_dir) and DayRecord.is_complete(local_dir):
+            if self.archive:
+                await self.archive_day(local_dir)
+            return
+
+        if os.path.isdir(local_dir) and not self.resume:
+            return
+
+        try:
+            listing = await self.get_text(full_url)
+        except aiohttp.ClientResponseError as e:
+            if e.status != 404:
+                LOG.error("Encountered [%s] while fetching day [%s]", e, day)
+            else:
+                LOG.info("No games on [%s]", day)
+            return
+        except Exception as e:
+            LOG.error("Encountered [%s] while fetching day [%s]", e, day)
+            return
+
+        if not os.path.isdir(local_dir):
+            os.makedirs(local_dir)
+        record = DayRecord.resume(local_dir) if self.resume else DayRecord()
+        games = []
+        for game_id in game_ids(listing):
+            game_path = os.path.join(local_dir, game_id)
+            if not os.path.isdir(game_path):
+                os.makedirs(game_path)
+            games.append(self.fetch_game(os.path.join(full_url, game_id), game_path, record))
+        await asyncio.gather(*games)
+        record.save(local_dir)
+
+        if record.complete:
+            LOG.info("Retrieved [%s]", day)
+            if self.archive:
+                await self.archive_day(local_dir)
+        else:
+            LOG.warning("Retrieved [%s] incompletely, missing %s", day, sorted(record.expected - record.fetched))
@@ -0,0 +1,196 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Parquet export of the database and a read backend working on it
+
+An export is a directory holding ``players.parquet`` and a ``pitches``
+dataset partitioned by season (``pitches/season=2008/...``). Within a
+season pitches are sorted by pitcher and pitch type, so the row group
+statistics let reads filtered by pitcher or pitch type skip most of the
+file. Needs pyarrow.
+"""
+
+import logging
+import os
+import shutil
+
+import numpy
+import pyarrow
+import pyarrow.compute
+import pyarrow.dataset
+import pyarrow.fs
+import pyarrow.parquet
+import sqlalchemy
+
+from . import entities, summary
+from .parsedata import DatabaseManager
+
+PITCHES_DIR = "pitches"
+PLAYERS_FILE = "players.parquet"
+ROW_GROUP_SIZE = 64 * 1024
+
+LOG = logging.getLogger(__name__)
+
+
+def arrow_type(column):
+    if isinstance(column.type, sqlalchemy.Float):
+        return pyarrow.float64()
+    if isinstance(column.type, sqlalchemy.Integer):
+        return pyarrow.int64()
+    if isinstance(column.type, sqlalchemy.DateTime):
+        return pyarrow.timestamp("us")
+    return pyarrow.string()
+
+
+def arrow_schema(columns, exclude=()):
+    return pyarrow.schema([(c.name, arrow_type(c)) for c in columns if c.name not in exclude])
+
+
+def _write(connection, select, schema, file_name, chunk_size):
+    """streams the rows of ``select`` into the Parquet file ``file_name``, returns the number of rows"""
+    count = 0
+    result = connection.execution_options(stream_results=True).execute(select)
+    with pyarrow.parquet.ParquetWriter(file_name, schema, compression="zstd") as writer:
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if not rows:
+                break
+            arrays = [pyarrow.array(values, type=field.type) for values, field in zip(zip(*rows), schema)]
+            writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema), row_group_size=ROW_GROUP_SIZE)
+            count += len(rows)
+    return count
+
+
+def export(db, path, chunk_size=ROW_GROUP_SIZE):
+    """writes all players and pitches of the DatabaseManager ``db`` to the directory ``path``
+
+    An existing export at ``path`` is replaced. Returns the number of
+    players and pitches written.
+    """
+    pitches = entities.Pitch.__table__
+    players = entities.Player.__table__
+    pitch_schema = arrow_schema(pitches.columns, exclude=("pid",))
+    season = summary.season_expression()
+
+    tmp_path = path + ".part"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(os.path.join(tmp_path, PITCHES_DIR))
+    with db.engine.connect() as connection:
+        player_count = _write(connection, players.select().order_by(players.c.pid), arrow_schema(players.columns),
+                              os.path.join(tmp_path, PLAYERS_FILE), chunk_size)
+        pitch_count = 0
+        seasons = [s for s, in connection.execute(sqlalchemy.select(season).distinct().order_by(season))]
+        for s in seasons:
+            LOG.info("Exporting season [%s] …", s)
+            select = sqlalchemy.select(*(pitches.c[name] for name in pitch_schema.names)) \
+                .where(season == s).order_by(pitches.c.pitcher, pitches.c.pitch_type, pitches.c.game_id)
+            season_path = os.path.join(tmp_path, PITCHES_DIR, "season={}".format(s))
+            os.makedirs(season_path)
+            pitch_count += _write(connection, select, pitch_schema, os.path.join(season_path, "part-0.parquet"),
+                                  chunk_size)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return player_count, pitch_count
+
+
+def _like(field, pattern):
+    """matches ``pattern`` like SQL LIKE does on the database, ignoring case"""
+    return pyarrow.compute.match_like(field, pattern, ignore_case=True)
+
+
+def _all(conditions):
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def to_numpy(array, dtype):
+    """converts an Arrow column to ``dtype`` with the NULL values of ``DatabaseManager.get_pitch_columns``"""
+    if dtype.kind == "f":
+        return array.to_numpy(zero_copy_only=False).astype(dtype, copy=False)
+    if dtype.kind == "i":
+        return array.fill_null(DatabaseManager.INT_NULL).to_numpy().astype(dtype, copy=False)
+    if dtype.kind == "M":
+        return array.to_numpy(zero_copy_only=False).astype(dtype, copy=False)
+    return numpy.array(array.fill_null("").to_pylist(), dtype=dtype)
+
+
+class ColumnarStore(object):
+    """reads an export written by ``export`` with the read accessors of DatabaseManager
+
+    Files are memory mapped and filters on pitcher, pitch type and season
+    are pushed down into the scan.
+    """
+
+    def __init__(self, path):
+        super(ColumnarStore, self).__init__()
+        self.path = path
+        filesystem = pyarrow.fs.LocalFileSystem(use_mmap=True)
+        self.pitches = pyarrow.dataset.dataset(os.path.join(path, PITCHES_DIR), format="parquet",
+                                               partitioning="hive", filesystem=filesystem)
+        self.players = pyarrow.dataset.dataset(os.path.join(path, PLAYERS_FILE), format="parquet",
+                                               filesystem=filesystem)
+
+    @staticmethod
+    def pitch_filter(pitcher_id=None, pitch_type=None, season=None):
+        field = pyarrow.dataset.field
+        conditions = []
+        if isinstance(pitcher_id, (list, tuple, set)):
+            conditions.append(field("pitcher").isin([int(p) for p in pitcher_id]))
+        elif pitcher_id is not None:
+            conditions.append(field("pitcher") == int(pitcher_id))
+        if pitch_type is not None:
+            conditions.append(_like(field("pitch_type"), pitch_type))
+        if season is not None:
+            conditions.append(field("season") == int(season))
+        return _all(conditions)
+
+    def get_pitch_table(self, columns, pitcher_id=None, pitch_type=None, season=None):
+        """returns the ``columns`` of the matching pitches as an Arrow table"""
+        return self.pitches.to_table(columns=list(columns),
+                                     filter=ColumnarStore.pitch_filter(pitcher_id, pitch_type, season))
+
+    def get_pitch_columns(self, columns, pitcher_id=None, pitch_type=None, structured=False, season=None):
+        """same as ``DatabaseManager.get_pitch_columns``, read from the export"""
+        table = self.get_pitch_table(columns, pitcher_id, pitch_type, season)
+        dtypes = [DatabaseManager.column_dtype(entities.Pitch.__table__.c[name]) for name in columns]
+        arrays = {name: to_numpy(table.column(name), dtype) for name, dtype in zip(columns, dtypes)}
+        if not structured:
+            return arrays
+        records = numpy.empty(table.num_rows, dtype=[(name, dtype) for name, dtype in zip(columns, dtypes)])
+        for name in columns:
+            records[name] = arrays[name]
+        return records
+
+    def get_pitches_by_type(self, pitcher_id, columns, pitch_type=None, averages=("sz_bot", "sz_top")):
+        arrays = self.get_pitch_columns(DatabaseManager.by_type_columns(columns, averages), pitcher_id=pitcher_id,
+                                        pitch_type=pitch_type)
+        return DatabaseManager.group_by_type(arrays, columns, averages)
+
+    def get_pitch_types(self, pitcher_id=None):
+        table = self.get_pitch_table(["pitch_type"], pitcher_id)
+        return [(t,) for t in pyarrow.compute.unique(table.column("pitch_type")).to_pylist()]
+
+    def get_average_for_pitches(self, column, pitcher_id=None, pitch_type=None):
+        name = getattr(column, "key", column)
+        table = self.get_pitch_table([name], pitcher_id, pitch_type)
+        return (pyarrow.compute.mean(table.column(name)).as_py(),)
+
+    def _players(self, expression):
+        table = self.players.to_table(filter=expression)
+        names = [c.name for c in entities.Player.__table__.columns]
+        return [entities.Player(*(row[name] for name in names)) for row in table.to_pylist()]
+
+    def get_players(self, first_name=None, last_name=None):
+        return self._players(_all(pyarrow.compute.match_like(pyarrow.dataset.field(name), value + "%", ignore_case=True)
+                                  for name, value in (("first_name", first_name), ("last_name", last_name))
+                                  if value is not None))
+
+    def get_player(self, id):
+        players = self._players(pyarrow.dataset.field("pid") == int(id))
+        return players[0] if players else None
+
+    def player_present(self, pid):
+        return bool(self.get_player(pid))
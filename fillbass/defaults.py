@@ -0,0 +1,22 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""defaults shared by the command line and the modules it drives
+
+Kept free of imports, so the command line can show its options without
+loading the modules that do the work.
+"""
+
+DATA_URL = "http://gd2.mlb.com/components/game/mlb/"
+
+PARSER_ENGINES = ("lxml", "bs4")
+BATCH_SIZE = 5000
+CONFLICT_MODES = ("ignore", "update")
+
+CHART_FORMATS = ("png", "svg", "pdf")
+DPI = 100
+
+SAMPLES = 50
+MAX_VERTICES = 200000
+SUBSAMPLE_METHODS = ("random", "stratified")
@@ -0,0 +1,83 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""3d charts of pitch trajectories
+
+pyplot is only imported to show a chart in a window, so the headless
+renderer draws on the Agg canvas without it.
+"""
+
+import logging
+
+import matplotlib
+from matplotlib import patches
+from mpl_toolkits.mplot3d import Axes3D, art3d
+from mpl_toolkits.mplot3d.art3d import Line3DCollection
+
+from . import trajectory
+
+LOG = logging.getLogger(__name__)
+
+
+class Drawer(object):
+    """draws nice graphs"""
+
+    def __init__(self, db):
+        super(Drawer, self).__init__()
+        self.db = db
+
+    STRIKE_ZONE_HALF_WIDTH = 0.7083
+    STRIKE_ZONE_Y = 1.417
+
+    def pitches_by_type(self, pitcher, pitch_type=None, lod=None):
+        import matplotlib.pyplot as plt
+
+        groups, means = self.db.get_pitches_by_type(pitcher.pid, trajectory.REQUIRED_COLUMNS, pitch_type)
+
+        fig = plt.figure()
+        ax = fig.add_subplot(111, projection="3d")
+        pitch_count = Drawer.draw_pitches_by_type(ax, "Pitch Location by type for " + str(pitcher), groups, means,
+                                                  lod)
+        LOG.info("Evaluated [%i] pitches", pitch_count)
+        plt.show(block=True)
+
+    @staticmethod
+    def draw_pitches_by_type(ax, title, groups, means, lod=None):
+        """draws the trajectories of ``groups`` as returned by ``get_pitches_by_type`` into the 3d axes ``ax``
+
+        ``lod``, a ``trajectory.LevelOfDetail``, limits what is drawn of
+        large groups. Returns the number of pitches in ``groups``.
+        """
+        lod = lod if lod is not None else trajectory.LevelOfDetail()
+        colors = matplotlib.rcParams["axes.prop_cycle"].by_key()["color"]
+        counts = {t: len(columns["x0"]) for t, columns in groups.items()}
+        limits = lod.line_limits(counts)
+        for index, (t, columns) in enumerate(groups.items()):
+            color = colors[index % len(colors)]
+            lines = lod.paths(columns, limits[t])
+            if lod.envelope:
+                if len(lines):
+                    mean, bands = trajectory.envelope(lines, lod.percentiles)
+                    ax.add_collection(Line3DCollection([mean], label="{} mean".format(t), linewidths=2, colors=color))
+                    ax.add_collection(Line3DCollection(bands, linewidths=1, linestyles="dashed", alpha=0.7,
+                                                       colors=color))
+                continue
+            label = t if limits[t] >= counts[t] else "{} ({} of {})".format(t, len(lines), counts[t])
+            ax.add_collection(Line3DCollection(lines, label=label, linewidths=1, alpha=0.5, colors=color))
+        pitch_count = sum(counts.values())
+
+        half_width = Drawer.STRIKE_ZONE_HALF_WIDTH
+        sz_bot, sz_top = means["sz_bot"], means["sz_top"]
+        if sz_bot is not None and sz_top is not None:
+            strikezone = patches.Rectangle((-half_width, sz_bot), half_width * 2, sz_top - sz_bot, fill=False,
+                                           label="Strikezone")
+            ax.add_patch(strikezone)
+            art3d.pathpatch_2d_to_3d(strikezone, z=Drawer.STRIKE_ZONE_Y, zdir="y")
+        ax.set_xlim(-half_width * 4, half_width * 4)
+        ax.set_ylim(0, 50)
+        ax.set_zlim(-1, sz_top * 2 if sz_top is not None else 7)
+        ax.set_title(title)
+        if groups:
+            ax.legend()
+        return pitch_count
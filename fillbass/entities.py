@@ -8,9 +8,17 @@ from sqlalchemy.ext.declarative import declarative_base
 Entity = declarative_base()
 
 
+def dialect_index(dialect, name, *expressions, **kwargs):
+    """returns an index only created on ``dialect``, which is kept in its info for ``missing_indexes``"""
+    return sqlalchemy.Index(name, *expressions, info={"dialect": dialect}, **kwargs).ddl_if(dialect=dialect)
+
+
 class Player(Entity):
     """a single player"""
     __tablename__ = "players"
+    __table_args__ = (
+        dialect_index("mysql", "ix_players_last_name_first_name", "last_name", "first_name"),
+    )
 
     pid = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
     pos = sqlalchemy.Column(sqlalchemy.String(length=50))
@@ -34,11 +42,25 @@ class Player(Entity):
         return str(self.pid) + " " + self.pos + " " + self.first_name + " " + self.last_name
 
 
+# LIKE compares case-insensitively, SQLite only serves a LIKE 'x%' from an index that does so as well
+dialect_index("sqlite", "ix_players_last_name_first_name_nocase",
+              sqlalchemy.collate(Player.last_name, "NOCASE"),
+              sqlalchemy.collate(Player.first_name, "NOCASE"))
+
+
 class Pitch(Entity):
     """a single pitch"""
     __tablename__ = "pitches"
+    __table_args__ = (
+        sqlalchemy.Index("ux_pitches_game_id_at_bat_event_id", "game_id", "at_bat", "event_id", unique=True),
+        sqlalchemy.Index("ix_pitches_pitcher_pitch_type", "pitcher", "pitch_type"),
+        sqlalchemy.Index("ix_pitches_batter_pitch_type", "batter", "pitch_type"),
+    )
 
     pid = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    game_id = sqlalchemy.Column(sqlalchemy.String(length=50))
+    at_bat = sqlalchemy.Column(sqlalchemy.Integer)
+    event_id = sqlalchemy.Column(sqlalchemy.Integer)
     px = sqlalchemy.Column(sqlalchemy.Float)
     pz = sqlalchemy.Column(sqlalchemy.Float)
     x0 = sqlalchemy.Column(sqlalchemy.Float)
@@ -83,3 +105,65 @@ class Pitch(Entity):
     spin_rate = sqlalchemy.Column(sqlalchemy.Float)
     cc = sqlalchemy.Column(sqlalchemy.String(length=50))
     mt = sqlalchemy.Column(sqlalchemy.String(length=50))
+
+
+SUMMARY_COLUMNS = ("start_speed", "end_speed", "spin_rate", "spin_dir", "pfx_x", "pfx_z",
+                   "break_y", "break_angle", "break_length", "px", "pz", "sz_top", "sz_bot")
+SUMMARY_AGGREGATES = ("n", "sum", "sumsq", "min", "max")
+
+
+def _summary_columns():
+    for name in SUMMARY_COLUMNS:
+        yield sqlalchemy.Column(name + "_n", sqlalchemy.Integer, nullable=False, default=0)
+        yield sqlalchemy.Column(name + "_sum", sqlalchemy.Float, nullable=False, default=0.0)
+        yield sqlalchemy.Column(name + "_sumsq", sqlalchemy.Float, nullable=False, default=0.0)
+        yield sqlalchemy.Column(name + "_min", sqlalchemy.Float)
+        yield sqlalchemy.Column(name + "_max", sqlalchemy.Float)
+
+
+class PitchSummary(Entity):
+    """count, sum, sum of squares, min and max of the key columns of a pitcher's pitches of one type in one season
+
+    ``<column>_n`` counts the pitches that have a value for the column. A
+    pitch type of '' stands for pitches without a type.
+    """
+    __table__ = sqlalchemy.Table(
+        "pitch_summaries", Entity.metadata,
+        sqlalchemy.Column("pitcher", sqlalchemy.Integer, sqlalchemy.ForeignKey("players.pid"), primary_key=True),
+        sqlalchemy.Column("pitch_type", sqlalchemy.String(length=5), primary_key=True),
+        sqlalchemy.Column("season", sqlalchemy.Integer, primary_key=True),
+        sqlalchemy.Column("count", sqlalchemy.Integer, nullable=False, default=0),
+        *_summary_columns())
+
+    def mean(self, name):
+        n = getattr(self, name + "_n")
+        return getattr(self, name + "_sum") / n if n else None
+
+    def std(self, name):
+        n = getattr(self, name + "_n")
+        if not n:
+            return None
+        mean = getattr(self, name + "_sum") / n
+        return max(0.0, getattr(self, name + "_sumsq") / n - mean * mean) ** 0.5
+
+    def __repr__(self):
+        return "{} {} {} ({} pitches)".format(self.pitcher, self.pitch_type, self.season, self.count)
+
+
+class ScannedFile(Entity):
+    """a file that has been parsed by scan"""
+    __tablename__ = "scanned_files"
+
+    path = sqlalchemy.Column(sqlalchemy.String(length=255), primary_key=True)
+    size = sqlalchemy.Column(sqlalchemy.BigInteger)
+    mtime_ns = sqlalchemy.Column(sqlalchemy.BigInteger)
+    digest = sqlalchemy.Column(sqlalchemy.String(length=40))
+
+
+class Revision(Entity):
+    """counts the commits that changed the database"""
+    __tablename__ = "revision"
+
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    value = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=0)
+    updated = sqlalchemy.Column(sqlalchemy.DateTime)
@@ -2,83 +2,399 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import json
 import logging
 import os.path
+import shutil
+import threading
+import time
+import zipfile
 
 import bs4
+import requests
+from lxml import etree
+
+from .defaults import DATA_URL
+from .throttle import FetchStats, RetryPolicy
 
 LOG = logging.getLogger(__name__)
 
 MLB_URL = "http://gd2.mlb.com/"
-DATA_URL = "http://gd2.mlb.com/components/game/mlb/"
 
+CHUNK_SIZE = 64 * 1024
+TIMEOUT = 60
+ARCHIVE_SUFFIX = ".zip"
 
-def __copy_to_file__(src_url, file_name, session):
-    with open(file_name, "wb") as f:
-        request = session.get(src_url)
+
+class ThrottledSession(requests.Session):
+    """requests session that waits for a rate limiter before every request
+    and retries transient failures with exponential backoff
+
+    ``bucket`` is a ``throttle.TokenBucket`` or None for no rate limit.
+    """
+
+    TRANSIENT_ERRORS = (requests.exceptions.ConnectionError,
+                        requests.exceptions.Timeout,
+                        requests.exceptions.ChunkedEncodingError)
+
+    def __init__(self, bucket=None, policy=None, stats=None):
+        super(ThrottledSession, self).__init__()
+        self.bucket = bucket
+        self.policy = policy if policy is not None else RetryPolicy()
+        self.stats = stats if stats is not None else FetchStats()
+
+    def request(self, method, url, **kwargs):
+        if self.bucket is not None:
+            self.stats.throttle(self.bucket.acquire())
+        self.stats.add("requests")
+        kwargs.setdefault("timeout", TIMEOUT)
+        return super(ThrottledSession, self).request(method, url, **kwargs)
+
+    def retry(self, fn, *args):
+        """returns ``fn(*args)``, calling it again after transient HTTP errors"""
+        attempt = 0
+        while True:
+            try:
+                return fn(*args)
+            except requests.exceptions.RequestException as e:
+                response = e.response
+                if isinstance(e, requests.exceptions.HTTPError):
+                    transient = response is not None and response.status_code in RetryPolicy.RETRY_STATUS
+                else:
+                    transient = isinstance(e, ThrottledSession.TRANSIENT_ERRORS)
+                if not transient:
+                    raise
+                if attempt >= self.policy.retries:
+                    self.stats.add("failures")
+                    raise
+                delay = self.policy.delay(attempt, response.headers.get("Retry-After") if response is not None else None)
+                LOG.info("Retrying in [%.1f] s after [%s]", delay, e)
+                self.stats.add("retries")
+                time.sleep(delay)
+                attempt += 1
+
+
+class PlayerRegistry(object):
+    """thread-safe record of the player files fetched so far
+
+    A player is downloaded by the first caller that claims it; callers
+    claiming a player whose download is still running wait for it to end.
+    Fetched player ids are appended to the file ``path``, so later runs skip
+    them without asking the server. Without such a file, it is seeded from
+    the player files already below the directory of ``path``.
+    """
+
+    FILE_NAME = ".players_fetched"
+
+    def __init__(self, path=None):
+        super(PlayerRegistry, self).__init__()
+        self.path = path
+        self.lock = threading.Lock()
+        self.fetched = set()
+        self.in_flight = {}
+        if path is None:
+            return
+        if os.path.exists(path):
+            with open(path) as f:
+                self.fetched.update(int(line) for line in f if line.strip())
+        else:
+            for root, _, files in os.walk(os.path.dirname(path) or "."):
+                for name in files:
+                    if name.endswith(ARCHIVE_SUFFIX):
+                        with zipfile.ZipFile(os.path.join(root, name)) as archive:
+                            self.add_player_files(n.split("/")[-1] for n in archive.namelist())
+                self.add_player_files(files)
+            with open(path, "w") as f:
+                f.writelines("%d\n" % player_id for player_id in sorted(self.fetched))
+        LOG.info("[%i] players fetched by earlier runs", len(self.fetched))
+
+    def add_player_files(self, names):
+        self.fetched.update(int(name.split(".")[0]) for name in names
+                            if name[:1].isdigit() and name.endswith(".xml"))
+
+    def __contains__(self, player_id):
+        return player_id in self.fetched
+
+    def __len__(self):
+        return len(self.fetched)
+
+    def claim(self, player_id, block=True):
+        """returns True if the caller has to fetch the player and call ``release`` afterwards
+
+        Returns False if the player has already been fetched. If another
+        download of the player is running, waits for it when ``block`` is set
+        and claims the player again if that download failed; returns False
+        right away otherwise.
+        """
+        while True:
+            with self.lock:
+                if player_id in self.fetched:
+                    return False
+                event = self.in_flight.get(player_id)
+                if event is None:
+                    self.in_flight[player_id] = threading.Event()
+                    return True
+            if not block:
+                return False
+            event.wait()
+
+    def release(self, player_id, success):
+        with self.lock:
+            event = self.in_flight.pop(player_id)
+            if success:
+                self.fetched.add(player_id)
+                if self.path is not None:
+                    with open(self.path, "a") as f:
+                        f.write("%d\n" % player_id)
+        event.set()
+
+
+def game_ids(day_listing):
+    """returns the ids of all games linked from the html listing of a day"""
+    soup = bs4.BeautifulSoup(day_listing, "lxml")
+    return [link.string.strip() for link in soup.find_all("a")
+            if link.string is not None and link.string.strip().startswith("gid")]
+
+
+def player_links(player_listing):
+    """returns (player id, href) of all player files linked from a pitchers or batters listing"""
+    soup = bs4.BeautifulSoup(player_listing, "lxml")
+    links = []
+    for link in soup.find_all("a"):
+        if link.string.strip().startswith("P"):
+            continue
+
+        href = link.get("href").strip()
+        links.append((int(href.split("/")[-1].split(".")[0]), href))
+    return links
+
+
+def is_complete_xml(file_name):
+    """tells whether ``file_name`` exists and holds a well-formed XML document"""
+    try:
+        etree.parse(file_name)
+        return True
+    except (IOError, OSError, etree.XMLSyntaxError):
+        return False
+
+
+class DayRecord(object):
+    """the files a day is expected to consist of and the ones fetched so far
+
+    Saved into the day directory once the day has been processed; a day is
+    complete when every expected file was fetched and no listing failed.
+    """
+
+    FILE_NAME = ".fetched.json"
+
+    def __init__(self, previous=()):
+        super(DayRecord, self).__init__()
+        self.previous = set(previous)
+        self.expected = set()
+        self.fetched = set()
+        self.errors = 0
+
+    @staticmethod
+    def load(local_dir):
+        """returns the saved record of a day as dict, or None if there is none"""
+        try:
+            with open(os.path.join(local_dir, DayRecord.FILE_NAME)) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    @staticmethod
+    def resume(local_dir):
+        """returns a new record that knows the files expected by the saved record of the day"""
+        saved = DayRecord.load(local_dir)
+        return DayRecord(saved.get("expected", ()) if saved else ())
+
+    def belongs_here(self, file_name):
+        """tells whether a file was downloaded or expected in this day by an earlier run"""
+        return os.path.exists(file_name) or DayRecord.relative_name(file_name) in self.previous
+
+    @staticmethod
+    def relative_name(file_name):
+        return os.path.join(os.path.basename(os.path.dirname(file_name)), os.path.basename(file_name))
+
+    def expect(self, file_name):
+        self.expected.add(DayRecord.relative_name(file_name))
+
+    def done(self, file_name):
+        self.fetched.add(DayRecord.relative_name(file_name))
+
+    def fail(self):
+        self.errors += 1
+
+    @property
+    def complete(self):
+        return not self.errors and self.expected <= self.fetched
+
+    def save(self, local_dir):
+        marker = os.path.join(local_dir, DayRecord.FILE_NAME)
+        with open(marker + ".part", "w") as f:
+            json.dump({"complete": self.complete,
+                       "errors": self.errors,
+                       "expected": sorted(self.expected),
+                       "fetched": sorted(self.fetched)}, f, indent=1)
+        os.replace(marker + ".part", marker)
+
+    @staticmethod
+    def is_complete(local_dir):
+        saved = DayRecord.load(local_dir)
+        return bool(saved and saved.get("complete"))
+
+
+def _get_text(url, session):
+    request = session.get(url)
+    request.raise_for_status()
+    session.stats.add("bytes", len(request.content))
+    return request.text
+
+
+def get_text(url, session):
+    return session.retry(_get_text, url, session)
+
+
+def _copy_to_file(src_url, file_name, session):
+    part_name = file_name + ".part"
+    request = session.get(src_url, stream=True)
+    try:
         request.raise_for_status()
-        f.write(request.content)
+        with open(part_name, "wb") as f:
+            for chunk in request.iter_content(CHUNK_SIZE):
+                f.write(chunk)
+                session.stats.add("bytes", len(chunk))
+    finally:
+        request.close()
+    os.replace(part_name, file_name)
+
+
+def __copy_to_file__(src_url, file_name, session):
+    session.retry(_copy_to_file, src_url, file_name, session)
+
 
+def fetch_file(src_url, file_name, session, record, resume):
+    """downloads a file unless resuming and a complete copy is already on disk"""
+    record.expect(file_name)
+    if resume and is_complete_xml(file_name):
+        LOG.debug("Keeping [%s]", file_name)
+    else:
+        __copy_to_file__(src_url, file_name, session)
+    record.done(file_name)
 
-def fetch_game(url, path, session, players_fetched):
+
+def fetch_game(url, path, session, players_fetched, record, resume=False):
     LOG.debug("Fetching [%s] …", url)
     try:
-        __copy_to_file__(os.path.join(url, "inning", "inning_all.xml"),
-                         os.path.join(path, "inning_all.xml"),
-                         session)
+        fetch_file(os.path.join(url, "inning", "inning_all.xml"),
+                   os.path.join(path, "inning_all.xml"),
+                   session, record, resume)
 
         for player_type in ["pitchers", "batters"]:
             player_type_url = os.path.join(url, player_type)
-            request = session.get(player_type_url)
-            request.raise_for_status()
-            soup = bs4.BeautifulSoup(request.text, "lxml")
-            for link in soup.find_all("a"):
-                if link.string.strip().startswith("P"):
+            for player_id, href in player_links(get_text(player_type_url, session)):
+                file_name = os.path.join(path, href.split("/")[-1])
+                if resume and record.belongs_here(file_name):
+                    fetch_file(os.path.join(player_type_url, href), file_name, session, record, resume)
                     continue
 
-                player_id = int(
-                    link.get("href").strip().split("/")[-1].split(".")[0])
-                if player_id in players_fetched:
+                if not players_fetched.claim(player_id):
                     continue
 
-                players_fetched.append(player_id)
-                __copy_to_file__(os.path.join(player_type_url, link.get("href").strip()),
-                                 os.path.join(
-                                     path, link.get("href").strip().split("/")[-1]),
-                                 session)
+                success = False
+                try:
+                    fetch_file(os.path.join(player_type_url, href), file_name, session, record, resume)
+                    success = True
+                finally:
+                    players_fetched.release(player_id, success)
     except Exception as e:
+        record.fail()
         LOG.warning("Encountered {}".format(e))
 
 
-def fetch_day(save_path, day, session, players_fetched):
+def day_path(base, day):
+    return os.path.join(base,
+                        "year_%d" % day.year,
+                        "month_%02d" % day.month,
+                        "day_%02d" % day.day)
+
+
+def archive_day(local_dir):
+    """packs a day directory into one compressed archive next to it and removes the directory
+
+    The archive holds the files under their paths relative to the day
+    directory, e.g. ``gid_.../inning_all.xml``, so its index lists games
+    and players the same way the directory did.
+    """
+    archive = local_dir + ARCHIVE_SUFFIX
+    with zipfile.ZipFile(archive + ".part", "w", zipfile.ZIP_DEFLATED) as f:
+        for root, dirs, files in os.walk(local_dir):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith(".part"):
+                    continue
+                path = os.path.join(root, name)
+                f.write(path, os.path.relpath(path, local_dir).replace(os.sep, "/"))
+    os.replace(archive + ".part", archive)
+    shutil.rmtree(local_dir)
+    LOG.info("Archived [%s]", archive)
+
+
+def fetch_day(save_path, day, session, players_fetched, data_url=DATA_URL, resume=False, archive=False):
+    """fetches all games of a day through a ``ThrottledSession``
+
+    Days with a directory or an archive on disk are skipped. With
+    ``resume``, days that are not marked complete are fetched again,
+    downloading only the files that are missing or not well-formed. With
+    ``archive``, complete days are packed by ``archive_day``.
+    """
     LOG.info("Retrieving [%s] …", day)
-    full_url = os.path.join(DATA_URL,
-                            "year_%d" % day.year,
-                            "month_%02d" % day.month,
-                            "day_%02d" % day.day)
-    local_dir = os.path.join(save_path,
-                             "year_%d" % day.year,
-                             "month_%02d" % day.month,
-                             "day_%02d" % day.day)
-
-    if os.path.isdir(local_dir):
+    full_url = day_path(data_url, day)
+    local_dir = day_path(save_path, day)
+
+    if os.path.exists(local_dir + ARCHIVE_SUFFIX):
         return
 
-    os.makedirs(local_dir)
+    if os.path.isdir(local_dir) and DayRecord.is_complete(local_dir):
+        if archive:
+            archive_day(local_dir)
+        return
 
-    day_http = session.get(full_url)
-    soup = bs4.BeautifulSoup(day_http.text, "lxml")
+    if os.path.isdir(local_dir) and not resume:
+        return
 
-    for link in soup.find_all("a"):
-        game_id = link.string.strip()
-        if not game_id.startswith("gid"):
-            continue
+    try:
+        listing = get_text(full_url, session)
+    except requests.exceptions.HTTPError as e:
+        if e.response is None or e.response.status_code != 404:
+            LOG.error("Encountered [%s] while fetching day [%s]", e, day)
+        else:
+            LOG.info("No games on [%s]", day)
+        return
+    except Exception as e:
+        LOG.error("Encountered [%s] while fetching day [%s]", e, day)
+        return
+
+    if not os.path.isdir(local_dir):
+        os.makedirs(local_dir)
 
+    record = DayRecord.resume(local_dir) if resume else DayRecord()
+    for game_id in game_ids(listing):
         game_path = os.path.join(local_dir, game_id)
-        os.makedirs(game_path)
+        if not os.path.isdir(game_path):
+            os.makedirs(game_path)
         fetch_game(os.path.join(full_url, game_id),
                    game_path,
                    session,
-                   players_fetched)
+                   players_fetched,
+                   record,
+                   resume)
+    record.save(local_dir)
 
-    LOG.info("Retrieved [%s]", day)
+    if record.complete:
+        LOG.info("Retrieved [%s]", day)
+        if archive:
+            archive_day(local_dir)
+    else:
+        LOG.warning("Retrieved [%s] incompletely, missing %s", day, sorted(record.expected - record.fetched))
@@ -2,36 +2,127 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import contextlib
+import datetime
+import hashlib
 import logging
 import os
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
 
-import bs4
 import click
-import dateutil.parser
-import math
-import matplotlib
-import matplotlib.pyplot as plt
-import numpy
 import sqlalchemy
-from matplotlib import patches
-from mpl_toolkits.mplot3d import Axes3D, art3d
-from mpl_toolkits.mplot3d.art3d import Line3DCollection
+from lxml import etree
+from sqlalchemy.dialects import mysql, sqlite
 from sqlalchemy.sql import func
 
-from . import entities
-
-matplotlib.rcParams['backend'] = "Qt5Agg"
+from . import defaults, entities, streamparse, summary
+from .querycache import cached
 
 LOG = logging.getLogger(__name__)
 
 
+class PitchBatch(object):
+    """pitches prepared for ``DatabaseManager.add_pitch_batch``
+
+    Holds the rows, the pitcher of every (game_id, at_bat, event_id) key
+    and the summary aggregates of the rows, so worker processes can do this
+    per row work and the process writing to the database only merges
+    batches. The stored pitches of the games in ``replaced`` are replaced
+    by those of the batch.
+    """
+
+    def __init__(self, rows=(), replaced=()):
+        super(PitchBatch, self).__init__()
+        self.rows = []
+        self.keys = {}
+        self.stale = set()
+        self.replaced = set(replaced)
+        self.aggregates = summary.Aggregates(streamparse.PITCHES.names)
+        self.extend(rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def extend(self, rows):
+        """adds pitches given as tuples in ``streamparse.PITCHES`` column order"""
+        game_id, at_bat, event_id, pitcher = (streamparse.PITCHES.index(n)
+                                              for n in ("game_id", "at_bat", "event_id", "pitcher"))
+        for row in rows:
+            self.rows.append(row)
+            if row[game_id] is not None:
+                key = (row[game_id], row[at_bat], row[event_id])
+                if key in self.keys:
+                    # only one of the two gets stored, the database knows which
+                    self.stale.update((self.keys[key], row[pitcher]))
+                    continue
+                self.keys[key] = row[pitcher]
+            self.aggregates.add(row)
+
+    def update(self, other):
+        """adds the pitches of the batch ``other``"""
+        self.rows.extend(other.rows)
+        for key, pitcher in other.keys.items():
+            if key in self.keys:
+                self.stale.update((self.keys[key], pitcher))
+            else:
+                self.keys[key] = pitcher
+        self.stale.update(other.stale)
+        self.replaced.update(other.replaced)
+        self.aggregates.update(other.aggregates)
+
+
+class DigestReader(object):
+    """binary file wrapper that hashes whatever is read through it
+
+    Lets a parser stream a file while its digest is computed, so neither
+    needs the whole file in memory.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, f):
+        super(DigestReader, self).__init__()
+        self.f = f
+        self.digest = hashlib.sha1()
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.digest.update(data)
+        return data
+
+    def hexdigest(self):
+        """returns the digest of the whole file, reading what the parser left"""
+        while self.read(DigestReader.CHUNK_SIZE):
+            pass
+        return self.digest.hexdigest()
+
+
 class DatabaseManager(object):
     """sets up a database and provides convenience functions"""
 
-    def __init__(self, db_path, use_mysql):
+    DEFAULT_BATCH_SIZE = defaults.BATCH_SIZE
+    INT_NULL = -1
+    DEFAULT_PAGE_SIZE = 1000
+    HEATMAP_COLUMNS = ("pitch_type", "px", "pz")
+    HEATMAP_BINS = 24
+    HEATMAP_X_RANGE = (-3.0, 3.0)
+    HEATMAP_Z_RANGE = (-1.0, 6.0)
+    CONFLICT_MODES = defaults.CONFLICT_MODES
+
+    def __init__(self, db_path, use_mysql, query_cache=None):
         super(DatabaseManager, self).__init__()
         self.db_path = db_path
+        self.query_cache = query_cache
+        self.use_mysql = use_mysql
         self.pitch_count = 0
+        self.batch_size = DatabaseManager.DEFAULT_BATCH_SIZE
+        self.rows_written = 0
+        self.insert_time = 0.0
+        self.synchronous = "FULL"
+        self.on_conflict = "ignore"
+        self.modified = False
         if use_mysql:
             myDB = sqlalchemy.engine.url.URL(drivername='mysql',
                                              host='localhost',
@@ -42,11 +133,104 @@ class DatabaseManager(object):
         else:
             self.engine = sqlalchemy.create_engine(
                 'sqlite:///' + self.db_path, echo=False)
+            sqlalchemy.event.listen(self.engine, "connect", self._set_sqlite_pragmas)
         self.setup_db()
         self.session = sqlalchemy.orm.sessionmaker(bind=self.engine)()
 
+    def _set_sqlite_pragmas(self, dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=" + self.synchronous)
+        cursor.close()
+
     def setup_db(self):
+        inspector = sqlalchemy.inspect(self.engine)
+        summaries_missing = inspector.has_table(entities.Pitch.__tablename__) and \
+            not inspector.has_table(entities.PitchSummary.__table__.name)
         entities.Entity.metadata.create_all(self.engine)
+        if summaries_missing:
+            LOG.warning("Table [%s] was created empty, run 'fillbass summarize' to fill it",
+                        entities.PitchSummary.__table__.name)
+        self.upgrade_schema(all_indexes=False)
+
+    def missing_indexes(self):
+        inspector = sqlalchemy.inspect(self.engine)
+        missing = []
+        for table in entities.Entity.metadata.sorted_tables:
+            present = set(i["name"] for i in inspector.get_indexes(table.name))
+            missing.extend(index for index in table.indexes
+                           if index.name not in present and self.is_for_dialect(index))
+        return missing
+
+    def is_for_dialect(self, index):
+        """tells whether ``index`` belongs to the schema of this database, see ``entities.dialect_index``"""
+        dialect = index.info.get("dialect")
+        return dialect is None or dialect == self.engine.dialect.name
+
+    def upgrade_schema(self, all_indexes=True):
+        """adds columns and indexes that databases created by older versions lack
+
+        Building indexes on a large table takes a while, so unless
+        ``all_indexes`` is set only the unique indexes that ingest relies on
+        are built; a warning names the others.
+        """
+        inspector = sqlalchemy.inspect(self.engine)
+        with self.engine.begin() as connection:
+            for table in entities.Entity.metadata.sorted_tables:
+                present = set(c["name"] for c in inspector.get_columns(table.name))
+                for column in table.columns:
+                    if column.name not in present:
+                        LOG.warning("Adding column [%s] to table [%s]", column.name, table.name)
+                        connection.execute(sqlalchemy.text("ALTER TABLE %s ADD COLUMN %s %s" % (
+                            table.name, column.name, column.type.compile(dialect=self.engine.dialect))))
+        for index in self.missing_indexes():
+            if all_indexes or index.unique:
+                LOG.warning("Creating index [%s]", index.name)
+                with self.engine.begin() as connection:
+                    index.create(bind=connection)
+            else:
+                LOG.warning("Index [%s] is missing, run 'fillbass migrate' to build it", index.name)
+        if all_indexes and not self.use_mysql:
+            with self.engine.begin() as connection:
+                connection.execute(sqlalchemy.text("ANALYZE"))
+
+    @contextlib.contextmanager
+    def bulk_load(self, batch_size=None, on_conflict=None):
+        """groups a large import; reports the insert rate when the block is left
+
+        ``on_conflict`` decides what happens to pitches that are already in
+        the database: "ignore" keeps the stored row, "update" overwrites it.
+
+        On SQLite, syncing to disk is switched off until the block is left, so
+        a power loss during the import may lose the data written so far.
+        """
+        self.commit()
+        previous_batch_size = self.batch_size
+        previous_on_conflict = self.on_conflict
+        if batch_size is not None:
+            self.batch_size = batch_size
+        if on_conflict is not None:
+            self.on_conflict = on_conflict
+        if not self.use_mysql:
+            self.synchronous = "OFF"
+            self.engine.dispose()
+        rows_written = self.rows_written
+        insert_time = self.insert_time
+        start = time.time()
+        try:
+            yield self
+            self.commit()
+        finally:
+            self.batch_size = previous_batch_size
+            self.on_conflict = previous_on_conflict
+            if not self.use_mysql:
+                self.session.close()
+                self.synchronous = "FULL"
+                self.engine.dispose()
+            rows = self.rows_written - rows_written
+            seconds = self.insert_time - insert_time
+            LOG.info("Inserted [%i] rows in [%.1f] s, [%.0f] rows/s while inserting, [%.0f] rows/s overall",
+                     rows, seconds, rows / seconds if seconds else 0, rows / (time.time() - start))
 
     def add_at_bat(self, at_bat):
         self.session.add(at_bat)
@@ -65,13 +249,223 @@ class DatabaseManager(object):
         LOG.info("Added {} pitches".format(len(pitches)))
         self.session.add_all(pitches)
 
+    def add_pitch_rows(self, rows):
+        """adds pitches given as tuples in ``streamparse.PITCHES`` column order and updates the summaries"""
+        self.add_pitch_batch(PitchBatch(rows))
+
+    def add_pitch_batch(self, batch):
+        """adds the pitches of the ``PitchBatch`` ``batch`` and updates the summaries
+
+        The stored pitches of the games ``batch.replaced`` are deleted
+        first. The aggregates of the batch are added to the summaries as
+        they are. If the batch replaces pitches, holds pitches that are
+        already stored, or holds a pitch twice, the summaries of the
+        pitchers involved are recomputed from the pitches table instead.
+        """
+        self.pitch_count += len(batch)
+        LOG.info("Added {} pitches".format(len(batch)))
+        stored = self.get_pitch_keys(set(key[0] for key in batch.keys) | batch.replaced)
+        stale = set(batch.stale)
+        if batch.replaced:
+            stale.update(pitcher for key, pitcher in stored.items() if key[0] in batch.replaced)
+            self.delete_pitches(batch.replaced)
+        for key, pitcher in batch.keys.items():
+            if key in stored:
+                stale.update((stored[key], pitcher))
+        self.bulk_insert(streamparse.PITCHES.table, batch.rows, streamparse.PITCHES.names, self.on_conflict)
+        self.update_summaries(batch.aggregates, stale)
+
+    def delete_pitches(self, game_ids):
+        """deletes the stored pitches of ``game_ids``; the summaries are left to the caller"""
+        table = streamparse.PITCHES.table
+        game_ids = sorted(game_ids)
+        for offset in range(0, len(game_ids), 500):
+            self.session.execute(table.delete().where(table.c.game_id.in_(game_ids[offset:offset + 500])))
+        self.modified = True
+
+    def add_player_rows(self, rows, on_conflict="ignore"):
+        """adds players given as tuples in ``streamparse.PLAYERS`` column order"""
+        self.bulk_insert(streamparse.PLAYERS.table, rows, streamparse.PLAYERS.names, on_conflict)
+
+    def bulk_insert(self, table, rows, names=None, on_conflict=None):
+        """inserts rows given as dicts, or as tuples of the columns ``names``, into ``table``
+
+        Rows are written through Core in batches of ``batch_size``, as
+        executemany on SQLite and as multi-row INSERTs on MySQL. Tuples go
+        to SQLite as they are, with the statement compiled once instead of
+        once per row. Rows that collide with the primary key or a unique
+        index fail the insert, unless ``on_conflict`` is "ignore" or "update".
+        ``rows_written`` counts the rows the database reports as written,
+        so ignored rows are left out.
+        """
+        if not rows:
+            return
+        start = time.time()
+        if names is not None and not self.use_mysql:
+            written = self._executemany(table, rows, names, on_conflict)
+        else:
+            written = 0
+            for offset in range(0, len(rows), self.batch_size):
+                batch = rows[offset:offset + self.batch_size]
+                if names is not None:
+                    batch = [dict(zip(names, row)) for row in batch]
+                if self.use_mysql:
+                    result = self.session.execute(self._insert(table, batch[0].keys(), on_conflict, batch))
+                else:
+                    result = self.session.execute(self._insert(table, batch[0].keys(), on_conflict), batch)
+                written += DatabaseManager._written(result, len(batch))
+        self.modified = True
+        self.rows_written += written
+        self.insert_time += time.time() - start
+
+    @staticmethod
+    def _written(result, attempted):
+        return result.rowcount if result.rowcount is not None and result.rowcount >= 0 else attempted
+
+    def _executemany(self, table, rows, names, on_conflict):
+        dialect = self.engine.dialect
+        compiled = self._insert(table, names, on_conflict).compile(dialect=dialect, column_keys=names)
+        order = [names.index(name) for name in compiled.positiontup]
+        processors = [(position, table.c[names[index]].type.dialect_impl(dialect).bind_processor(dialect))
+                      for position, index in enumerate(order)]
+        processors = [(position, processor) for position, processor in processors if processor is not None]
+        connection = self.session.connection()
+        written = 0
+        for offset in range(0, len(rows), self.batch_size):
+            batch = []
+            for row in rows[offset:offset + self.batch_size]:
+                values = [row[index] for index in order]
+                for position, processor in processors:
+                    values[position] = processor(values[position])
+                batch.append(tuple(values))
+            written += DatabaseManager._written(connection.exec_driver_sql(compiled.string, batch), len(batch))
+        return written
+
+    def _insert(self, table, names, on_conflict, values=None):
+        if on_conflict is None:
+            insert = table.insert()
+        elif on_conflict == "ignore":
+            insert = table.insert().prefix_with("IGNORE" if self.use_mysql else "OR IGNORE")
+        elif self.use_mysql:
+            insert = mysql.insert(table).values(values)
+            return insert.on_duplicate_key_update({n: insert.inserted[n] for n in names})
+        else:
+            key = DatabaseManager._natural_key(table)
+            insert = sqlite.insert(table)
+            return insert.on_conflict_do_update(
+                index_elements=key, set_={n: insert.excluded[n] for n in names if n not in key})
+        return insert.values(values) if values is not None else insert
+
+    @staticmethod
+    def _natural_key(table):
+        for index in table.indexes:
+            if index.unique:
+                return [c.name for c in index.columns]
+        return [c.name for c in table.primary_key.columns]
+
+    def get_pitch_keys(self, game_ids):
+        """returns a dict mapping (game_id, at_bat, event_id) of the stored pitches of ``game_ids`` to their pitcher"""
+        pitch = entities.Pitch
+        keys = {}
+        game_ids = sorted(game_ids)
+        for offset in range(0, len(game_ids), 500):
+            query = self.session.query(pitch.game_id, pitch.at_bat, pitch.event_id, pitch.pitcher) \
+                .filter(pitch.game_id.in_(game_ids[offset:offset + 500]))
+            keys.update(((g, a, e), p) for g, a, e, p in query)
+        return keys
+
+    def update_summaries(self, aggregates, stale=()):
+        """adds ``aggregates`` to the stored summaries and recomputes those of the pitchers ``stale``"""
+        table = entities.PitchSummary.__table__
+        stale = set(p for p in stale if p is not None)
+        if stale:
+            aggregates.discard(stale)
+            self.summarize(stale)
+        rows = aggregates.rows()
+        if not rows:
+            return
+        keys = [tuple(row[k] for k in summary.KEY) for row in rows]
+        key_columns = sqlalchemy.tuple_(*(table.c[k] for k in summary.KEY))
+        for offset in range(0, len(keys), 500):
+            batch = keys[offset:offset + 500]
+            stored = self.session.execute(table.select().where(key_columns.in_(batch))).mappings().all()
+            if stored:
+                by_key = {tuple(row[k] for k in summary.KEY): row for row in rows}
+                for row in stored:
+                    summary.combine(by_key[tuple(row[k] for k in summary.KEY)], row)
+                self.session.execute(table.delete().where(key_columns.in_(batch)))
+        self.session.execute(table.insert(), rows)
+
+    def summarize(self, pitchers=None):
+        """recomputes the summaries of ``pitchers``, or all of them, from the pitches table"""
+        table = entities.PitchSummary.__table__
+        self.modified = True
+        delete = table.delete()
+        if pitchers is not None:
+            pitchers = sorted(pitchers)
+            delete = delete.where(table.c.pitcher.in_(pitchers))
+        self.session.execute(delete)
+        select = summary.summary_select(pitchers)
+        self.session.execute(table.insert().from_select([c.name for c in select.selected_columns], select))
+
+    def get_scanned_files(self):
+        """returns a dict mapping the path of every scanned file to its size, mtime and digest"""
+        query = self.session.query(entities.ScannedFile.path,
+                                   entities.ScannedFile.size,
+                                   entities.ScannedFile.mtime_ns,
+                                   entities.ScannedFile.digest)
+        return {path: (size, mtime_ns, digest) for path, size, mtime_ns, digest in query}
+
+    def record_scanned_files(self, files):
+        """adds or replaces manifest entries given as (path, size, mtime_ns, digest) tuples"""
+        if not files:
+            return
+        self.modified = True
+        self.session.query(entities.ScannedFile) \
+            .filter(entities.ScannedFile.path.in_([f[0] for f in files])) \
+            .delete(synchronize_session=False)
+        self.session.execute(entities.ScannedFile.__table__.insert(),
+                             [dict(zip(("path", "size", "mtime_ns", "digest"), f)) for f in files])
+
+    def get_player_ids(self):
+        return set(pid for pid, in self.session.query(entities.Player.pid))
+
     def player_present(self, pid):
         return bool(self.get_player(pid))
 
     def commit(self):
-        self.session.commit()
+        """commits the session, counting up the revision if anything was written"""
+        session = self.session
+        if self.modified or session.new or session.dirty or session.deleted:
+            self.bump_revision()
+            self.modified = False
+            session.commit()
+            if self.query_cache is not None:
+                self.query_cache.clear()
+            return
+        session.commit()
 
-    def get_players(self, first_name=None, last_name=None):
+    def bump_revision(self):
+        table = entities.Revision.__table__
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None, microsecond=0)
+        updated = self.session.execute(table.update().where(table.c.id == 1)
+                                       .values(value=table.c.value + 1, updated=now)).rowcount
+        if not updated:
+            self.session.execute(table.insert().values(id=1, value=1, updated=now))
+
+    def get_revision(self):
+        """returns the revision and the time of the last commit that changed the database, (0, None) if none did
+
+        It is read on a connection of its own, so it reflects commits made
+        by other processes even while the session is in a transaction.
+        """
+        table = entities.Revision.__table__
+        with self.engine.connect() as connection:
+            row = connection.execute(sqlalchemy.select(table.c.value, table.c.updated)
+                                     .where(table.c.id == 1)).first()
+        return (row.value, row.updated) if row is not None else (0, None)
+
+    def players_query(self, first_name=None, last_name=None):
         query = self.session.query(entities.Player)
         if first_name is not None:
             query = query.filter(
@@ -79,35 +473,355 @@ class DatabaseManager(object):
         if last_name is not None:
             query = query.filter(
                 entities.Player.last_name.like(last_name + "%"))
+        return query
 
-        return query.all()
+    @cached
+    def get_players(self, first_name=None, last_name=None):
+        return self.players_query(first_name, last_name).all()
 
+    def player_query(self, id):
+        return self.session.query(entities.Player).filter_by(pid=id)
+
+    @cached
     def get_player(self, id):
-        return self.session.query(entities.Player).filter_by(pid=id).first()
+        return self.player_query(id).first()
 
-    def get_average_for_pitches(self, column, pitcher_id=None, pitch_type=None):
-        query = self.session.query(func.avg(column))
-        if pitcher_id is not None:
+    def get_players_by_ids(self, pids):
+        """returns a dict mapping each of ``pids`` that is a known player to the player"""
+        pids = sorted(set(int(pid) for pid in pids))
+        players = {}
+        for offset in range(0, len(pids), 500):
+            players.update((player.pid, player) for player in
+                           self.session.query(entities.Player).filter(entities.Player.pid.in_(pids[offset:offset + 500])))
+        return players
+
+    def get_pitcher_ids(self, season=None):
+        """returns the ids of all pitchers in the summary table, of a season if given"""
+        query = self.session.query(entities.PitchSummary.pitcher).distinct().order_by(entities.PitchSummary.pitcher)
+        if season is not None:
+            query = query.filter(entities.PitchSummary.season == season)
+        return [pid for pid, in query]
+
+    @staticmethod
+    def filter_pitches(query, pitcher_id=None, pitch_type=None, batter_id=None, season=None):
+        if isinstance(pitcher_id, (list, tuple, set)):
+            query = query.filter(entities.Pitch.pitcher.in_(pitcher_id))
+        elif pitcher_id is not None:
             query = query.filter(entities.Pitch.pitcher == pitcher_id)
         if pitch_type is not None:
             query = query.filter(entities.Pitch.pitch_type.like(pitch_type))
+        if batter_id is not None:
+            query = query.filter(entities.Pitch.batter == batter_id)
+        if season is not None:
+            # a range on the game id rather than summary.season_expression(), so the index on it is used
+            query = query.filter(entities.Pitch.game_id >= "gid_{:04d}".format(int(season)),
+                                 entities.Pitch.game_id < "gid_{:04d}".format(int(season) + 1))
+        return query
+
+    def average_query(self, column, pitcher_id=None, pitch_type=None):
+        return DatabaseManager.filter_pitches(self.session.query(func.avg(column)), pitcher_id, pitch_type)
+
+    @cached
+    def get_average_for_pitches(self, column, pitcher_id=None, pitch_type=None):
+        return self.average_query(column, pitcher_id, pitch_type).one()
 
-        return query.one()
+    def pitches_query(self, pitcher_id=None, pitch_type=None):
+        return DatabaseManager.filter_pitches(self.session.query(entities.Pitch), pitcher_id, pitch_type)
 
+    @cached
     def get_pitches(self, pitcher_id=None, pitch_type=None):
-        query = self.session.query(entities.Pitch)
+        return self.pitches_query(pitcher_id, pitch_type).all()
+
+    def pitch_types_query(self, pitcher_id=None):
+        return DatabaseManager.filter_pitches(self.session.query(entities.Pitch.pitch_type), pitcher_id).distinct()
+
+    @cached
+    def get_pitch_types(self, pitcher_id=None):
+        return self.pitch_types_query(pitcher_id).all()
+
+    def summaries_query(self, pitcher_id=None, pitch_type=None, season=None):
+        query = self.session.query(entities.PitchSummary)
         if pitcher_id is not None:
-            query = query.filter(entities.Pitch.pitcher == pitcher_id)
+            query = query.filter(entities.PitchSummary.pitcher == pitcher_id)
         if pitch_type is not None:
-            query = query.filter(entities.Pitch.pitch_type.like(pitch_type))
+            query = query.filter(entities.PitchSummary.pitch_type.like(pitch_type))
+        if season is not None:
+            query = query.filter(entities.PitchSummary.season == season)
+        return query
 
-        return query.all()
+    def ordered_summaries_query(self, pitcher_id=None, pitch_type=None, season=None):
+        return self.summaries_query(pitcher_id, pitch_type, season) \
+            .order_by(entities.PitchSummary.pitcher, entities.PitchSummary.season, entities.PitchSummary.pitch_type)
 
-    def get_pitch_types(self, pitcher_id=None):
-        query = self.session.query(entities.Pitch.pitch_type)
+    @cached
+    def get_summaries(self, pitcher_id=None, pitch_type=None, season=None):
+        return self.ordered_summaries_query(pitcher_id, pitch_type, season).all()
+
+    def summary_totals_query(self, columns=entities.SUMMARY_COLUMNS, by=summary.KEY,
+                             pitcher_id=None, pitch_type=None, season=None):
+        table = entities.PitchSummary
+        selected = [getattr(table, name) for name in by] + [func.sum(table.count).label("count")]
+        for name in columns:
+            n = func.sum(getattr(table, name + "_n"))
+            total = func.sum(getattr(table, name + "_sum"))
+            selected.extend((n.label(name + "_n"),
+                             (total / func.nullif(n, 0)).label(name + "_mean"),
+                             func.sum(getattr(table, name + "_sumsq")).label(name + "_sumsq"),
+                             func.min(getattr(table, name + "_min")).label(name + "_min"),
+                             func.max(getattr(table, name + "_max")).label(name + "_max")))
+        query = self.summaries_query(pitcher_id, pitch_type, season).with_entities(*selected)
+        if by:
+            query = query.group_by(*(getattr(table, name) for name in by)).order_by(*(getattr(table, name) for name in by))
+        return query
+
+    @cached
+    def get_summary_totals(self, columns=entities.SUMMARY_COLUMNS, by=summary.KEY,
+                           pitcher_id=None, pitch_type=None, season=None):
+        """returns dicts of count, mean, standard deviation, min and max of ``columns`` grouped by ``by``
+
+        The values come from the summary table, so grouping by fewer than all
+        of pitcher, pitch_type and season merges the stored groups.
+        """
+        totals = []
+        for row in self.summary_totals_query(columns, by, pitcher_id, pitch_type, season):
+            row = dict(row._mapping)
+            for name in columns:
+                n, mean = row[name + "_n"], row[name + "_mean"]
+                sumsq = row.pop(name + "_sumsq")
+                row[name + "_std"] = max(0.0, sumsq / n - mean * mean) ** 0.5 if n else None
+            totals.append(row)
+        return totals
+
+    def pitch_type_stats_query(self, columns=entities.SUMMARY_COLUMNS, pitcher_id=None, pitch_type=None,
+                               batter_id=None, season=None):
+        pitch = entities.Pitch
+        pitch_type_ = func.coalesce(pitch.pitch_type, "")
+        selected = [pitch_type_.label("pitch_type"), func.count().label("count")]
+        for name in columns:
+            column = getattr(pitch, name)
+            selected.extend((func.count(column).label(name + "_n"),
+                             func.avg(column).label(name + "_mean"),
+                             func.avg(column * column).label(name + "_meansq"),
+                             func.min(column).label(name + "_min"),
+                             func.max(column).label(name + "_max")))
+        query = self.session.query(*selected)
+        return DatabaseManager.filter_pitches(query, pitcher_id, pitch_type, batter_id, season) \
+            .group_by(pitch_type_).order_by(pitch_type_)
+
+    @cached
+    def get_pitch_type_stats(self, columns=entities.SUMMARY_COLUMNS, pitcher_id=None, pitch_type=None,
+                             batter_id=None, season=None):
+        """returns dicts like ``get_summary_totals`` by pitch type, computed from the pitches
+
+        Unlike the summaries, this can filter by batter.
+        """
+        stats = []
+        for row in self.pitch_type_stats_query(columns, pitcher_id, pitch_type, batter_id, season):
+            row = dict(row._mapping)
+            for name in columns:
+                mean, meansq = row[name + "_mean"], row.pop(name + "_meansq")
+                row[name + "_std"] = max(0.0, meansq - mean * mean) ** 0.5 if mean is not None else None
+            stats.append(row)
+        return stats
+
+    @cached
+    def get_heatmap(self, pitcher_id=None, pitch_type=None, batter_id=None, season=None,
+                    bins=HEATMAP_BINS, x_range=HEATMAP_X_RANGE, z_range=HEATMAP_Z_RANGE):
+        """returns the ``bins`` x ``bins`` histogram of the plate locations px, pz of the matching pitches by pitch type
+
+        ``counts[i][j]`` counts the pitches with px in the i-th and pz in the
+        j-th bin between the edges; pitches outside the ranges are left out.
+        """
+        import numpy
+
+        arrays = self.get_pitch_columns(DatabaseManager.HEATMAP_COLUMNS, pitcher_id=pitcher_id, pitch_type=pitch_type,
+                                        batter_id=batter_id, season=season)
+        located = numpy.isfinite(arrays["px"]) & numpy.isfinite(arrays["pz"])
+        types, inverse = numpy.unique(arrays["pitch_type"][located], return_inverse=True)
+        px, pz = arrays["px"][located], arrays["pz"][located]
+        x_edges = numpy.linspace(x_range[0], x_range[1], bins + 1)
+        z_edges = numpy.linspace(z_range[0], z_range[1], bins + 1)
+        heatmap = {"x_edges": x_edges.tolist(), "z_edges": z_edges.tolist(), "count": int(located.sum()),
+                   "unlocated": int((~located).sum()), "types": {}}
+        for index, t in enumerate(types):
+            selected = inverse == index
+            counts = numpy.histogram2d(px[selected], pz[selected], bins=(x_edges, z_edges))[0].astype(numpy.int64)
+            heatmap["types"][str(t)] = {"count": int(selected.sum()), "counts": counts.tolist()}
+        return heatmap
+
+    @staticmethod
+    def column_dtype(column):
+        """returns the NumPy dtype used for ``column`` by ``get_pitch_columns``"""
+        import numpy
+
+        if isinstance(column.type, sqlalchemy.Float):
+            return numpy.dtype(numpy.float64)
+        if isinstance(column.type, sqlalchemy.Integer):
+            return numpy.dtype(numpy.int64)
+        if isinstance(column.type, sqlalchemy.DateTime):
+            return numpy.dtype("datetime64[us]")
+        return numpy.dtype("U%d" % (getattr(column.type, "length", None) or 50))
+
+    @staticmethod
+    def to_array(values, dtype):
+        """converts one column of a chunk of result rows; NULL becomes NaN, NaT, INT_NULL or ''"""
+        import numpy
+
+        if dtype.kind in "fM":
+            return numpy.array(values, dtype=dtype)
+        if dtype.kind == "i":
+            try:
+                return numpy.array(values, dtype=dtype)
+            except TypeError:
+                return numpy.array([DatabaseManager.INT_NULL if v is None else v for v in values], dtype=dtype)
+        return numpy.array(["" if v is None else v for v in values], dtype=dtype)
+
+    def pitch_columns_query(self, columns, pitcher_id=None, pitch_type=None, batter_id=None, season=None):
+        table = entities.Pitch.__table__
+        return DatabaseManager.filter_pitches(self.session.query(*(table.c[name] for name in columns)),
+                                              pitcher_id, pitch_type, batter_id, season)
+
+    @cached
+    def get_pitch_columns(self, columns, pitcher_id=None, pitch_type=None, structured=False,
+                          chunk_size=DEFAULT_BATCH_SIZE, batter_id=None, season=None):
+        """returns the pitch columns named ``columns`` as a dict of NumPy arrays
+
+        Only the requested columns are selected, and the arrays are built
+        chunk by chunk from the cursor without creating ORM objects. Float
+        columns hold NaN for NULL, integer columns INT_NULL, datetimes NaT
+        and strings ''. With ``structured``, one structured array is
+        returned instead of the dict.
+        """
+        import numpy
+
+        query = self.pitch_columns_query(columns, pitcher_id, pitch_type, batter_id, season)
+        selected = [entities.Pitch.__table__.c[name] for name in columns]
+        dtypes = [DatabaseManager.column_dtype(column) for column in selected]
+        chunks = [[] for _ in selected]
+        for rows in self.iter_rows(query.statement, chunk_size):
+            for chunk, values, dtype in zip(chunks, zip(*rows), dtypes):
+                chunk.append(DatabaseManager.to_array(values, dtype))
+        arrays = {name: numpy.concatenate(chunk) if chunk else numpy.empty(0, dtype)
+                  for name, chunk, dtype in zip(columns, chunks, dtypes)}
+        if not structured:
+            return arrays
+        records = numpy.empty(len(arrays[columns[0]]) if columns else 0,
+                              dtype=[(name, dtype) for name, dtype in zip(columns, dtypes)])
+        for name in columns:
+            records[name] = arrays[name]
+        return records
+
+    @cached
+    def get_pitches_by_type(self, pitcher_id, columns, pitch_type=None, averages=("sz_bot", "sz_top")):
+        """returns the ``columns`` of a pitcher's pitches grouped by pitch type, and the means of ``averages``
+
+        Everything is read in a single query and grouped in memory. The
+        groups map each pitch type to a dict of arrays as returned by
+        ``get_pitch_columns``; the means skip NULL like SQL's AVG and are
+        None if there is no value at all.
+        """
+        arrays = self.get_pitch_columns(DatabaseManager.by_type_columns(columns, averages), pitcher_id=pitcher_id,
+                                        pitch_type=pitch_type)
+        return DatabaseManager.group_by_type(arrays, columns, averages)
+
+    @staticmethod
+    def by_type_columns(columns, averages=()):
+        """returns the names of the columns ``get_pitches_by_type`` reads"""
+        return list(dict.fromkeys(("pitch_type",) + tuple(columns) + tuple(averages)))
+
+    @staticmethod
+    def group_by_type(arrays, columns, averages=()):
+        """splits the ``columns`` of ``arrays`` by pitch type and returns them with the NaN-skipping means of ``averages``"""
+        import numpy
+
+        types, inverse = numpy.unique(arrays["pitch_type"], return_inverse=True)
+        groups = {}
+        for index, t in enumerate(types):
+            selected = inverse == index
+            groups[str(t)] = {name: arrays[name][selected] for name in columns}
+        means = {}
+        for name in averages:
+            values = arrays[name][numpy.isfinite(arrays[name])]
+            means[name] = float(values.mean()) if len(values) else None
+        return groups, means
+
+    @staticmethod
+    def page_select(table, fields, conditions, after=None, limit=DEFAULT_PAGE_SIZE):
+        """returns a select of ``fields`` of at most ``limit`` rows of ``table`` with a primary key after ``after``"""
+        key = list(table.primary_key.columns)[0]
+        select = sqlalchemy.select(*(table.c[name] for name in dict.fromkeys((key.name,) + tuple(fields))))
+        for condition in conditions:
+            select = select.where(condition)
+        if after is not None:
+            select = select.where(key > after)
+        return select.order_by(key).limit(limit)
+
+    def iter_rows(self, select, chunk_size=DEFAULT_BATCH_SIZE):
+        """yields the rows of the Core ``select`` in lists of up to ``chunk_size``, read on a connection of its own"""
+        with self.engine.connect() as connection:
+            result = connection.execution_options(stream_results=True).execute(select)
+            while True:
+                rows = result.fetchmany(chunk_size)
+                if not rows:
+                    return
+                yield rows
+
+    def get_page(self, select):
+        """returns the rows of a ``page_select`` as dicts, read on a connection of its own"""
+        with self.engine.connect() as connection:
+            return [dict(row._mapping) for row in connection.execute(select)]
+
+    def pitch_page_select(self, fields, pitcher_id=None, pitch_type=None, after=None, limit=DEFAULT_PAGE_SIZE):
+        table = entities.Pitch.__table__
+        conditions = []
         if pitcher_id is not None:
-            query = query.filter(entities.Pitch.pitcher == pitcher_id)
-        return query.distinct().all()
+            conditions.append(table.c.pitcher == pitcher_id)
+        if pitch_type is not None:
+            conditions.append(table.c.pitch_type.like(pitch_type))
+        return DatabaseManager.page_select(table, fields, conditions, after, limit)
+
+    @cached
+    def get_pitch_page(self, fields, pitcher_id=None, pitch_type=None, after=None, limit=DEFAULT_PAGE_SIZE):
+        """returns up to ``limit`` pitches with a pid after ``after`` as dicts of ``fields`` and pid"""
+        return self.get_page(self.pitch_page_select(fields, pitcher_id, pitch_type, after, limit))
+
+    def player_page_select(self, fields, pos=None, after=None, limit=DEFAULT_PAGE_SIZE):
+        table = entities.Player.__table__
+        conditions = [table.c.pos == pos] if pos is not None else []
+        return DatabaseManager.page_select(table, fields, conditions, after, limit)
+
+    @cached
+    def get_player_page(self, fields, pos=None, after=None, limit=DEFAULT_PAGE_SIZE):
+        """returns up to ``limit`` players with a pid after ``after`` as dicts of ``fields`` and pid"""
+        return self.get_page(self.player_page_select(fields, pos, after, limit))
+
+    def explain(self, query):
+        """returns the lines of the database's query plan for ``query``, an ORM query or a Core select"""
+        statement = getattr(query, "statement", query)
+        sql = str(statement.compile(dialect=self.engine.dialect, compile_kwargs={"literal_binds": True}))
+        prefix = "EXPLAIN " if self.use_mysql else "EXPLAIN QUERY PLAN "
+        result = self.session.execute(sqlalchemy.text(prefix + sql))
+        return sql, [" | ".join(str(value) for value in row) for row in result]
+
+    def explain_queries(self, pitcher_id, pitch_type, first_name, last_name):
+        """returns (name, sql, plan lines) for the query behind every read method"""
+        queries = [
+            ("get_players", self.players_query(first_name, last_name)),
+            ("get_player", self.player_query(pitcher_id)),
+            ("get_average_for_pitches", self.average_query(entities.Pitch.sz_top, pitcher_id, pitch_type)),
+            ("get_pitches", self.pitches_query(pitcher_id, pitch_type)),
+            ("get_pitch_types", self.pitch_types_query(pitcher_id)),
+            ("get_pitch_columns", self.pitch_columns_query(("px", "pz"), pitcher_id, pitch_type)),
+            ("get_pitches_by_type", self.pitch_columns_query(
+                DatabaseManager.by_type_columns(("px", "pz"), ("sz_bot", "sz_top")), pitcher_id, pitch_type)),
+            ("get_heatmap", self.pitch_columns_query(DatabaseManager.HEATMAP_COLUMNS, pitcher_id, pitch_type)),
+            ("get_summaries", self.ordered_summaries_query(pitcher_id, pitch_type)),
+            ("get_summary_totals", self.summary_totals_query(pitcher_id=pitcher_id, pitch_type=pitch_type)),
+            ("get_pitch_type_stats", self.pitch_type_stats_query(pitcher_id=pitcher_id, pitch_type=pitch_type)),
+            ("get_pitch_page", self.pitch_page_select(("px", "pz", "pitch_type"), pitcher_id, pitch_type, 0)),
+            ("get_player_page", self.player_page_select(("first_name", "last_name"), after=0)),
+        ]
+        return [(name,) + self.explain(query) for name, query in queries]
 
 
 class Parser(object):
@@ -115,13 +829,17 @@ class Parser(object):
 
     import datetime
 
-    def __init__(self, db):
+    ENGINES = defaults.PARSER_ENGINES
+
+    def __init__(self, db, engine="lxml"):
         super(Parser, self).__init__()
         self.db = db
-        self.parsed_players = []
+        self.engine = engine
+        self.parsed_players = set()
 
     PITCH_MAPPINGS = {
-        "result": "type"
+        "result": "type",
+        "event_id": "id"
     }
 
     PLAYER_MAPPINGS = {
@@ -131,7 +849,7 @@ class Parser(object):
     TYPE_TO_FROM_STRING = {
         int: lambda s: int(s),
         float: lambda s: float(s),
-        datetime.datetime: lambda s: dateutil.parser.parse(s)
+        datetime.datetime: streamparse.to_datetime
     }
 
     @staticmethod
@@ -155,111 +873,272 @@ class Parser(object):
                 obj[column.name] = value
         return obj
 
+    def read_game(self, source, game_id=None, name=None):
+        """returns the pitches of a game file, given as path or binary file, as row tuples
+
+        ``game_id`` defaults to the name of the directory holding the file.
+        ``name`` names the file in warnings.
+        """
+        if isinstance(source, str):
+            if game_id is None:
+                game_id = os.path.basename(os.path.dirname(os.path.abspath(source)))
+            with open(source, "rb") as f:
+                return self.read_game(f, game_id, name or source)
+        if self.engine == "bs4":
+            return self.read_game_bs4(source, game_id)
+        return Parser.read_rows(streamparse.iter_pitches(source, game_id), name or game_id)
+
+    def read_players(self, source, name=None):
+        """returns the players of a player file, given as path or binary file, as row tuples"""
+        if isinstance(source, str):
+            with open(source, "rb") as f:
+                return self.read_players(f, name or source)
+        if self.engine == "bs4":
+            return self.read_players_bs4(source)
+        return Parser.read_rows(streamparse.iter_players(source), name)
+
+    @staticmethod
+    def read_rows(rows, name):
+        """returns the rows of a streamparse iterator; only those before the error if the file is not well-formed
+
+        Empty files, e.g. left behind by failed downloads, have no rows
+        rather than failing the scan.
+        """
+        result = []
+        try:
+            result.extend(rows)
+        except etree.XMLSyntaxError as e:
+            LOG.warning("Skipping the rest of [%s], it is not well-formed: [%s]", name, e)
+        return result
+
+    @staticmethod
+    def is_game_file(name):
+        return name.startswith("inning_all") and name.endswith(".xml")
+
+    @staticmethod
+    def is_player_file(name):
+        return name[:1].isdigit() and name.endswith(".xml")
+
+    @staticmethod
+    def is_archive(name):
+        return name.endswith(".zip")
+
+    def read_archive(self, source):
+        """returns the pitch and player rows of a day archive written by ``fetch --archive``
+
+        Members are streamed from the archive into the parser one at a time.
+        """
+        pitches = []
+        players = []
+        with zipfile.ZipFile(source) as archive:
+            for member in archive.namelist():
+                game_id, _, name = member.rpartition("/")
+                if Parser.is_game_file(name):
+                    with archive.open(member) as f:
+                        pitches.extend(self.read_game(f, game_id.split("/")[-1], member))
+                elif Parser.is_player_file(name):
+                    with archive.open(member) as f:
+                        players.extend(self.read_players(f, member))
+        return pitches, players
+
+    def read_directory(self, directory, root, entries):
+        """parses the new or modified files of ``root``
+
+        ``entries`` hold name, size, mtime and the digest recorded by an
+        earlier scan (or None) of each game, player or day archive file.
+        Returns the pitches as ``PitchBatch``, the player rows, the manifest
+        entries for all of the files and the player rows of files scanned
+        before; files whose content did not change are not parsed again.
+        Pitches of files scanned before replace the stored pitches of their
+        games, their players the stored players.
+        """
+        pitches = PitchBatch()
+        players = []
+        files = []
+        updated_players = []
+        for name, size, mtime_ns, known_digest in entries:
+            file_name = os.path.join(root, name)
+            # without an earlier digest the file is hashed while it is parsed, archives need seeking
+            digest = None
+            if known_digest is not None or Parser.is_archive(name):
+                digest = Parser.file_digest(file_name)
+                if digest == known_digest:
+                    LOG.debug("content of [%s] did not change", file_name)
+                    files.append((os.path.relpath(file_name, directory), size, mtime_ns, digest))
+                    continue
+            LOG.debug("now parsing file [%s]", name)
+            file_pitches, file_players, game_ids = [], [], set()
+            with open(file_name, "rb") as f:
+                reader = DigestReader(f)
+                if Parser.is_game_file(name):
+                    game_ids.add(os.path.basename(root))
+                    file_pitches = self.read_game(reader, os.path.basename(root), file_name)
+                elif Parser.is_player_file(name):
+                    file_players = self.read_players(reader, file_name)
+                elif Parser.is_archive(name):
+                    file_pitches, file_players = self.read_archive(f)
+                    game_id = streamparse.PITCHES.index("game_id")
+                    game_ids.update(row[game_id] for row in file_pitches)
+                if digest is None:
+                    digest = reader.hexdigest()
+            if known_digest is None:
+                pitches.extend(file_pitches)
+                players.extend(file_players)
+            else:
+                pitches.update(PitchBatch(file_pitches, game_ids))
+                updated_players.extend(file_players)
+            files.append((os.path.relpath(file_name, directory), size, mtime_ns, digest))
+        return pitches, players, files, updated_players
+
+    @staticmethod
+    def file_digest(file_name):
+        """returns the SHA-1 of a file, read in chunks"""
+        with open(file_name, "rb") as f:
+            return DigestReader(f).hexdigest()
+
+    @staticmethod
+    def changed_directories(directory, manifest):
+        """yields every directory below ``directory`` that holds files which are
+        not in ``manifest`` or whose size or mtime differs from it, together
+        with the entries ``read_directory`` expects for those files
+        """
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            entries = []
+            for name in sorted(files):
+                if not (Parser.is_game_file(name) or Parser.is_player_file(name) or Parser.is_archive(name)):
+                    continue
+                file_name = os.path.join(root, name)
+                stat = os.stat(file_name)
+                known = manifest.get(os.path.relpath(file_name, directory))
+                if known is not None and known[:2] == (stat.st_size, stat.st_mtime_ns):
+                    continue
+                entries.append((name, stat.st_size, stat.st_mtime_ns, known[2] if known else None))
+            if entries:
+                yield root, entries
+
     def parse_game(self, path):
+        self.db.add_pitch_rows(self.read_game(path))
+
+    def parse_player(self, path):
+        self.add_players(self.read_players(path))
+
+    def add_players(self, rows):
+        pid_index = streamparse.PLAYERS.index("pid")
+        players = []
+        for row in rows:
+            pid = row[pid_index]
+            if pid is None or pid in self.parsed_players:
+                continue
+            self.parsed_players.add(pid)
+            players.append(row)
+        self.db.add_player_rows(players)
+
+    def read_game_bs4(self, f, game_id):
+        import bs4
+
         strain_atbats = bs4.SoupStrainer("atbat")
+        names = streamparse.PITCHES.names
         pitches = []
-        with open(path) as f:
-            doc = bs4.BeautifulSoup(f, "xml", parse_only=strain_atbats)
-            for atbat in doc.find_all("atbat"):
-                pitcher = int(atbat["pitcher"])
-                batter = int(atbat["batter"])
-                for pitch in atbat.find_all("pitch"):
-                    try:
-                        pitch_dict = Parser.parse_class(
-                            entities.Pitch, pitch, Parser.PITCH_MAPPINGS)
-                        pitch_dict["pitcher"] = pitcher
-                        pitch_dict["batter"] = batter
-                        pitches.append(entities.Pitch(**pitch_dict))
-                    except Exception as e:
-                        LOG.warning("Encountered error [%s] while parsing a pitch", e)
-            self.db.add_pitches(pitches)
+        doc = bs4.BeautifulSoup(f, "xml", parse_only=strain_atbats)
+        for atbat in doc.find_all("atbat"):
+            at_bat = int(atbat["num"])
+            pitcher = int(atbat["pitcher"])
+            batter = int(atbat["batter"])
+            for pitch in atbat.find_all("pitch"):
+                try:
+                    pitch_dict = Parser.parse_class(
+                        entities.Pitch, pitch, Parser.PITCH_MAPPINGS)
+                    pitch_dict["game_id"] = game_id
+                    pitch_dict["at_bat"] = at_bat
+                    pitch_dict["pitcher"] = pitcher
+                    pitch_dict["batter"] = batter
+                    pitches.append(tuple(pitch_dict.get(name) for name in names))
+                except Exception as e:
+                    LOG.warning("Encountered error [%s] while parsing a pitch", e)
+        return pitches
 
-    def parse_player(self, path):
-        with open(path) as f:
-            doc = bs4.BeautifulSoup(f, "xml")
-            for player in doc.find_all("Player"):
-                if not int(player["id"]) in self.parsed_players:
-                    try:
-                        player_dict = Parser.parse_class(
-                            entities.Player, player, Parser.PLAYER_MAPPINGS)
-                        self.db.add_player(entities.Player(**player_dict))
-                        self.parsed_players.append(int(player["id"]))
-                    except Exception as e:
-                        LOG.warning("Encountered error [%s] while parsing player [%s]", e, int(player["id"]))
-
-    def find_files(self, directory):
-        file_list = list(os.walk(directory))
-        with click.progressbar(file_list, label="Scanning all files", width=0,
-                               item_show_func=lambda x: x[0] if x is not None else None) as file_tuples:
-            for root, _, files in file_tuples:
-                for name in files:
-                    file_name = os.path.join(root, name)
-                    LOG.debug("now parsing file [%s]", name)
-                    if name.startswith("inning_all"):
-                        self.parse_game(file_name)
-                    elif name[:1].isdigit():
-                        self.parse_player(file_name)
-                self.db.commit()
-
-
-class Drawer(object):
-    """draws nice graphs"""
-
-    def __init__(self, db):
-        super(Drawer, self).__init__()
-        self.db = db
+    def read_players_bs4(self, f):
+        import bs4
 
-    def pitches_by_type(self, pitcher, pitch_type=None):
-        pitch_types = self.db.get_pitch_types(pitcher_id=pitcher.pid)
+        names = streamparse.PLAYERS.names
+        players = []
+        doc = bs4.BeautifulSoup(f, "xml")
+        for player in doc.find_all("Player"):
+            try:
+                player_dict = Parser.parse_class(
+                    entities.Player, player, Parser.PLAYER_MAPPINGS)
+                players.append(tuple(player_dict.get(name) for name in names))
+            except Exception as e:
+                LOG.warning("Encountered error [%s] while parsing player [%s]", e, player.get("id"))
+        return players
 
-        fig = plt.figure()
-        ax = fig.add_subplot(111, projection="3d")
+    def store_directory(self, pitches, players, files, updated_players=()):
+        """writes what ``read_directory`` returns in a single transaction
 
-        pitch_count = 0
-        sz_bot = self.db.get_average_for_pitches(entities.Pitch.sz_bot, pitcher.pid, pitch_type)[0]
-        sz_top = self.db.get_average_for_pitches(entities.Pitch.sz_top, pitcher.pid, pitch_type)[0]
+        The manifest entries are only committed together with the rows of
+        their files.
+        """
+        self.add_players(players)
+        self.parsed_players.update(row[streamparse.PLAYERS.index("pid")] for row in updated_players)
+        self.db.add_player_rows(updated_players, "update")
+        self.db.add_pitch_batch(pitches)
+        self.db.record_scanned_files(files)
+        self.db.commit()
 
-        for t in pitch_types:
-            if pitch_type is not None and not t[0] == pitch_type:
-                LOG.info("Type [%s] does not match selected type [%s]", t[0], pitch_type)
-                continue
+    def find_files(self, directory, jobs=1):
+        """parses all files below ``directory`` that were added or modified since the last scan"""
+        self.parsed_players.update(self.db.get_player_ids())
+        changed = Parser.changed_directories(directory, self.db.get_scanned_files())
+        with click.progressbar(changed, label="Scanning all files", width=0,
+                               item_show_func=lambda x: x[0] if x is not None else None) as directories:
+            if jobs > 1:
+                self.find_files_parallel(directory, directories, jobs)
+                return
+            for root, entries in directories:
+                self.store_directory(*self.read_directory(directory, root, entries))
+
+    def find_files_parallel(self, directory, directories, jobs):
+        """parses directories in ``jobs`` worker processes while this process writes the results
+
+        The workers prepare the pitches as ``PitchBatch``; the results of
+        several directories are written together once they hold
+        ``batch_size`` pitches, so the stored keys are looked up and the
+        summaries updated once per write rather than once per directory.
+        """
+        pitches, players, files, updated_players = PitchBatch(), [], [], []
+        for result in self.read_parallel(directory, directories, jobs):
+            pitches.update(result[0])
+            players.extend(result[1])
+            files.extend(result[2])
+            updated_players.extend(result[3])
+            if len(pitches) >= self.db.batch_size:
+                self.store_directory(pitches, players, files, updated_players)
+                pitches, players, files, updated_players = PitchBatch(), [], [], []
+        if files:
+            self.store_directory(pitches, players, files, updated_players)
+
+    def read_parallel(self, directory, directories, jobs):
+        """yields the results of ``read_directory`` for ``directories`` as the ``jobs`` worker processes finish them"""
+        pending = set()
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            for root, entries in directories:
+                pending.add(executor.submit(_read_directory, self.engine, directory, root, entries))
+                if len(pending) >= jobs * 4:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            for future in as_completed(pending):
+                yield future.result()
+
+
+def _read_directory(engine, directory, root, entries):
+    return Parser(None, engine).read_directory(directory, root, entries)
 
-            pitches = self.db.get_pitches(
-                pitcher_id=pitcher.pid, pitch_type=t[0])
-
-            lines = []
-            for pitch in pitches:
-                if pitch.x0 is None or \
-                                pitch.y0 is None or \
-                                pitch.z0 is None or \
-                                pitch.px is None or \
-                                pitch.pz is None or \
-                                pitch.vx0 is None or \
-                                pitch.vy0 is None or \
-                                pitch.vz0 is None or \
-                                pitch.ax is None or \
-                                pitch.ay is None or \
-                                pitch.az is None:
-                    continue
 
-                t_to_catcher = (- pitch.vy0 - math.sqrt((pitch.vy0**2)-2*pitch.ay*(pitch.y0-0))) / pitch.ay
-                pitch_line = [(pitch.x0 + pitch.vx0 * t + pitch.ax * t**2 / 2,
-                               pitch.y0 + pitch.vy0 * t + pitch.ay * t**2 / 2,
-                               pitch.z0 + pitch.vz0 * t + pitch.az * t**2 / 2)
-                              for t in numpy.linspace(0, t_to_catcher)]
-                lines.append(pitch_line)
-            ax.add_collection(Line3DCollection(lines, label=t[0], linewidths=1, alpha=0.5, colors=next(ax._get_lines.prop_cycler)['color']))
-
-            pitch_count += len(pitches)
-
-        strikezone = patches.Rectangle((-0.7083, sz_bot), 0.7083 * 2, sz_top - sz_bot, fill=False, label="Strikezone")
-
-        ax.add_patch(strikezone)
-        art3d.pathpatch_2d_to_3d(strikezone, z=1.417, zdir="y")
-        ax.set_xlim(-0.7083 * 4, 0.7083 * 4)
-        ax.set_ylim(0, 50)
-        ax.set_zlim(-1, sz_top * 2)
-        ax.set_title("Pitch Location by type for " + str(pitcher))
-        ax.legend()
-        LOG.info("Evaluated [%i] pitches", pitch_count)
-        plt.show(block=True)
+def __getattr__(name):
+    # Drawer moved to the drawing module, which loads matplotlib
+    if name == "Drawer":
+        from .drawing import Drawer
+        return Drawer
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
@@ -0,0 +1,164 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""on-disk cache of the pitch columns of single pitchers
+
+Every cached pitcher is a directory holding one .npy file per column,
+which is opened memory mapped. ``index.json`` records the database
+revision the entries were read at, their size and when they were last
+used. Hits only update the latter in memory, the index is written when
+entries are added or removed. Entries of an older revision are dropped, and the least recently
+used pitchers are evicted once the cache grows beyond its size limit.
+"""
+
+import json
+import logging
+import os
+import shutil
+import time
+
+import numpy
+
+from .parsedata import DatabaseManager
+
+LOG = logging.getLogger(__name__)
+
+
+class PitchCache(object):
+    """per-pitcher .npy files below ``path`` taking up at most ``max_bytes``"""
+
+    INDEX_FILE = "index.json"
+    DEFAULT_MAX_BYTES = 512 * 2 ** 20
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        super(PitchCache, self).__init__()
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.index = self.load_index()
+
+    def load_index(self):
+        try:
+            with open(os.path.join(self.path, PitchCache.INDEX_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"revision": None, "entries": {}}
+
+    def save_index(self):
+        file_name = os.path.join(self.path, PitchCache.INDEX_FILE)
+        with open(file_name + ".part", "w") as f:
+            json.dump(self.index, f)
+        os.replace(file_name + ".part", file_name)
+
+    def size(self):
+        return sum(entry["bytes"] for entry in self.index["entries"].values())
+
+    def validate(self, revision):
+        """drops all entries if they were read at another revision than ``revision``"""
+        if self.index["revision"] != revision:
+            if self.index["entries"]:
+                LOG.info("Dropping pitch cache of revision [%s], database is at [%s]", self.index["revision"], revision)
+            self.clear()
+            self.index["revision"] = revision
+            self.save_index()
+
+    def clear(self):
+        for key in list(self.index["entries"]):
+            self.remove(key)
+
+    def remove(self, key):
+        self.index["entries"].pop(key, None)
+        shutil.rmtree(os.path.join(self.path, key), ignore_errors=True)
+
+    def get(self, pitcher_id, columns):
+        """returns the ``columns`` of a pitcher as read-only memory mapped arrays, None if any is not cached"""
+        key = str(int(pitcher_id))
+        entry = self.index["entries"].get(key)
+        if entry is None or not set(columns) <= set(entry["columns"]):
+            self.misses += 1
+            return None
+        try:
+            arrays = {name: numpy.load(os.path.join(self.path, key, name + ".npy"), mmap_mode="r")
+                      for name in columns}
+        except (OSError, ValueError) as e:
+            LOG.warning("Dropping broken cache entry [%s]: [%s]", key, e)
+            self.remove(key)
+            self.save_index()
+            self.misses += 1
+            return None
+        entry["used"] = time.time()
+        self.hits += 1
+        return arrays
+
+    def put(self, pitcher_id, arrays):
+        """stores the dict of arrays ``arrays`` as the entry of a pitcher, replacing the one it had"""
+        key = str(int(pitcher_id))
+        part_path = os.path.join(self.path, key + ".part")
+        shutil.rmtree(part_path, ignore_errors=True)
+        os.makedirs(part_path)
+        for name, array in arrays.items():
+            numpy.save(os.path.join(part_path, name + ".npy"), numpy.ascontiguousarray(array))
+        self.remove(key)
+        os.replace(part_path, os.path.join(self.path, key))
+        self.index["entries"][key] = {"columns": sorted(arrays),
+                                      "bytes": sum(array.nbytes for array in arrays.values()),
+                                      "used": time.time()}
+        self.evict(keep=key)
+        self.save_index()
+
+    def evict(self, keep=None):
+        """removes the least recently used entries other than ``keep`` until the cache fits ``max_bytes``"""
+        entries = self.index["entries"]
+        size = self.size()
+        for key in sorted(entries, key=lambda k: entries[k]["used"]):
+            if size <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            LOG.debug("Evicting pitcher [%s] from the pitch cache", key)
+            size -= entries[key]["bytes"]
+            self.remove(key)
+
+
+class CachedDatabase(object):
+    """a DatabaseManager whose reads of single pitchers are served from a PitchCache
+
+    All other attributes are those of the wrapped DatabaseManager.
+    """
+
+    def __init__(self, db, cache):
+        super(CachedDatabase, self).__init__()
+        self.db = db
+        self.cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+
+    def get_pitch_columns(self, columns, pitcher_id=None, pitch_type=None, structured=False, **kwargs):
+        """same as ``DatabaseManager.get_pitch_columns``; arrays are read-only when the filter allows it"""
+        if pitcher_id is None or isinstance(pitcher_id, (list, tuple, set)) or structured or kwargs or \
+                (pitch_type is not None and ("%" in pitch_type or "_" in pitch_type)):
+            return self.db.get_pitch_columns(columns, pitcher_id, pitch_type, structured, **kwargs)
+
+        self.cache.validate(self.db.get_revision()[0])
+        names = list(dict.fromkeys(("pitch_type",) + tuple(columns)))
+        arrays = self.cache.get(pitcher_id, names)
+        if arrays is None:
+            entry = self.cache.index["entries"].get(str(int(pitcher_id)))
+            if entry is not None:
+                names = list(dict.fromkeys(names + entry["columns"]))
+            arrays = self.db.get_pitch_columns(names, pitcher_id=pitcher_id)
+            self.cache.put(pitcher_id, arrays)
+        if pitch_type is None:
+            return {name: arrays[name] for name in columns}
+        selected = numpy.char.upper(arrays["pitch_type"]) == pitch_type.upper()
+        return {name: arrays[name][selected] for name in columns}
+
+    def get_pitches_by_type(self, pitcher_id, columns, pitch_type=None, averages=("sz_bot", "sz_top")):
+        names = list(dict.fromkeys(("pitch_type",) + tuple(columns) + tuple(averages)))
+        arrays = self.get_pitch_columns(names, pitcher_id=pitcher_id, pitch_type=pitch_type)
+        return DatabaseManager.group_by_type(arrays, columns, averages)
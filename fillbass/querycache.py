@@ -0,0 +1,132 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""in-process cache of the results of DatabaseManager reads
+
+Reads decorated with ``cached`` look up their result in the manager's
+``query_cache``, keyed by the method name and its arguments. Any object
+with ``lookup``, ``store`` and ``clear`` can serve as cache; ``QueryCache``
+evicts by least recent use, age and total size.
+"""
+
+import collections
+import functools
+import sys
+import threading
+import time
+
+
+def _is_array(value):
+    # without numpy loaded there are no arrays, and this module does not load it
+    numpy = sys.modules.get("numpy")
+    return numpy is not None and isinstance(value, numpy.ndarray)
+
+
+def sizeof(value, depth=3):
+    """estimates the number of bytes held by ``value``"""
+    if _is_array(value):
+        return value.nbytes + 128
+    size = sys.getsizeof(value, 64)
+    if depth <= 0:
+        return size
+    if isinstance(value, dict):
+        return size + sum(sizeof(k, depth - 1) + sizeof(v, depth - 1) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return size + sum(sizeof(v, depth - 1) for v in value)
+    if hasattr(value, "__dict__"):
+        return size + sizeof(vars(value), depth - 1)
+    return size
+
+
+def _read_only(value):
+    if _is_array(value):
+        value.flags.writeable = False
+    elif isinstance(value, dict):
+        for v in value.values():
+            _read_only(v)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            _read_only(v)
+
+
+class QueryCache(object):
+    """thread-safe LRU cache holding at most ``max_bytes`` of results for at most ``ttl`` seconds"""
+
+    DEFAULT_MAX_BYTES = 64 * 2 ** 20
+    DEFAULT_TTL = 300.0
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL):
+        super(QueryCache, self).__init__()
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def lookup(self, key):
+        """returns (True, result) if ``key`` is cached and fresh, (False, None) otherwise"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[2] < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[0]
+
+    def store(self, key, value):
+        size = sizeof(key) + sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (value, size, time.monotonic() + self.ttl)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        self.size -= self.entries.pop(key)[1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def summary(self):
+        return "{} hits, {} misses, {} evictions, {} entries ({:.1f} MiB)".format(
+            self.hits, self.misses, self.evictions, len(self.entries), self.size / 2.0 ** 20)
+
+
+def cached(method):
+    """serves calls of a DatabaseManager read from its ``query_cache`` if it has one
+
+    NumPy arrays in cached results are made read-only, as every caller
+    gets the same objects. Calls with unhashable arguments are not cached.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        cache = self.query_cache
+        if cache is None:
+            return method(self, *args, **kwargs)
+        key = (method.__name__, args, tuple(sorted(kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            return method(self, *args, **kwargs)
+        found, value = cache.lookup(key)
+        if not found:
+            value = method(self, *args, **kwargs)
+            _read_only(value)
+            cache.store(key, value)
+        return value
+    return wrapper
@@ -0,0 +1,104 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""headless rendering of pitches by type charts to image files
+
+The pitches of many pitchers are read with one query per batch of
+pitchers and split in memory. Charts are drawn by worker processes on
+the Agg canvas, without pyplot, and every worker reuses one figure for all
+of its charts.
+"""
+
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from mpl_toolkits.mplot3d import Axes3D
+
+from . import defaults, trajectory
+from .drawing import Drawer
+from .parsedata import DatabaseManager
+
+FORMATS = defaults.CHART_FORMATS
+BATCH_SIZE = 100
+FIGURE_SIZE = (8, 6)
+DPI = defaults.DPI
+
+LOG = logging.getLogger(__name__)
+
+_figure = None
+
+
+def _init_worker(figure_size=FIGURE_SIZE, dpi=DPI):
+    global _figure
+    _figure = Figure(figsize=figure_size, dpi=dpi)
+    FigureCanvasAgg(_figure)
+
+
+def draw_chart(file_name, title, groups, means, lod=None):
+    """draws one chart into the figure of this process and saves it as ``file_name``, returns the pitches drawn"""
+    if _figure is None:
+        _init_worker()
+    _figure.clear()
+    ax = _figure.add_subplot(111, projection="3d")
+    pitch_count = Drawer.draw_pitches_by_type(ax, title, groups, means, lod)
+    _figure.savefig(file_name)
+    return file_name, pitch_count
+
+
+def split_by_pitcher(arrays):
+    """yields (pitcher id, arrays of that pitcher) for arrays holding the pitches of several pitchers"""
+    order = numpy.argsort(arrays["pitcher"], kind="stable")
+    pitchers = arrays["pitcher"][order]
+    bounds = numpy.flatnonzero(numpy.diff(pitchers)) + 1
+    for indexes in numpy.split(order, bounds):
+        if len(indexes):
+            yield int(arrays["pitcher"][indexes[0]]), {name: values[indexes] for name, values in arrays.items()}
+
+
+def charts(db, pitcher_ids, pitch_types=(None,), out_dir=".", fmt="png", batch_size=BATCH_SIZE):
+    """yields the arguments of ``draw_chart`` for every pitcher and every pitch type in ``pitch_types``
+
+    None in ``pitch_types`` stands for one chart of all types.
+    """
+    names = ("pitcher", "pitch_type") + trajectory.REQUIRED_COLUMNS + ("sz_bot", "sz_top")
+    pitcher_ids = [int(pid) for pid in pitcher_ids]
+    for offset in range(0, len(pitcher_ids), batch_size):
+        batch = pitcher_ids[offset:offset + batch_size]
+        players = db.get_players_by_ids(batch)
+        arrays = db.get_pitch_columns(names, pitcher_id=batch)
+        for pid, columns in split_by_pitcher(arrays):
+            for pitch_type in pitch_types:
+                if pitch_type is None:
+                    selected = columns
+                else:
+                    matches = numpy.char.upper(columns["pitch_type"]) == pitch_type.upper()
+                    selected = {name: values[matches] for name, values in columns.items()}
+                groups, means = DatabaseManager.group_by_type(selected, trajectory.REQUIRED_COLUMNS,
+                                                              ("sz_bot", "sz_top"))
+                player = players.get(pid, pid)
+                title = "Pitch Location by type for {}".format(player)
+                suffix = "" if pitch_type is None else "_" + pitch_type
+                yield os.path.join(out_dir, "{}{}.{}".format(pid, suffix, fmt)), title, groups, means
+
+
+def render(db, pitcher_ids, out_dir, fmt="png", pitch_types=(None,), jobs=None,
+           figure_size=FIGURE_SIZE, dpi=DPI, lod=None):
+    """renders the charts of ``charts`` with ``jobs`` worker processes, yields (file name, pitches in the chart)
+
+    ``lod`` is the ``trajectory.LevelOfDetail`` of all charts.
+    """
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(figure_size, dpi)) as executor:
+        pending = []
+        for args in charts(db, pitcher_ids, pitch_types, out_dir, fmt):
+            pending.append(executor.submit(draw_chart, *args, lod=lod))
+            if len(pending) >= executor._max_workers * 4:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
@@ -6,7 +6,7 @@ from eve_sqlalchemy.validation import ValidatorSQL
 # Eve-SQLAlchemy imports
 from eve_sqlalchemy.decorators import registerSchema
 
-import entities
+from fillbass import api, entities
 
 registerSchema('player')(entities.Player)
 registerSchema('pitch')(entities.Pitch)
@@ -14,6 +14,7 @@ registerSchema('pitch')(entities.Pitch)
 SETTINGS = {
     'DEBUG': True,
     'SQLALCHEMY_DATABASE_URI': 'sqlite:///./fillbass.db',
+    'FILLBASS_DATABASE': './fillbass.db',
     'DOMAIN': {
         'people': entities.Player._eve_schema['player'],
         'pitch': entities.Pitch._eve_schema['pitch']
@@ -23,6 +24,7 @@ SETTINGS = {
 print(entities.Player._eve_schema['player'])
 
 app = Eve(auth=None, settings=SETTINGS, validator=ValidatorSQL, data=SQL)
+app.register_blueprint(api.blueprint)
 
 # bind SQLAlchemy
 db = app.data.driver
@@ -4,17 +4,14 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import logging
+import os
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 import click
-import requests
-from requests.adapters import HTTPAdapter
-from tabulate import tabulate
 
-from fillbass.entities import Player
-from fillbass.fetchdata import fetch_day
-from fillbass.parsedata import DatabaseManager, Parser, Drawer
+from fillbass import defaults
+from fillbass.querycache import QueryCache
 
 ONE_DAY = timedelta(days=1)
 LOG = logging.getLogger(__name__)
@@ -28,8 +25,21 @@ CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
                       using scan. Defaults to 'fillbass.db'""")
 @click.option("--mysql/--no-mysql", default=False, help="""Use MySQL as database.
 If True, database access needs to be configured via ~/.my.cnf. If False, use sqlite. Default to False.""")
+@click.option("--columnar", metavar="PATH", type=click.Path(exists=True, file_okay=False), default=None,
+              help="""read players and pitches from the export in PATH written by export-columnar instead
+              of the database (list, pitches-by). Needs pyarrow.""")
+@click.option("--pitch-cache", metavar="DIR", type=click.Path(file_okay=False, writable=True), default=None,
+              help="""keep the pitches of the pitchers shown by pitches-by as memory mapped files in DIR, so
+              showing them again does not query the database. The cache is dropped whenever the database changes.""")
+@click.option("--pitch-cache-size", metavar="MIB", type=click.IntRange(min=1), default=512,
+              help="""evict the least recently used pitchers once the pitch cache exceeds MIB MiB. Defaults to 512.""")
+@click.option("--query-cache-size", metavar="MIB", type=click.IntRange(min=0), default=64,
+              help="""keep the results of up to MIB MiB of repeated reads in memory, 0 disables it. Defaults to 64.""")
+@click.option("--query-cache-ttl", metavar="SECONDS", type=click.FloatRange(min=0), default=300,
+              help="""forget cached read results after SECONDS, so changes made by other processes show up.
+              Changes made by this process clear the cache right away. Defaults to 300.""")
 @click.pass_context
-def cli(ctx, verbose, database, mysql):
+def cli(ctx, verbose, database, mysql, columnar, pitch_cache, pitch_cache_size, query_cache_size, query_cache_ttl):
     ctx.obj = {}
     log_level = logging.ERROR
 
@@ -42,6 +52,34 @@ def cli(ctx, verbose, database, mysql):
 
     ctx.obj["DATABASE"] = database
     ctx.obj["MYSQL"] = mysql
+    ctx.obj["COLUMNAR"] = columnar
+    ctx.obj["PITCH_CACHE"] = pitch_cache
+    ctx.obj["PITCH_CACHE_SIZE"] = pitch_cache_size * 2 ** 20
+    ctx.obj["QUERY_CACHE"] = QueryCache(query_cache_size * 2 ** 20, query_cache_ttl) if query_cache_size else None
+
+
+def reader(ctx):
+    """returns the object serving reads, the columnar store if one was given and the database otherwise"""
+    if ctx.obj["COLUMNAR"] is not None:
+        if "COLUMNAR_STORE" not in ctx.obj:
+            try:
+                from fillbass.columnar import ColumnarStore
+            except ImportError as e:
+                raise click.ClickException("Reading a columnar export needs pyarrow ({})".format(e))
+            ctx.obj["COLUMNAR_STORE"] = ColumnarStore(ctx.obj["COLUMNAR"])
+        return ctx.obj["COLUMNAR_STORE"]
+    from fillbass.parsedata import DatabaseManager
+
+    if "DB_MANAGER" not in ctx.obj:
+        ctx.obj["DB_MANAGER"] = DatabaseManager(ctx.obj["DATABASE"], ctx.obj["MYSQL"], ctx.obj["QUERY_CACHE"])
+    if ctx.obj["PITCH_CACHE"] is not None:
+        if "CACHED_DB" not in ctx.obj:
+            from fillbass.pitchcache import CachedDatabase, PitchCache
+
+            ctx.obj["CACHED_DB"] = CachedDatabase(ctx.obj["DB_MANAGER"],
+                                                  PitchCache(ctx.obj["PITCH_CACHE"], ctx.obj["PITCH_CACHE_SIZE"]))
+        return ctx.obj["CACHED_DB"]
+    return ctx.obj["DB_MANAGER"]
 
 
 @cli.command(help="Downloads XML files describing all games in the specified time-frame")
@@ -54,37 +92,247 @@ def cli(ctx, verbose, database, mysql):
 @click.option("-j", "--jobs", metavar="COUNT", help="""use COUNT jobs for downloading. If not given,
 it will default to the number of processors on the machine, multiplied by 5.""", type=click.IntRange(min=1),
               default=None)
+@click.option("--engine", type=click.Choice(["threads", "async"]), default="threads",
+              help="""'threads' fetches one day per thread, 'async' fetches all games and players of all
+              days concurrently with at most COUNT requests at a time. 'async' needs aiohttp.
+              Defaults to 'threads'.""")
+@click.option("--data-url", help="""fetch from this mirror of the gd2 game directory. Defaults to {}"""
+              .format(defaults.DATA_URL), default=defaults.DATA_URL)
+@click.option("--resume", is_flag=True, help="""complete days that were not fetched completely before,
+              downloading only missing or truncated files. Without it, days that have a directory are skipped.""")
+@click.option("--archive", is_flag=True, help="""store each completely fetched day as one compressed
+              'day_DD.zip' instead of a directory of loose files. Complete days fetched before are packed too;
+              days fetched by versions without completion markers need --resume.""")
+@click.option("--max-rps", metavar="RATE", type=click.FloatRange(min=0, min_open=True), default=None,
+              help="""send at most RATE requests per second. Unlimited if not given.""")
+@click.option("--retries", metavar="COUNT", type=click.IntRange(min=0), default=3,
+              help="""retry failed requests up to COUNT times with exponential backoff. Defaults to 3.""")
 @click.argument("save_path", nargs=1, type=click.Path(exists=False, file_okay=False, dir_okay=True, writable=True),
                 default="data")
-def fetch(start_date, end_date, jobs, save_path):
+def fetch(start_date, end_date, jobs, engine, data_url, resume, archive, max_rps, retries, save_path):
+    from requests.adapters import HTTPAdapter
+
+    from fillbass.fetchdata import PlayerRegistry, ThrottledSession, fetch_day
+    from fillbass.throttle import FetchStats, RetryPolicy, TokenBucket
+
     start_date = datetime.strptime(start_date, "%d/%m/%Y").date()
     end_date = datetime.strptime(end_date, "%d/%m/%Y").date()
 
-    players_fetched = []
+    if not os.path.isdir(save_path):
+        os.makedirs(save_path)
+    players_fetched = PlayerRegistry(os.path.join(save_path, PlayerRegistry.FILE_NAME))
+    bucket = TokenBucket(max_rps) if max_rps is not None else None
+    policy = RetryPolicy(retries)
+    stats = FetchStats()
 
-    with requests.Session() as session:
+    if engine == "async":
+        try:
+            from fillbass.asyncfetch import AsyncFetcher
+        except ImportError as e:
+            raise click.ClickException("The async engine needs aiohttp ({})".format(e))
+        days = [start_date + i * ONE_DAY for i in range((end_date - start_date).days + 1)]
+        AsyncFetcher(save_path, jobs or (os.cpu_count() or 1) * 5, players_fetched, data_url, resume,
+                     bucket, policy, stats, archive).run(days)
+        click.echo(stats.summary())
+        return
+
+    with ThrottledSession(bucket, policy, stats) as session:
         with ThreadPoolExecutor(max_workers=jobs) as executor:
             adapter = HTTPAdapter(pool_connections=executor._max_workers * 2, pool_block=True)
             session.mount("http://", adapter)
             while start_date <= end_date:
                 try:
                     executor.submit(fetch_day, save_path, start_date, session,
-                                    players_fetched)
+                                    players_fetched, data_url, resume, archive)
                 except Exception as e:
                     LOG.error("Encountered [%s] while fetching day [%s]", e, start_date)
                 finally:
                     start_date += ONE_DAY
+    click.echo(stats.summary())
 
 
 @cli.command(help="scan and parse a directory tree for XML files")
+@click.option("--engine", type=click.Choice(defaults.PARSER_ENGINES), default="lxml",
+              help="""XML parser to use. 'lxml' streams each file, 'bs4' is the old BeautifulSoup
+              based parser. Defaults to 'lxml'.""")
+@click.option("-j", "--jobs", metavar="COUNT", help="""parse with COUNT worker processes while the main
+process writes to the database. Defaults to 1.""", type=click.IntRange(min=1), default=1)
+@click.option("--batch-size", metavar="ROWS", help="""insert ROWS rows per statement. Defaults to %d."""
+              % defaults.BATCH_SIZE, type=click.IntRange(min=1), default=None)
+@click.option("--on-duplicate", type=click.Choice(defaults.CONFLICT_MODES), default="ignore",
+              help="""what to do with pitches of new files that are already in the database. 'ignore'
+              keeps the stored pitch, 'update' overwrites it with the parsed one. Files that changed since
+              they were scanned always replace the pitches stored for their games. Defaults to 'ignore'.""")
 @click.argument("directory", nargs=1, type=click.Path(exists=True, file_okay=False), default="data")
 @click.pass_context
-def scan(ctx, directory):
+def scan(ctx, engine, jobs, batch_size, on_duplicate, directory):
+    from fillbass.parsedata import DatabaseManager, Parser
+
     if "DB_MANAGER" not in ctx.obj:
-        ctx.obj["DB_MANAGER"] = DatabaseManager(ctx.obj["DATABASE"], ctx.obj["MYSQL"])
+        ctx.obj["DB_MANAGER"] = DatabaseManager(ctx.obj["DATABASE"], ctx.obj["MYSQL"], ctx.obj["QUERY_CACHE"])
     db_manager = ctx.obj["DB_MANAGER"]
-    parser = Parser(db_manager)
-    parser.find_files(directory)
+    parser = Parser(db_manager, engine)
+    with db_manager.bulk_load(batch_size, on_duplicate):
+        parser.find_files(directory, jobs)
+    if db_manager.insert_time:
+        click.echo("Inserted {} rows in {:.1f} s ({:.0f} rows/s)".format(
+            db_manager.rows_written, db_manager.insert_time, db_manager.rows_written / db_manager.insert_time))
+
+
+@cli.command(help="add the columns and build the indexes that databases created by older versions lack")
+@click.pass_context
+def migrate(ctx):
+    from fillbass.parsedata import DatabaseManager
+
+    if "DB_MANAGER" not in ctx.obj:
+        ctx.obj["DB_MANAGER"] = DatabaseManager(ctx.obj["DATABASE"], ctx.obj["MYSQL"], ctx.obj["QUERY_CACHE"])
+    db_manager = ctx.obj["DB_MANAGER"]
+    missing = db_manager.missing_indexes()
+    db_manager.upgrade_schema()
+    click.echo("Built {} indexes".format(len(missing)))
+
+
+@cli.command(help="recompute the per pitcher, pitch type and season summaries from all pitches")
+@click.pass_context
+def summarize(ctx):
+    from fillbass.parsedata import DatabaseManager
+
+    if "DB_MANAGER" not in ctx.obj:
+        ctx.obj["DB_MANAGER"] = DatabaseManager(ctx.obj["DATABASE"], ctx.obj["MYSQL"], ctx.obj["QUERY_CACHE"])
+    db_manager = ctx.obj["DB_MANAGER"]
+    db_manager.summarize()
+    db_manager.commit()
+    click.echo("Stored {} summaries".format(db_manager.summaries_query().count()))
+
+
+@cli.command(help="show pitch counts and averages by pitch type and season")
+@click.argument("player_id", type=str, required=False, nargs=1, default=None)
+@click.option("-p", "--pitch-type", help="""only show pitches of this type""", type=str, default=None)
+@click.option("-s", "--season", help="""only show this season""", type=int, default=None)
+@click.option("--by", type=click.Choice(["pitch_type", "season"]), multiple=True, default=("pitch_type", "season"),
+              help="""group by these keys. Defaults to both pitch_type and season.""")
+@click.pass_context
+def summary(ctx, player_id, pitch_type, season, by):
+    if player_id is None and "CURRENT_PLAYER" in ctx.obj:
+        player_id = ctx.obj["CURRENT_PLAYER"].pid
+
+    from tabulate import tabulate
+
+    from fillbass.parsedata import DatabaseManager
+
+    if "DB_MANAGER" not in ctx.obj:
+        ctx.obj["DB_MANAGER"] = DatabaseManager(ctx.obj["DATABASE"], ctx.obj["MYSQL"], ctx.obj["QUERY_CACHE"])
+    db_manager = ctx.obj["DB_MANAGER"]
+    columns = ("start_speed", "spin_rate", "pfx_x", "pfx_z")
+    by = (("pitcher",) if player_id is None else ()) + tuple(by)
+    totals = db_manager.get_summary_totals(columns, by, player_id, pitch_type, season)
+    click.echo(tabulate([{k: v for k, v in row.items() if k in by or k == "count" or k.endswith("_mean")}
+                         for row in totals], headers="keys", floatfmt=".1f"))
+
+
+@cli.command(help="write all players and pitches to PATH as Parquet files, pitches partitioned by season")
+@click.argument("path", nargs=1, type=click.Path(file_okay=False, writable=True), default="columnar")
+@click.pass_context
+def export_columnar(ctx, path):
+    try:
+        from fillbass.columnar import export
+    except ImportError as e:
+        raise click.ClickException("Exporting needs pyarrow ({})".format(e))
+
+    from fillbass.parsedata import DatabaseManager
+
+    if "DB_MANAGER" not in ctx.obj:
+        ctx.obj["DB_MANAGER"] = DatabaseManager(ctx.obj["DATABASE"], ctx.obj["MYSQL"], ctx.obj["QUERY_CACHE"])
+    db_manager = ctx.obj["DB_MANAGER"]
+    players, pitches = export(db_manager, path)
+    click.echo("Exported {} players and {} pitches to {}".format(players, pitches, path))
+
+
+@cli.command(help="print the query plan of every query used to read the database")
+@click.argument("player_id", type=str, required=False, nargs=1, default=None)
+@click.option("-p", "--pitch-type", help="""pitch type to filter by""", type=str, default="FF")
+@click.option("-f", "--first-name", help="""first name to filter by""", type=str, default=None)
+@click.option("-l", "--last-name", help="""last name to filter by""", type=str, default="A")
+@click.pass_context
+def explain(ctx, player_id, pitch_type, first_name, last_name):
+    if player_id is None:
+        player_id = ctx.obj["CURRENT_PLAYER"].pid if "CURRENT_PLAYER" in ctx.obj else 0
+
+    from fillbass.parsedata import DatabaseManager
+
+    if "DB_MANAGER" not in ctx.obj:
+        ctx.obj["DB_MANAGER"] = DatabaseManager(ctx.obj["DATABASE"], ctx.obj["MYSQL"], ctx.obj["QUERY_CACHE"])
+    db_manager = ctx.obj["DB_MANAGER"]
+    for name, sql, plan in db_manager.explain_queries(player_id, pitch_type, first_name, last_name):
+        click.echo(name)
+        click.echo("  " + " ".join(sql.split()))
+        for line in plan:
+            click.echo("    " + line)
+
+
+def lod_options(command):
+    """adds the options of a trajectory.LevelOfDetail to ``command``"""
+    options = [
+        click.option("--samples", metavar="COUNT", type=click.IntRange(min=2), default=defaults.SAMPLES,
+                     help="""draw every trajectory with COUNT points. Defaults to %d.""" % defaults.SAMPLES),
+        click.option("--max-vertices", metavar="COUNT", type=click.IntRange(min=0),
+                     default=defaults.MAX_VERTICES,
+                     help="""draw at most COUNT points per chart by subsampling the trajectories of large pitch
+                     types, 0 draws all. Defaults to %d.""" % defaults.MAX_VERTICES),
+        click.option("--subsample", type=click.Choice(defaults.SUBSAMPLE_METHODS), default="random",
+                     help="""'random' picks trajectories uniformly, 'stratified' keeps the share of every area
+                     of plate locations. Defaults to 'random'."""),
+        click.option("--envelope", is_flag=True,
+                     help="""draw the mean trajectory of every pitch type and its 10th and 90th percentiles
+                     instead of single pitches."""),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+
+def level_of_detail(samples, max_vertices, subsample, envelope):
+    from fillbass.trajectory import LevelOfDetail
+
+    return LevelOfDetail(samples, max_vertices or None, subsample, envelope)
+
+
+@cli.command(help="render pitches by type charts of the given pitchers to image files")
+@click.argument("player_ids", nargs=-1, type=int)
+@click.option("--all-pitchers", is_flag=True, help="""render a chart for every pitcher in the summary table""")
+@click.option("-s", "--season", type=int, default=None, help="""with --all-pitchers, only pitchers of this season""")
+@click.option("-p", "--pitch-type", multiple=True, help="""render one chart per pitcher for each given pitch type
+              instead of one chart of all types. May be given several times.""")
+@click.option("-o", "--output", type=click.Path(file_okay=False, writable=True), default="charts",
+              help="""write the charts to this directory. Defaults to 'charts'.""")
+@click.option("-f", "--format", "fmt", type=click.Choice(defaults.CHART_FORMATS), default="png",
+              help="""Defaults to 'png'.""")
+@click.option("-j", "--jobs", metavar="COUNT", type=click.IntRange(min=1), default=None,
+              help="""draw with COUNT worker processes. Defaults to the number of processors.""")
+@click.option("--dpi", type=click.IntRange(min=1), default=defaults.DPI, help="""Defaults to %d.""" % defaults.DPI)
+@lod_options
+@click.pass_context
+def render(ctx, player_ids, all_pitchers, season, pitch_type, output, fmt, jobs, dpi,
+           samples, max_vertices, subsample, envelope):
+    from fillbass.parsedata import DatabaseManager
+    from fillbass.render import render as render_charts
+
+    if "DB_MANAGER" not in ctx.obj:
+        ctx.obj["DB_MANAGER"] = DatabaseManager(ctx.obj["DATABASE"], ctx.obj["MYSQL"], ctx.obj["QUERY_CACHE"])
+    db_manager = ctx.obj["DB_MANAGER"]
+    if all_pitchers:
+        player_ids = db_manager.get_pitcher_ids(season)
+    elif not player_ids and "CURRENT_PLAYER" in ctx.obj:
+        player_ids = [ctx.obj["CURRENT_PLAYER"].pid]
+
+    charts = pitch_count = 0
+    lod = level_of_detail(samples, max_vertices, subsample, envelope)
+    for file_name, pitches in render_charts(db_manager, player_ids, output, fmt, pitch_type or (None,), jobs,
+                                            dpi=dpi, lod=lod):
+        LOG.info("Rendered [%s] with [%i] pitches", file_name, pitches)
+        charts += 1
+        pitch_count += pitches
+    click.echo("Rendered {} charts of {} pitches to {}".format(charts, pitch_count, output))
 
 
 @cli.command(help="list players")
@@ -92,9 +340,11 @@ def scan(ctx, directory):
 @click.option("-l", "--last-name", help="""last name of the player""", type=str, default=None)
 @click.pass_context
 def list(ctx, first_name, last_name):
-    if "DB_MANAGER" not in ctx.obj:
-        ctx.obj["DB_MANAGER"] = DatabaseManager(ctx.obj["DATABASE"], ctx.obj["MYSQL"])
-    db_manager = ctx.obj["DB_MANAGER"]
+    from tabulate import tabulate
+
+    from fillbass.entities import Player
+
+    db_manager = reader(ctx)
     matching_players = db_manager.get_players(first_name, last_name)
     column_names = [n for n in map(lambda c: c.name, Player.__table__.columns)]
 
@@ -105,15 +355,16 @@ def list(ctx, first_name, last_name):
     else:
         click.echo(players_table)
 
-    if len(matching_players) is 1:
+    if len(matching_players) == 1:
         ctx.obj["CURRENT_PLAYER"] = matching_players[0]
 
 
 @cli.command(help="show all pitches by a pitcher")
 @click.argument("player_id", type=str, required=False, nargs=1, default=None)
 @click.option("-p", "--pitch-type", help="""only show pitches of this type""", type=str, default=None)
+@lod_options
 @click.pass_context
-def pitches_by(ctx, player_id, pitch_type):
+def pitches_by(ctx, player_id, pitch_type, samples, max_vertices, subsample, envelope):
     if player_id is None:
         if "CURRENT_PLAYER" in ctx.obj:
             player_id = ctx.obj["CURRENT_PLAYER"].pid
@@ -121,12 +372,12 @@ def pitches_by(ctx, player_id, pitch_type):
             click.echo("Please provide a player_id or chain with a list call that finds exactly one player.")
             return
 
-    if "DB_MANAGER" not in ctx.obj:
-        ctx.obj["DB_MANAGER"] = DatabaseManager(ctx.obj["DATABASE"], ctx.obj["MYSQL"])
+    from fillbass.drawing import Drawer
 
-    db_manager = ctx.obj["DB_MANAGER"]
+    db_manager = reader(ctx)
     drawer = Drawer(db_manager)
-    drawer.pitches_by_type(db_manager.get_player(player_id), pitch_type)
+    drawer.pitches_by_type(db_manager.get_player(player_id), pitch_type,
+                           level_of_detail(samples, max_vertices, subsample, envelope))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,117 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import datetime
+import logging
+
+from lxml import etree
+
+from . import entities
+
+LOG = logging.getLogger(__name__)
+
+
+def to_datetime(s):
+    """parses a timestamp such as tfs_zulu to a naive datetime in UTC, whichever engine read it"""
+    try:
+        return datetime.datetime.strptime(s, "%Y-%m-%dT%H:%M:%SZ")
+    except ValueError:
+        import dateutil.parser
+
+        value = dateutil.parser.parse(s)
+        if value.tzinfo is not None:
+            value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        return value
+
+
+CONVERTERS = {
+    int: int,
+    float: float,
+    datetime.datetime: to_datetime
+}
+
+
+class ColumnTable(object):
+    """precompiled mapping of xml attributes to the columns of an entity
+
+    Rows are plain tuples holding one value per column in ``names`` order.
+    Columns listed in ``context`` are not read from the element itself but
+    from a dict handed to ``row`` (e.g. pitcher and batter of an at bat).
+    """
+
+    def __init__(self, clazz, attribute_mapping, exclude=(), context=()):
+        super(ColumnTable, self).__init__()
+        columns = [c for c in clazz.__table__.columns if c.name not in exclude]
+        self.table = clazz.__table__
+        self.names = tuple(c.name for c in columns)
+        self.fields = tuple((attribute_mapping.get(c.name, c.name),
+                             CONVERTERS.get(c.type.python_type))
+                            for c in columns)
+        self.context = tuple((self.names.index(name), name) for name in context)
+
+    def index(self, name):
+        return self.names.index(name)
+
+    def row(self, attrib, context=None):
+        get = attrib.get
+        row = []
+        for attribute, convert in self.fields:
+            value = get(attribute)
+            if value is not None and convert is not None:
+                try:
+                    value = convert(value)
+                except (ValueError, OverflowError):
+                    value = None
+            row.append(value)
+        for index, name in self.context:
+            row[index] = context[name]
+        return tuple(row)
+
+    def as_dicts(self, rows):
+        names = self.names
+        return [dict(zip(names, row)) for row in rows]
+
+
+PITCHES = ColumnTable(entities.Pitch, {"result": "type", "event_id": "id"},
+                      exclude=("pid",), context=("game_id", "at_bat", "pitcher", "batter"))
+PLAYERS = ColumnTable(entities.Player, {"pid": "id"})
+
+
+def _release(element):
+    element.clear()
+    parent = element.getparent()
+    if parent is not None:
+        while element.getprevious() is not None:
+            del parent[0]
+
+
+def iter_pitches(source, game_id=None):
+    """yields one row tuple per pitch in the inning_all.xml file of game ``game_id``"""
+    context = None
+    for event, element in etree.iterparse(source, events=("start", "end"),
+                                          tag=("atbat", "pitch"), recover=True):
+        if element.tag == "pitch":
+            if event == "end":
+                if context is not None:
+                    yield PITCHES.row(element.attrib, context)
+                _release(element)
+        elif event == "start":
+            try:
+                context = {"game_id": game_id,
+                           "at_bat": int(element.get("num")),
+                           "pitcher": int(element.get("pitcher")),
+                           "batter": int(element.get("batter"))}
+            except (TypeError, ValueError):
+                LOG.warning("Skipping at bat [%s] of [%s] without number, pitcher or batter",
+                            element.get("num"), game_id)
+                context = None
+        else:
+            _release(element)
+
+
+def iter_players(source):
+    """yields one row tuple per player in a player file"""
+    for _, element in etree.iterparse(source, events=("end",), tag="Player", recover=True):
+        yield PLAYERS.row(element.attrib)
+        _release(element)
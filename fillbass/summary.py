@@ -0,0 +1,127 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""per (pitcher, pitch type, season) aggregates of the key pitch columns
+
+The aggregates are kept in ``entities.PitchSummary``. Newly inserted
+pitches are folded into them with ``Aggregates``; ``summary_select``
+recomputes them from the pitches table with a GROUP BY.
+"""
+
+import sqlalchemy
+from sqlalchemy.sql import func
+
+from . import entities
+
+KEY = ("pitcher", "pitch_type", "season")
+
+
+def season(game_id):
+    """returns the season of a game id like 'gid_2008_04_01_...', 0 if there is none"""
+    try:
+        return int(game_id[4:8])
+    except (TypeError, ValueError):
+        return 0
+
+
+def empty(key):
+    row = dict(zip(KEY, key))
+    row["count"] = 0
+    for name in entities.SUMMARY_COLUMNS:
+        row[name + "_n"] = 0
+        row[name + "_sum"] = 0.0
+        row[name + "_sumsq"] = 0.0
+        row[name + "_min"] = None
+        row[name + "_max"] = None
+    return row
+
+
+def combine(row, other):
+    """adds the aggregates of the summary dict ``other`` to ``row``"""
+    row["count"] += other["count"]
+    for name in entities.SUMMARY_COLUMNS:
+        row[name + "_n"] += other[name + "_n"]
+        row[name + "_sum"] += other[name + "_sum"]
+        row[name + "_sumsq"] += other[name + "_sumsq"]
+        for suffix, pick in (("_min", min), ("_max", max)):
+            values = [v for v in (row[name + suffix], other[name + suffix]) if v is not None]
+            row[name + suffix] = pick(values) if values else None
+    return row
+
+
+class Aggregates(object):
+    """summary rows of pitches given as tuples of the columns ``names``"""
+
+    def __init__(self, names):
+        super(Aggregates, self).__init__()
+        self.groups = {}
+        self.key_indexes = (names.index("pitcher"), names.index("pitch_type"), names.index("game_id"))
+        self.columns = tuple((names.index(name), name) for name in entities.SUMMARY_COLUMNS)
+
+    def key(self, row):
+        pitcher, pitch_type, game_id = (row[i] for i in self.key_indexes)
+        return pitcher, pitch_type or "", season(game_id)
+
+    def add(self, row):
+        key = self.key(row)
+        if key[0] is None:
+            return
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = empty(key)
+        group["count"] += 1
+        for index, name in self.columns:
+            value = row[index]
+            if value is None or value != value:
+                continue
+            group[name + "_n"] += 1
+            group[name + "_sum"] += value
+            group[name + "_sumsq"] += value * value
+            low = group[name + "_min"]
+            if low is None or value < low:
+                group[name + "_min"] = value
+            high = group[name + "_max"]
+            if high is None or value > high:
+                group[name + "_max"] = value
+
+    def update(self, other):
+        """adds the groups of the ``Aggregates`` ``other``"""
+        for key, group in other.groups.items():
+            if key in self.groups:
+                combine(self.groups[key], group)
+            else:
+                self.groups[key] = group
+
+    def discard(self, pitchers):
+        self.groups = {key: group for key, group in self.groups.items() if key[0] not in pitchers}
+
+    def rows(self):
+        return list(self.groups.values())
+
+
+def season_expression():
+    return func.coalesce(sqlalchemy.cast(func.substr(entities.Pitch.game_id, 5, 4), sqlalchemy.Integer), 0)
+
+
+def summary_select(pitchers=None):
+    """returns a select of the summary rows computed from the pitches, limited to ``pitchers`` if given
+
+    Its columns are named and ordered like the columns of the summary table.
+    """
+    pitch = entities.Pitch
+    pitch_type = func.coalesce(pitch.pitch_type, "")
+    season_ = season_expression()
+    columns = [pitch.pitcher.label("pitcher"), pitch_type.label("pitch_type"), season_.label("season"),
+               func.count().label("count")]
+    for name in entities.SUMMARY_COLUMNS:
+        column = getattr(pitch, name)
+        columns.extend((func.count(column).label(name + "_n"),
+                        func.coalesce(func.sum(column), 0.0).label(name + "_sum"),
+                        func.coalesce(func.sum(column * column), 0.0).label(name + "_sumsq"),
+                        func.min(column).label(name + "_min"),
+                        func.max(column).label(name + "_max")))
+    select = sqlalchemy.select(*columns).where(pitch.pitcher.isnot(None))
+    if pitchers is not None:
+        select = select.where(pitch.pitcher.in_(pitchers))
+    return select.group_by(pitch.pitcher, pitch_type, season_)
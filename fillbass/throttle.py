@@ -0,0 +1,92 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""rate limiting, retry timing and counters shared by both fetch engines"""
+
+import logging
+import random
+import threading
+import time
+
+LOG = logging.getLogger(__name__)
+
+
+class TokenBucket(object):
+    """thread-safe token bucket granting ``rate`` requests per second in bursts of up to ``capacity``
+
+    Tokens are handed out in order; a caller that finds the bucket empty
+    takes a token in advance and is told how long to wait before using it.
+    """
+
+    def __init__(self, rate, capacity=None):
+        super(TokenBucket, self).__init__()
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """takes a token and returns the number of seconds to wait before using it"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class RetryPolicy(object):
+    """exponential backoff with jitter for up to ``retries`` retries of a failed request"""
+
+    RETRY_STATUS = (408, 429, 500, 502, 503, 504)
+
+    def __init__(self, retries=3, backoff=0.5, max_backoff=60.0):
+        super(RetryPolicy, self).__init__()
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def delay(self, attempt, retry_after=None):
+        """seconds to wait before retry number ``attempt`` (counting from 0)"""
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+        if retry_after is not None:
+            try:
+                delay = max(delay, min(self.max_backoff, float(retry_after)))
+            except ValueError:
+                pass
+        return delay
+
+
+class FetchStats(object):
+    """thread-safe counters of a fetch run"""
+
+    FIELDS = ("requests", "retries", "failures", "throttled", "throttled_seconds", "bytes")
+
+    def __init__(self):
+        super(FetchStats, self).__init__()
+        self.lock = threading.Lock()
+        for field in FetchStats.FIELDS:
+            setattr(self, field, 0)
+
+    def add(self, field, amount=1):
+        with self.lock:
+            setattr(self, field, getattr(self, field) + amount)
+
+    def throttle(self, wait):
+        if wait > 0:
+            with self.lock:
+                self.throttled += 1
+                self.throttled_seconds += wait
+
+    def summary(self):
+        return ("{} requests, {} retries, {} failed after retrying, {} throttled waits ({:.1f} s), "
+                "{:.1f} MiB fetched").format(self.requests, self.retries, self.failures, self.throttled,
+                                             self.throttled_seconds, self.bytes / 2.0 ** 20)
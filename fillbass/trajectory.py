@@ -0,0 +1,151 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""vectorized pitch trajectories
+
+Pitch f/x describes every pitch by its position (x0, y0, z0), velocity
+(vx0, vy0, vz0) and constant acceleration (ax, ay, az) at y0. The functions
+here evaluate those equations of motion for many pitches at once.
+
+Columns are given as a mapping of column name to an array-like holding
+one value per pitch, e.g. a dict of arrays or a structured array; missing
+values are None or NaN.
+"""
+
+import numpy
+
+from . import defaults
+
+POSITION_COLUMNS = ("x0", "y0", "z0")
+VELOCITY_COLUMNS = ("vx0", "vy0", "vz0")
+ACCELERATION_COLUMNS = ("ax", "ay", "az")
+TRAJECTORY_COLUMNS = POSITION_COLUMNS + VELOCITY_COLUMNS + ACCELERATION_COLUMNS
+REQUIRED_COLUMNS = TRAJECTORY_COLUMNS + ("px", "pz")
+
+SAMPLES = defaults.SAMPLES
+
+
+def columns_from_pitches(pitches, names=REQUIRED_COLUMNS):
+    """returns a dict of float arrays holding the attributes ``names`` of ``pitches``"""
+    return {name: numpy.array([getattr(pitch, name) for pitch in pitches], dtype=float) for name in names}
+
+
+def _stack(columns, names):
+    return numpy.stack([numpy.asarray(columns[name], dtype=float) for name in names], axis=-1)
+
+
+def valid(columns, names=REQUIRED_COLUMNS):
+    """returns a boolean array telling which pitches have finite values for all ``names``"""
+    return numpy.isfinite(_stack(columns, names)).all(axis=-1)
+
+
+def time_to_plate(columns, y=0.0):
+    """returns the time each pitch takes from y0 to ``y`` (NaN if it never gets there)"""
+    y0 = numpy.asarray(columns["y0"], dtype=float)
+    vy0 = numpy.asarray(columns["vy0"], dtype=float)
+    ay = numpy.asarray(columns["ay"], dtype=float)
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        return (-vy0 - numpy.sqrt(vy0 ** 2 - 2 * ay * (y0 - y))) / ay
+
+
+def trajectories(columns, samples=SAMPLES, y=0.0):
+    """returns an (N, samples, 3) masked array of x, y, z positions along the path of N pitches
+
+    Positions are sampled at evenly spaced times from the release point
+    to the moment the pitch reaches ``y``. Pitches lacking any of
+    ``REQUIRED_COLUMNS``, or never reaching ``y``, are masked.
+    """
+    t_end = time_to_plate(columns, y)
+    t = (t_end[:, numpy.newaxis] * numpy.linspace(0.0, 1.0, samples))[..., numpy.newaxis]
+    p0 = _stack(columns, POSITION_COLUMNS)[:, numpy.newaxis, :]
+    v0 = _stack(columns, VELOCITY_COLUMNS)[:, numpy.newaxis, :]
+    a = _stack(columns, ACCELERATION_COLUMNS)[:, numpy.newaxis, :]
+    with numpy.errstate(invalid="ignore"):
+        positions = p0 + v0 * t + a * t ** 2 / 2
+
+    invalid = ~(valid(columns) & numpy.isfinite(t_end))
+    mask = numpy.broadcast_to(invalid[:, numpy.newaxis, numpy.newaxis], positions.shape)
+    return numpy.ma.masked_array(positions, mask=mask)
+
+
+def unmasked(paths):
+    """returns the unmasked trajectories of ``trajectories`` as a plain (M, samples, 3) array"""
+    return paths.data[~numpy.ma.getmaskarray(paths)[:, 0, 0]]
+
+
+def strata(columns, bins=8):
+    """returns the cell of every pitch in a ``bins`` x ``bins`` grid over the range of the plate locations
+
+    Pitches without a plate location share one extra cell.
+    """
+    cells = numpy.full(len(columns["px"]), bins * bins)
+    px = numpy.asarray(columns["px"], dtype=float)
+    pz = numpy.asarray(columns["pz"], dtype=float)
+    located = numpy.isfinite(px) & numpy.isfinite(pz)
+    if located.any():
+        ix = numpy.digitize(px[located], numpy.linspace(px[located].min(), px[located].max(), bins + 1)[1:-1])
+        iz = numpy.digitize(pz[located], numpy.linspace(pz[located].min(), pz[located].max(), bins + 1)[1:-1])
+        cells[located] = ix * bins + iz
+    return cells
+
+
+def subsample(count, limit, method="random", cells=None, seed=0):
+    """returns the sorted indices of ``limit`` of ``count`` items, or of all if there are no more
+
+    "random" draws them uniformly. "stratified" takes evenly spaced items
+    after ordering them by ``cells``, so every cell keeps its share.
+    """
+    if count <= limit:
+        return numpy.arange(count)
+    rng = numpy.random.default_rng(seed)
+    if method == "random" or cells is None:
+        return numpy.sort(rng.choice(count, limit, replace=False))
+    order = numpy.argsort(cells, kind="stable")
+    step = count / limit
+    positions = (numpy.arange(limit) * step + rng.uniform(0, step)).astype(int)
+    return numpy.sort(order[numpy.minimum(positions, count - 1)])
+
+
+def envelope(paths, percentiles=(10, 90)):
+    """returns the mean of the (N, samples, 3) ``paths`` and their coordinate-wise ``percentiles``"""
+    return paths.mean(axis=0), [numpy.percentile(paths, q, axis=0) for q in percentiles]
+
+
+class LevelOfDetail(object):
+    """how much of the trajectories of a chart to draw
+
+    Every trajectory is drawn with ``samples`` points. If all of them took
+    more than ``max_vertices`` points, each pitch type is subsampled to its
+    share of the budget with ``method``. With ``envelope``, every type is
+    drawn as its mean trajectory and percentile trajectories instead.
+    """
+
+    METHODS = defaults.SUBSAMPLE_METHODS
+    DEFAULT_MAX_VERTICES = defaults.MAX_VERTICES
+
+    def __init__(self, samples=SAMPLES, max_vertices=DEFAULT_MAX_VERTICES, method="random", envelope=False,
+                 percentiles=(10, 90), seed=0):
+        super(LevelOfDetail, self).__init__()
+        self.samples = samples
+        self.max_vertices = max_vertices
+        self.method = method
+        self.envelope = envelope
+        self.percentiles = percentiles
+        self.seed = seed
+
+    def line_limits(self, counts):
+        """returns the number of trajectories to draw for each of a dict of pitch type to pitch count"""
+        total = sum(counts.values())
+        if self.envelope or self.max_vertices is None or total * self.samples <= self.max_vertices:
+            return dict(counts)
+        lines = self.max_vertices // self.samples
+        return {t: max(1, count * lines // total) for t, count in counts.items()}
+
+    def paths(self, columns, limit):
+        """returns the trajectories of up to ``limit`` of the pitches in ``columns`` as an (M, samples, 3) array"""
+        paths = trajectories(columns, self.samples)
+        drawn = ~numpy.ma.getmaskarray(paths)[:, 0, 0]
+        cells = strata({name: numpy.asarray(columns[name])[drawn] for name in ("px", "pz")}) \
+            if self.method == "stratified" else None
+        return paths.data[drawn][subsample(int(drawn.sum()), limit, self.method, cells, self.seed)]
@@ -0,0 +1,127 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""columnar encodings of query results, produced chunk by chunk for streaming responses
+
+``json_columns`` writes ``{"fields": [...], "batches": [{field: [values]}, ...],
+"count": n}``: every chunk of rows becomes one batch holding one array per
+field, so keys are not repeated per row. ``arrow_stream`` writes the Arrow
+IPC stream format (needs pyarrow). ``compress`` gzip or deflate encodes
+either on the fly.
+"""
+
+import datetime
+import json
+import zlib
+
+JSON_ROWS = "application/json"
+JSON_COLUMNS = "application/vnd.fillbass.columns+json"
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+FORMATS = {"rows": JSON_ROWS, "columns": JSON_COLUMNS, "arrow": ARROW_STREAM}
+
+ENCODINGS = {"gzip": 16 + zlib.MAX_WBITS, "deflate": zlib.MAX_WBITS}
+
+
+def _default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError("{!r} is not JSON serializable".format(value))
+
+
+def json_columns(fields, chunks, trailer=None):
+    """yields the JSON encoding of ``chunks``, lists of row tuples of ``fields``
+
+    ``trailer`` is called with the number of rows and the last row once all
+    chunks are written and may return a dict of further members of the
+    top-level object.
+    """
+    yield ('{"fields": ' + json.dumps(list(fields)) + ', "batches": [').encode()
+    count = 0
+    last = None
+    for rows in chunks:
+        columns = ", ".join(json.dumps(name) + ": " + json.dumps(list(values), default=_default)
+                            for name, values in zip(fields, zip(*rows)))
+        yield ((", " if count else "") + "{" + columns + "}").encode()
+        count += len(rows)
+        last = rows[-1]
+    extra = trailer(count, last) if trailer is not None else None
+    tail = "".join(", " + json.dumps(key) + ": " + json.dumps(value) for key, value in (extra or {}).items())
+    yield ('], "count": ' + str(count) + tail + "}").encode()
+
+
+class _Sink(object):
+    """collects what the Arrow writer writes, to be handed out chunk by chunk"""
+
+    def __init__(self):
+        super(_Sink, self).__init__()
+        self.parts = []
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+def arrow_stream(schema, chunks):
+    """yields the Arrow IPC stream of ``chunks``, lists of row tuples of the fields of the pyarrow ``schema``"""
+    import pyarrow
+
+    sink = _Sink()
+    writer = pyarrow.ipc.new_stream(pyarrow.PythonFile(sink, mode="w"), schema)
+    for rows in chunks:
+        arrays = [pyarrow.array(values, type=field.type) for values, field in zip(zip(*rows), schema)]
+        writer.write_batch(pyarrow.RecordBatch.from_arrays(arrays, schema=schema))
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+
+def negotiate_encoding(accept_encoding):
+    """returns the one of gzip and deflate with the highest q-value in an Accept-Encoding header
+
+    q=0 rules an encoding out and "*" stands for the encodings the header
+    does not name. Ties go to gzip; returns None if neither is acceptable.
+    """
+    qualities = {}
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    best, best_quality = None, 0.0
+    for encoding in ENCODINGS:
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(parts, encoding, level=6):
+    """yields ``parts`` compressed with the content-coding ``encoding``, flushing after every part"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, ENCODINGS[encoding])
+    for part in parts:
+        data = compressor.compress(part) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
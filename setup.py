@@ -86,6 +86,11 @@ setup(
     # dependencies). You can install these using the following syntax,
     # for example:
     # $ pip install -e .[dev,test]
+    extras_require={
+        'async': ['aiohttp'],
+        'columnar': ['pyarrow'],
+        'rest': ['eve', 'eve-sqlalchemy'],
+    },
 
     # If there are data files included in your packages that need to be
     # installed, specify them here.  If using Python 2.6 or less, then these
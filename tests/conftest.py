@@ -0,0 +1,44 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""a small gd2 tree and a local HTTP server to fetch it from"""
+
+import functools
+import http.server
+import threading
+
+import pytest
+
+from gd2tree import write_tree
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(scope="session")
+def gd2_tree(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("gd2"))
+    write_tree(path)
+    return path
+
+
+@pytest.fixture
+def gd2_server(gd2_tree):
+    """returns a function that serves ``gd2_tree``, or another tree, with a handler class and returns the data url"""
+    servers = []
+
+    def serve(handler=QuietHandler, directory=gd2_tree):
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(handler, directory=directory))
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return "http://127.0.0.1:%d/components/game/mlb/" % server.server_address[1]
+
+    yield serve
+    for server in servers:
+        server.shutdown()
+        server.server_close()
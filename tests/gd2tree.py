@@ -0,0 +1,71 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""a small gd2 tree of one day with two games, as served and as fetched"""
+
+import datetime
+import os
+
+DAY = datetime.date(2008, 4, 1)
+
+# game id -> (pitcher, batter)
+GAMES = {
+    "gid_2008_04_01_aaamlb_bbbmlb_1": (400001, 500001),
+    "gid_2008_04_01_cccmlb_dddmlb_1": (400002, 500002),
+}
+
+INNING = """<?xml version="1.0" encoding="UTF-8"?>
+<game atBat="{batter}" deck="{batter}" hole="{batter}" ind="F">
+ <inning num="1" away_team="aaa" home_team="bbb" next="N">
+  <top>
+   <atbat num="1" b="1" s="0" o="1" batter="{batter}" stand="R" pitcher="{pitcher}" p_throws="R" des="Out">
+    <pitch des="Ball" id="3" type="B" tfs_zulu="2008-04-01T23:05:22Z" x="36.4" y="127.61"
+           sv_id="080401_230522" start_speed="91.2" end_speed="83.4" sz_top="3.41" sz_bot="1.57"
+           pfx_x="-6.2" pfx_z="9.1" px="1.851" pz="2.381" x0="1.687" y0="50.0" z0="6.287" vx0="-4.1"
+           vy0="-133.2" vz0="-3.9" ax="-10.2" ay="29.1" az="-15.4" break_y="23.7" break_angle="21.3"
+           break_length="4.2" pitch_type="FF" type_confidence="0.881" spin_dir="214.0" spin_rate="2290.0"/>
+   </atbat>
+  </top>
+ </inning>
+</game>
+"""
+
+PLAYER = """<?xml version="1.0" encoding="UTF-8"?>
+<Player team="aaa" id="{pid}" pos="{pos}" type="{type}" first_name="First{pid}" last_name="Last{pid}"
+        jersey_number="1" height="6-2" weight="200" bats="R" throws="R" dob="01/01/1980"/>
+"""
+
+
+def game_files(pitcher, batter):
+    """returns a dict mapping the files of a game, by their path on the server, to their content"""
+    return {
+        os.path.join("inning", "inning_all.xml"): INNING.format(pitcher=pitcher, batter=batter),
+        os.path.join("pitchers", "%d.xml" % pitcher): PLAYER.format(pid=pitcher, pos="P", type="pitcher"),
+        os.path.join("batters", "%d.xml" % batter): PLAYER.format(pid=batter, pos="C", type="batter"),
+    }
+
+
+def write_files(path, files):
+    for name, content in files.items():
+        file_name = os.path.join(path, name)
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        with open(file_name, "w") as f:
+            f.write(content)
+
+
+def write_tree(path, games=GAMES):
+    """writes ``games``, a dict like ``GAMES``, below ``path`` the way the gd2 server lays them out"""
+    day = os.path.join(path, "components", "game", "mlb",
+                       "year_%d" % DAY.year, "month_%02d" % DAY.month, "day_%02d" % DAY.day)
+    for game_id, (pitcher, batter) in games.items():
+        write_files(os.path.join(day, game_id), game_files(pitcher, batter))
+
+
+def write_day(path, games=GAMES):
+    """writes ``games`` below ``path`` the way fetch saves them, and returns the directory of the day"""
+    day = os.path.join(path, "year_%d" % DAY.year, "month_%02d" % DAY.month, "day_%02d" % DAY.day)
+    for game_id, (pitcher, batter) in games.items():
+        files = game_files(pitcher, batter)
+        write_files(os.path.join(day, game_id), {os.path.basename(name): files[name] for name in files})
+    return day
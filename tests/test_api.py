@@ -0,0 +1,63 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import flask
+import pytest
+
+from fillbass import api
+from fillbass.parsedata import DatabaseManager
+from fillbass.streamparse import PITCHES, PLAYERS
+
+
+def add_pitches(db, event_ids):
+    pitches = [{"game_id": "gid_2008_04_01_aaamlb_bbbmlb_1", "at_bat": 1, "event_id": event_id,
+                "pitcher": 400001, "pitch_type": "FF", "px": 0.1 * event_id} for event_id in event_ids]
+    db.add_pitch_rows([tuple(pitch.get(name) for name in PITCHES.names) for pitch in pitches])
+    db.commit()
+
+
+def api_client(path):
+    """returns a test client of an app serving the endpoints from the database at ``path``"""
+    app = flask.Flask(__name__)
+    app.config["FILLBASS_DATABASE"] = path
+    app.register_blueprint(api.blueprint)
+    return app.test_client()
+
+
+def test_pages_show_what_other_processes_wrote(tmp_path):
+    path = str(tmp_path / "fillbass.db")
+    writer = DatabaseManager(path, False)
+    add_pitches(writer, [1, 2])
+    client = api_client(path)
+
+    for _ in range(2):
+        assert len(client.get("/api/pitches?format=rows").get_json()["_items"]) == 2
+        assert client.get("/api/players").get_json()["_items"] == []
+    add_pitches(writer, [3])
+    writer.add_player_rows([tuple({"pid": 400001, "last_name": "Smith"}.get(name) for name in PLAYERS.names)])
+    writer.commit()
+
+    assert len(client.get("/api/pitches?format=rows").get_json()["_items"]) == 3
+    assert [p["pid"] for p in client.get("/api/players").get_json()["_items"]] == [400001]
+
+
+def test_pitch_pages_match_pitch_types_like_the_other_endpoints(tmp_path):
+    path = str(tmp_path / "fillbass.db")
+    db = DatabaseManager(path, False)
+    add_pitches(db, [1, 2])
+    client = api_client(path)
+
+    for pitch_type in ("FF", "ff", "F%"):
+        page = client.get("/api/pitches?format=rows&pitch_type=" + pitch_type).get_json()
+        assert len(page["_items"]) == 2
+        assert len(db.get_pitch_columns(["px"], pitch_type=pitch_type)["px"]) == 2
+
+
+@pytest.mark.parametrize("query", ["format=rows", "format=columns", "format=arrow", "", "format=xml"])
+def test_every_pitches_response_varies_by_accept_and_encoding(tmp_path, query):
+    path = str(tmp_path / "fillbass.db")
+    add_pitches(DatabaseManager(path, False), [1, 2])
+
+    response = api_client(path).get("/api/pitches?" + query, headers={"Accept-Encoding": "gzip"})
+    assert set(response.vary) == {"Accept", "Accept-Encoding"}
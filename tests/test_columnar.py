@@ -0,0 +1,39 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import numpy
+import pytest
+
+from fillbass.parsedata import DatabaseManager
+from fillbass.streamparse import PITCHES
+
+columnar = pytest.importorskip("fillbass.columnar")
+
+
+def sorted_columns(arrays):
+    """returns ``arrays`` sorted by pitch type and px, as the backends return pitches in different orders"""
+    order = numpy.lexsort((arrays["px"], arrays["pitch_type"]))
+    return {name: array[order] for name, array in arrays.items()}
+
+
+@pytest.mark.parametrize("pitch_type", [None, "FF", "ff", "ch", "c%", "_L", "SI"])
+def test_export_reads_the_same_pitches_as_the_database(tmp_path, pitch_type):
+    db = DatabaseManager(str(tmp_path / "fillbass.db"), False)
+    types = ["FF", "CH", "SL", "CH", "FF", "CU", "FF"]
+    pitches = [{"game_id": "gid_%d_04_01_aaamlb_bbbmlb_1" % season, "at_bat": 1, "event_id": event_id,
+                "pitcher": pitcher, "pitch_type": pitch_type_, "px": 0.1 * event_id}
+               for season in (2008, 2009) for pitcher in (400001, 400002)
+               for event_id, pitch_type_ in enumerate(types)]
+    db.add_pitch_rows([tuple(pitch.get(name) for name in PITCHES.names) for pitch in pitches])
+    db.commit()
+    columnar.export(db, str(tmp_path / "columnar"))
+    store = columnar.ColumnarStore(str(tmp_path / "columnar"))
+
+    for pitcher_id in (None, 400001):
+        expected = sorted_columns(db.get_pitch_columns(["pitch_type", "px"], pitcher_id, pitch_type))
+        actual = sorted_columns(store.get_pitch_columns(["pitch_type", "px"], pitcher_id, pitch_type))
+        assert expected["pitch_type"].tolist() == actual["pitch_type"].tolist()
+        assert numpy.allclose(expected["px"], actual["px"])
+    if pitch_type == "ch":
+        assert len(store.get_pitch_columns(["px"], 400001, pitch_type)["px"]) == 4
@@ -0,0 +1,31 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from fillbass.parsedata import DatabaseManager
+from fillbass.streamparse import PLAYERS
+
+
+def test_players_are_found_by_name_prefix_through_the_index(tmp_path):
+    db = DatabaseManager(str(tmp_path / "fillbass.db"), False)
+    players = [{"pid": 1, "first_name": "John", "last_name": "Smith"},
+               {"pid": 2, "first_name": "Jane", "last_name": "smythe"},
+               {"pid": 3, "first_name": "Jim", "last_name": "Jones"}]
+    db.add_player_rows([tuple(player.get(name) for name in PLAYERS.names) for player in players])
+    db.commit()
+
+    assert sorted(p.pid for p in db.get_players(last_name="SM")) == [1, 2]
+    assert [p.pid for p in db.get_players(first_name="ja", last_name="sm")] == [2]
+    plans = {name: plan for name, _, plan in db.explain_queries(1, "FF", "J", "Sm")}
+    assert "USING INDEX ix_players_last_name_first_name_nocase" in " ".join(plans["get_players"])
+
+
+def test_every_read_method_is_explained(tmp_path):
+    db = DatabaseManager(str(tmp_path / "fillbass.db"), False)
+    read_methods = {name for name in dir(DatabaseManager)
+                    if name.startswith("get_") and hasattr(getattr(DatabaseManager, name), "__wrapped__")}
+    explained = db.explain_queries(1, "FF", "J", "Sm")
+
+    assert read_methods <= {name for name, _, _ in explained}
+    assert all(plan for _, _, plan in explained)
+    assert not db.missing_indexes()
@@ -0,0 +1,210 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import collections
+import datetime
+import http.server
+import json
+import logging
+import os
+import threading
+import time
+
+import pytest
+from click.testing import CliRunner
+
+from fillbass.asyncfetch import AsyncFetcher
+from fillbass.fetchdata import PlayerRegistry, ThrottledSession, fetch_day
+from fillbass.scripts import scripts
+from fillbass.throttle import RetryPolicy
+from gd2tree import DAY, GAMES, write_tree
+
+DATA_PATH = "/components/game/mlb/"
+
+
+def fetch(save_path, data_url, *options, days=2):
+    """runs the fetch command for ``days`` days from ``DAY`` and returns its result"""
+    end = DAY + datetime.timedelta(days=days - 1)
+    args = ["fetch", "--data-url", data_url, "-s", DAY.strftime("%d/%m/%Y"), "-e", end.strftime("%d/%m/%Y")]
+    return CliRunner().invoke(scripts.cli, args + list(options) + [str(save_path)], obj={})
+
+
+def tree_files(path):
+    """returns a dict mapping the path of every file below ``path`` to its content"""
+    files = {}
+    for root, _, names in os.walk(path):
+        for name in names:
+            file_name = os.path.join(root, name)
+            with open(file_name, "rb") as f:
+                files[os.path.relpath(file_name, path)] = f.read()
+    return files
+
+
+def test_threads_and_async_fetch_the_same_files(gd2_server, tmp_path):
+    data_url = gd2_server()
+    trees = {}
+    for engine in ("threads", "async"):
+        result = fetch(tmp_path / engine, data_url, "--engine", engine, "-j", "4")
+        assert result.exit_code == 0, result.output
+        trees[engine] = tree_files(tmp_path / engine)
+
+    # players are appended in the order their downloads finish
+    players = [sorted(tree.pop(".players_fetched").split()) for tree in trees.values()]
+    assert players[0] == players[1] == sorted(str(pid).encode() for game in GAMES.values() for pid in game)
+    assert trees["threads"] == trees["async"]
+    day = os.path.join("year_2008", "month_04", "day_01")
+    assert os.path.join(day, ".fetched.json") in trees["threads"]
+    for game_id, (pitcher, batter) in GAMES.items():
+        for name in ("inning_all.xml", "%d.xml" % pitcher, "%d.xml" % batter):
+            assert os.path.join(day, game_id, name) in trees["threads"]
+    # the second day is not on the server
+    assert not os.path.exists(tmp_path / "threads" / "year_2008" / "month_04" / "day_02")
+
+
+def status(code, retry_after=None):
+    """returns a fault answering with the HTTP status ``code``"""
+    def fault(handler):
+        handler.send_response(code)
+        if retry_after is not None:
+            handler.send_header("Retry-After", retry_after)
+        handler.send_header("Content-Length", "0")
+        handler.end_headers()
+    return fault
+
+
+def truncated(handler):
+    """a fault announcing the whole file but sending only half of it before closing the connection"""
+    with open(handler.translate_path(handler.path), "rb") as f:
+        data = f.read()
+    handler.send_response(200)
+    handler.send_header("Content-Length", str(len(data)))
+    handler.end_headers()
+    handler.wfile.write(data[:len(data) // 2])
+    handler.wfile.flush()
+    handler.close_connection = True
+
+
+def faulty_handler(faults):
+    """returns a handler class that answers the requests of a path, relative to the data url, with the
+    faults listed for it in ``faults`` before serving the file, and records when every path was requested
+    """
+    class FaultyHandler(http.server.SimpleHTTPRequestHandler):
+        lock = threading.Lock()
+        requests = collections.defaultdict(list)
+
+        def do_GET(self):
+            path = self.path[len(DATA_PATH):]
+            with FaultyHandler.lock:
+                FaultyHandler.requests[path].append(time.monotonic())
+                queue = faults.get(path)
+                fault = queue.pop(0) if queue else None
+            if fault is None:
+                super(FaultyHandler, self).do_GET()
+            else:
+                fault(self)
+
+        def log_message(self, format, *args):
+            pass
+
+    return FaultyHandler
+
+
+def fetch_day_with(engine, save_path, data_url, retries):
+    policy = RetryPolicy(retries, backoff=0.01)
+    players_fetched = PlayerRegistry(os.path.join(save_path, PlayerRegistry.FILE_NAME))
+    days = [DAY, DAY + datetime.timedelta(days=1)]
+    if engine == "async":
+        AsyncFetcher(save_path, 4, players_fetched, data_url, resume=True, policy=policy).run(days)
+        return
+    with ThrottledSession(policy=policy) as session:
+        for day in days:
+            fetch_day(save_path, day, session, players_fetched, data_url, resume=True)
+
+
+@pytest.mark.parametrize("engine", ["threads", "async"])
+def test_fetch_retries_faults_and_resumes_incomplete_days(engine, gd2_tree, gd2_server, tmp_path, caplog):
+    caplog.set_level(logging.INFO)
+    (first_game, _), (second_game, (_, batter)) = GAMES.items()
+    day = "year_2008/month_04/day_01"
+    inning = day + "/" + first_game + "/inning/inning_all.xml"
+    batter_file = day + "/" + second_game + "/batters/%d.xml" % batter
+    retries = 2
+    handler = faulty_handler({
+        day: [status(503, "0")],
+        inning: [status(429, "1"), truncated],
+        batter_file: [truncated] * (retries + 1),
+    })
+    fetch_day_with(engine, str(tmp_path), gd2_server(handler), retries)
+
+    assert len(handler.requests[day]) == 2
+    assert len(handler.requests[inning]) == 3
+    assert handler.requests[inning][1] - handler.requests[inning][0] >= 1
+    assert len(handler.requests[batter_file]) == retries + 1
+
+    local_day = tmp_path / "year_2008" / "month_04" / "day_01"
+    with open(os.path.join(gd2_tree, DATA_PATH.strip("/"), inning), "rb") as f:
+        assert (local_day / first_game / "inning_all.xml").read_bytes() == f.read()
+    local_batter = local_day / second_game / ("%d.xml" % batter)
+    assert not local_batter.exists()
+    assert os.path.exists(str(local_batter) + ".part")
+    with open(local_day / ".fetched.json") as f:
+        record = json.load(f)
+    assert not record["complete"]
+    assert os.path.join(second_game, "%d.xml" % batter) in set(record["expected"]) - set(record["fetched"])
+    # the second day is not on the server, which is no error
+    assert not [r for r in caplog.records if r.levelno >= logging.ERROR]
+    assert "No games on [2008-04-02]" in caplog.messages
+
+    fetch_day_with(engine, str(tmp_path), gd2_server(), retries)
+    with open(os.path.join(gd2_tree, DATA_PATH.strip("/"), batter_file), "rb") as f:
+        assert local_batter.read_bytes() == f.read()
+    assert not os.path.exists(str(local_batter) + ".part")
+    with open(local_day / ".fetched.json") as f:
+        assert json.load(f)["complete"]
+
+
+def slow(handler):
+    """a fault serving the file only after a while"""
+    time.sleep(0.5)
+    http.server.SimpleHTTPRequestHandler.do_GET(handler)
+
+
+def test_async_fetch_finishes_every_download_of_a_failed_game(gd2_server, tmp_path):
+    (game_id, (pitcher, _)), _ = GAMES.items()
+    game = "year_2008/month_04/day_01/" + game_id
+    handler = faulty_handler({
+        game + "/inning/inning_all.xml": [status(404)],
+        game + "/pitchers/%d.xml" % pitcher: [slow],
+    })
+    fetch_day_with("async", str(tmp_path), gd2_server(handler), 0)
+
+    local_game = tmp_path / "year_2008" / "month_04" / "day_01" / game_id
+    assert (local_game / ("%d.xml" % pitcher)).exists()
+    assert not [name for name in os.listdir(local_game) if name.endswith(".part")]
+    with open(local_game.parent / ".fetched.json") as f:
+        record = json.load(f)
+    assert not record["complete"]
+    assert os.path.join(game_id, "%d.xml" % pitcher) in record["fetched"]
+
+
+def test_async_fetch_waits_for_a_running_player_download_and_retries_it(gd2_server, tmp_path):
+    games = {"gid_2008_04_01_aaamlb_bbbmlb_1": (400001, 500001),
+             "gid_2008_04_01_cccmlb_dddmlb_1": (400001, 500002)}
+    write_tree(str(tmp_path / "gd2"), games)
+    (tmp_path / "save").mkdir()
+
+    def slow_failure(handler):
+        time.sleep(0.5)
+        status(503)(handler)
+
+    # whichever game asks first fails, slowly enough for the other one to ask meanwhile
+    first = [slow_failure]
+    pitcher_files = ["year_2008/month_04/day_01/%s/pitchers/400001.xml" % game_id for game_id in games]
+    handler = faulty_handler({path: first for path in pitcher_files})
+    fetch_day_with("async", str(tmp_path / "save"), gd2_server(handler, str(tmp_path / "gd2")), 0)
+
+    assert sum(len(handler.requests[path]) for path in pitcher_files) == 2
+    day = tmp_path / "save" / "year_2008" / "month_04" / "day_01"
+    assert [game_id for game_id in games if (day / game_id / "400001.xml").exists()]
+    assert "400001" in (tmp_path / "save" / ".players_fetched").read_text().split()
@@ -0,0 +1,30 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import os
+
+import numpy
+
+from fillbass.pitchcache import PitchCache
+
+
+def test_hits_do_not_write_the_index_but_count_for_eviction(tmp_path):
+    arrays = {"px": numpy.arange(100, dtype=numpy.float64)}
+    cache = PitchCache(str(tmp_path), max_bytes=2 * arrays["px"].nbytes)
+    cache.put(1, arrays)
+    cache.put(2, arrays)
+    index_file = tmp_path / PitchCache.INDEX_FILE
+    os.utime(index_file, (0, 0))
+    written = index_file.read_bytes()
+
+    for _ in range(3):
+        assert cache.get(1, ["px"])["px"].tolist() == arrays["px"].tolist()
+    assert cache.hits == 3
+    assert os.stat(index_file).st_mtime == 0
+    assert index_file.read_bytes() == written
+
+    # pitcher 2 is now the least recently used one
+    cache.put(3, arrays)
+    assert sorted(cache.index["entries"]) == ["1", "3"]
+    assert sorted(PitchCache(str(tmp_path)).index["entries"]) == ["1", "3"]
@@ -0,0 +1,151 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import logging
+import os
+import shutil
+
+import pytest
+import sqlalchemy
+from click.testing import CliRunner
+
+from fillbass import entities
+from fillbass.fetchdata import archive_day
+from fillbass.parsedata import DatabaseManager
+from fillbass.scripts import scripts
+from fillbass.streamparse import PITCHES
+from gd2tree import write_day
+
+# two pitchers, each facing a batter of their own in three games
+GAMES = {"gid_2008_04_01_a%02dmlb_b%02dmlb_1" % (i, i): (400001 + i % 2, 500001 + i) for i in range(6)}
+
+
+def scan(database, directory, *options):
+    """runs the scan command and returns its result"""
+    args = ["-d", str(database), "scan"] + list(options) + [str(directory)]
+    result = CliRunner().invoke(scripts.cli, args, obj={})
+    assert result.exit_code == 0, result.output
+    return result
+
+
+def rows(database, table, names=None):
+    """returns the sorted rows of ``table``, without the surrogate key of the pitches"""
+    columns = [table.c[name] for name in names] if names else list(table.columns)
+    with DatabaseManager(str(database), False).engine.connect() as connection:
+        return sorted(tuple(row) for row in connection.execute(sqlalchemy.select(*columns)))
+
+
+def stored(database):
+    """returns the pitches, players and summaries stored in ``database``"""
+    return {"pitches": rows(database, entities.Pitch.__table__, PITCHES.names),
+            "players": rows(database, entities.Player.__table__),
+            "summaries": rows(database, entities.PitchSummary.__table__)}
+
+
+def assert_summaries_are_current(database):
+    db = DatabaseManager(str(database), False)
+    summaries = rows(database, entities.PitchSummary.__table__)
+    assert summaries
+    db.summarize()
+    db.commit()
+    assert rows(database, entities.PitchSummary.__table__) == summaries
+
+
+@pytest.mark.parametrize("options", [["--engine", "bs4"], ["-j", "2", "--batch-size", "2"]])
+def test_engines_and_jobs_store_the_same_rows(tmp_path, options):
+    write_day(str(tmp_path / "data"), GAMES)
+    scan(tmp_path / "lxml.db", tmp_path / "data")
+    scan(tmp_path / "other.db", tmp_path / "data", *options)
+
+    expected = stored(tmp_path / "lxml.db")
+    assert len(expected["pitches"]) == len(GAMES)
+    assert len(expected["players"]) == 2 + len(GAMES)
+    assert stored(tmp_path / "other.db") == expected
+    assert_summaries_are_current(tmp_path / "other.db")
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_rescan_skips_unchanged_files_and_replaces_the_rows_of_edited_ones(tmp_path, caplog, jobs):
+    caplog.set_level(logging.DEBUG, logger="fillbass.parsedata")
+    database = tmp_path / "fillbass.db"
+    day = write_day(str(tmp_path / "data"), GAMES)
+    scan(database, tmp_path / "data", "-j", jobs)
+    before = stored(database)
+
+    # nothing changed: nothing is parsed or written
+    assert "Inserted" not in scan(database, tmp_path / "data", "-j", jobs).output
+    assert stored(database) == before
+
+    # a new mtime alone does not parse the file again
+    game_id, (pitcher, _) = next(iter(GAMES.items()))
+    inning = os.path.join(day, game_id, "inning_all.xml")
+    os.utime(inning, ns=(0, 0))
+    caplog.clear()
+    scan(database, tmp_path / "data", "-j", jobs)
+    assert stored(database) == before
+    if jobs == "1":
+        assert "content of [%s] did not change" % inning in caplog.messages
+
+    with open(inning) as f:
+        content = f.read()
+    with open(inning, "w") as f:
+        f.write(content.replace('px="1.851"', 'px="-0.25"').replace('pitch_type="FF"', 'pitch_type="SL"'))
+    player = os.path.join(day, game_id, "%d.xml" % pitcher)
+    with open(player) as f:
+        content = f.read()
+    with open(player, "w") as f:
+        f.write(content.replace("Last%d" % pitcher, "Changed"))
+    scan(database, tmp_path / "data", "-j", jobs)
+
+    after = stored(database)
+    assert len(after["pitches"]) == len(before["pitches"])
+    db = DatabaseManager(str(database), False)
+    assert db.get_pitch_columns(["px", "pitch_type"], pitcher_id=pitcher, pitch_type="SL")["px"].tolist() == [-0.25]
+    assert db.get_player(pitcher).last_name == "Changed"
+    assert ("SL", 1) in [(s.pitch_type, s.count) for s in db.get_summaries(pitcher_id=pitcher)]
+    assert_summaries_are_current(database)
+
+
+@pytest.mark.parametrize("on_duplicate", ["ignore", "update"])
+def test_scanning_the_same_games_again_does_not_duplicate_them(tmp_path, on_duplicate):
+    database = tmp_path / "fillbass.db"
+    write_day(str(tmp_path / "data"), GAMES)
+    scan(database, tmp_path / "data")
+    before = stored(database)
+
+    # the copies are new files to the manifest, but hold the same pitches
+    shutil.copytree(tmp_path / "data", tmp_path / "copy")
+    scan(database, tmp_path / "copy", "--on-duplicate", on_duplicate)
+    assert stored(database) == before
+    assert_summaries_are_current(database)
+
+
+def test_day_archives_store_the_same_rows_as_directories(tmp_path):
+    write_day(str(tmp_path / "data"), GAMES)
+    scan(tmp_path / "directory.db", tmp_path / "data")
+    archive_day(write_day(str(tmp_path / "archive"), GAMES))
+    assert [name for _, _, names in os.walk(tmp_path / "archive") for name in names] == ["day_01.zip"]
+
+    scan(tmp_path / "archive.db", tmp_path / "archive")
+    assert stored(tmp_path / "archive.db") == stored(tmp_path / "directory.db")
+    assert_summaries_are_current(tmp_path / "archive.db")
+    assert "Inserted" not in scan(tmp_path / "archive.db", tmp_path / "archive").output
+
+
+def test_broken_and_empty_files_do_not_fail_the_scan(tmp_path, caplog):
+    caplog.set_level(logging.WARNING)
+    day = write_day(str(tmp_path / "data"), GAMES)
+    broken, empty = list(GAMES)[:2]
+    inning = os.path.join(day, broken, "inning_all.xml")
+    with open(inning) as f:
+        content = f.read()
+    with open(inning, "w") as f:
+        f.write(content[:content.index("<pitch")])
+    open(os.path.join(day, empty, "inning_all.xml"), "w").close()
+    scan(tmp_path / "fillbass.db", tmp_path / "data")
+
+    pitches = rows(tmp_path / "fillbass.db", entities.Pitch.__table__, ["game_id"])
+    assert sorted(game_id for game_id, in pitches) == sorted(GAMES)[2:]
+    assert [m for m in caplog.messages if empty in m and "not well-formed" in m]
+    assert_summaries_are_current(tmp_path / "fillbass.db")
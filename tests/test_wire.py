@@ -0,0 +1,28 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import pytest
+
+from fillbass.wire import negotiate_encoding
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    (None, None),
+    ("", None),
+    ("identity", None),
+    ("br, deflate", "deflate"),
+    ("gzip, deflate", "gzip"),
+    ("deflate, gzip", "gzip"),
+    ("gzip;q=0.5, deflate", "deflate"),
+    ("GZIP ; Q=0.8, deflate;q=0.9", "deflate"),
+    ("gzip;q=0, deflate;q=0", None),
+    ("gzip;q=0", None),
+    ("gzip;q=0.0, deflate;q=0.1", "deflate"),
+    ("gzip;q=bad", None),
+    ("*", "gzip"),
+    ("*;q=0.5, gzip;q=0", "deflate"),
+    ("*;q=0", None),
+])
+def test_negotiate_encoding_honours_q_values(accept_encoding, expected):
+    assert negotiate_encoding(accept_encoding) == expected